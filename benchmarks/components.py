@@ -0,0 +1,220 @@
+"""
+Microbenchmarks of the tracking and transport hot paths, each measured over
+a range of object counts.
+
+    python -m benchmarks.components --output results.json
+    python -m benchmarks.components --compare results.json
+"""
+import itertools
+import json
+import logging
+from typing import Callable, Dict, List
+
+from benchmarks.harness import Case, compare, environment, measure, summarize
+from benchmarks.scenarios import walking
+
+from circum.utils.encoding import Frame, decode, encode_bson, encode_packed
+from circum.utils.math import PoseTransform, transform_positions
+from circum.utils.state.kalman.bank import EKFBank
+from circum.utils.state.kalman.ekf import EKF
+from circum.utils.state.kalman_tracker import KalmanTracker, _ekf_params
+from circum.utils.state.simple_tracker import SimpleTracker
+from circum.utils.state.tracking import ObjectTracker, TrackedObject
+
+import click
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+default_sizes = (1, 10, 100, 1000)
+pose = [1, 2, 3, 10, 20, 30]
+
+
+def _detections(n: int,
+                step: int = 0) -> List[TrackedObject]:
+    timestamp, positions = walking(n, step + 1)[step]
+    return [TrackedObject(pos, timestamp) for pos in positions]
+
+
+def _transform_positions(n: int) -> Case:
+    positions = np.ones((4, n))
+    positions[:3] = walking(n, 1)[0][1].T
+    return Case(lambda: transform_positions(positions, pose))
+
+
+def _pose_transform(n: int) -> Case:
+    transform = PoseTransform(pose)
+    positions = walking(n, 1)[0][1]
+    return Case(lambda: transform.apply(positions))
+
+
+def _associate(n: int) -> Case:
+    tracker = KalmanTracker(clock=lambda: 0)
+    tracker.update(_detections(n), 0)
+    detections = _detections(n, 1)
+    return Case(lambda: tracker._associate(detections))
+
+
+def _ekf(n: int) -> Case:
+    filters = [EKF(_ekf_params()) for _ in range(n)]
+    positions = walking(n, 2)[1][1]
+    for kf, pos in zip(filters, positions):
+        kf.start(pos, 0)
+    clock = itertools.count(1)
+
+    def _run():
+        timestamp = next(clock) * .1
+        for kf, pos in zip(filters, positions):
+            kf.predict(timestamp)
+            kf.update(pos, timestamp)
+
+    return Case(_run)
+
+
+def _ekf_bank(n: int) -> Case:
+    bank = EKFBank(_ekf_params(), n)
+    positions = walking(n, 2)[1][1]
+    slots = np.array([bank.start(pos, 0) for pos in positions])
+    clock = itertools.count(1)
+
+    def _run():
+        timestamp = next(clock) * .1
+        bank.predict(timestamp, slots)
+        bank.update(slots, positions, timestamp)
+
+    return Case(_run)
+
+
+def _simple_track(n: int) -> Case:
+    tracker = SimpleTracker(clock=lambda: 0)
+    tracker.update(_detections(n), 0)
+    detections = _detections(n, 1)
+    return Case(lambda: tracker._track(detections))
+
+
+def _prune(n: int) -> Case:
+    now = [0]
+    detections = _detections(n)
+
+    def _setup() -> ObjectTracker:
+        now[0] = 0
+        tracker = ObjectTracker(clock=lambda: now[0])
+        tracker.update(detections, 0)
+        # every track has expired
+        now[0] = 100
+        return tracker
+
+    return Case(lambda tracker: tracker._prune(), _setup)
+
+
+def _frame(n: int) -> Frame:
+    return Frame(walking(n, 1)[0][1], np.arange(n), timestamp=1)
+
+
+def _bson_encode(n: int) -> Case:
+    frame = _frame(n)
+    return Case(lambda: encode_bson(frame))
+
+
+def _bson_decode(n: int) -> Case:
+    payload = encode_bson(_frame(n))
+    return Case(lambda: decode(payload))
+
+
+def _packed_encode(n: int) -> Case:
+    frame = _frame(n)
+    return Case(lambda: encode_packed(frame))
+
+
+def _packed_decode(n: int) -> Case:
+    payload = encode_packed(_frame(n))
+    return Case(lambda: decode(payload))
+
+
+benchmarks: Dict[str, Callable[[int], Case]] = {
+    "transform_positions": _transform_positions,
+    "PoseTransform.apply": _pose_transform,
+    "KalmanTracker._associate": _associate,
+    "EKF.predict_update": _ekf,
+    "EKFBank.predict_update": _ekf_bank,
+    "SimpleTracker._track": _simple_track,
+    "ObjectTracker._prune": _prune,
+    "encode_bson": _bson_encode,
+    "decode_bson": _bson_decode,
+    "encode_packed": _packed_encode,
+    "decode_packed": _packed_decode,
+}
+
+
+def run(names: List[str] = None,
+        sizes: List[int] = default_sizes,
+        min_time: float = .2) -> List[Dict]:
+    results = []
+    for name in benchmarks if names is None else names:
+        for n in sizes:
+            result = dict(name=name, n=n, **summarize(measure(benchmarks[name](n), min_time)))
+            logger.info("{name:<26} n={n:<5} {ops_per_sec:>12.1f} ops/s  p50 {p50_us:>10.1f}us  "
+                        "p99 {p99_us:>10.1f}us".format(**result))
+            results.append(result)
+    return results
+
+
+@click.command()
+@click.option('--benchmark',
+              '-b',
+              multiple=True,
+              type=click.Choice(list(benchmarks)),
+              help='The benchmarks to run. Can be specified multiple times. Defaults to all of them.')
+@click.option('--sizes',
+              required=False,
+              default=",".join(str(n) for n in default_sizes),
+              help='Comma separated object counts to run every benchmark with. Defaults to 1,10,100,1000.')
+@click.option('--min-time',
+              required=False,
+              default=.2,
+              type=float,
+              help='The minimum time, in seconds, to run each benchmark for. Defaults to 0.2.')
+@click.option('--output',
+              '-o',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Write the results as JSON to this file.')
+@click.option('--compare',
+              'baseline',
+              required=False,
+              default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help='Compare the results with an earlier JSON output and exit with an error when any benchmark ' +
+                   'got slower than the tolerance.')
+@click.option('--tolerance',
+              required=False,
+              default=.25,
+              type=float,
+              help='How much slower, as a fraction of the baseline median, a benchmark may get. Defaults to 0.25.')
+def cli(benchmark: List[str],
+        sizes: str,
+        min_time: float,
+        output: str,
+        baseline: str,
+        tolerance: float):
+    logging.basicConfig(level="INFO", format="%(message)s")
+    results = run(list(benchmark) or None, [int(n) for n in sizes.split(",")], min_time)
+    report = {"environment": environment(), "results": results}
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["results"], tolerance)
+        for regression in regressions:
+            logger.error("{name} n={n} is {ratio:.2f}x slower than the baseline".format(**regression))
+        if len(regressions) > 0:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
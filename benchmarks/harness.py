@@ -0,0 +1,84 @@
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class Case(NamedTuple):
+    """
+    A benchmarked operation. run is timed, setup is called before every run
+    outside of the timing and its result is passed to run, for operations
+    that consume their input.
+    """
+    run: Callable[..., Any]
+    setup: Optional[Callable[[], Any]] = None
+
+
+def measure(case: Case,
+            min_time: float = .2,
+            min_iterations: int = 5,
+            max_iterations: int = 10000,
+            warmup: int = 2) -> np.ndarray:
+    """
+    Runs case until it has run for min_time seconds and at least
+    min_iterations times, and returns the duration of every run in seconds.
+    """
+    def _once() -> float:
+        args = () if case.setup is None else (case.setup(),)
+        start = time.perf_counter()
+        case.run(*args)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        _once()
+    samples = []
+    total = 0
+    while len(samples) < max_iterations and (total < min_time or len(samples) < min_iterations):
+        samples.append(_once())
+        total += samples[-1]
+    return np.array(samples)
+
+
+def summarize(samples: np.ndarray) -> Dict[str, float]:
+    """
+    The throughput and latency percentiles, in microseconds, of a run.
+    """
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1e6
+    return {
+        "iterations": len(samples),
+        "ops_per_sec": float(len(samples) / samples.sum()),
+        "mean_us": float(samples.mean() * 1e6),
+        "p50_us": float(p50),
+        "p90_us": float(p90),
+        "p99_us": float(p99),
+    }
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(results: List[Dict],
+            baseline: List[Dict],
+            tolerance: float = .25) -> List[Dict]:
+    """
+    The results whose median latency is more than tolerance slower than the
+    result of the same benchmark and size in baseline, with the ratio added.
+    """
+    previous = {(result["name"], result["n"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result["name"], result["n"]))
+        if base is None or base["p50_us"] <= 0:
+            continue
+        ratio = result["p50_us"] / base["p50_us"]
+        if ratio > 1 + tolerance:
+            regressions.append(dict(result, ratio=ratio))
+    return regressions
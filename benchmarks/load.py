@@ -0,0 +1,288 @@
+"""
+Load tests a service end to end over loopback TCP. Synthetic endpoints run
+the real endpoint server with a sensor that streams walking objects, a real
+service connects to them without discovery, and measuring clients report the
+throughput, the latency from capture to delivery and the updates they missed.
+
+    python -m benchmarks.load --endpoints 8 --objects 20 --rate 30 --clients 4
+"""
+import json
+import logging
+import math
+import multiprocessing
+import select
+import socket
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, Iterator, List, Tuple
+
+from benchmarks.harness import environment
+
+from circum import endpoint, service
+from circum.pose.static import StaticPoseProvider
+from circum.utils.broadcast import CONFLATE, policies
+from circum.utils.encoding import PACKED, decode, format_request, formats
+from circum.utils.network import FrameReader, StaticListener, frame
+
+import click
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# endpoints cover separate areas so that their objects are never fused
+endpoint_spacing = 1000
+
+
+def _sensor(index: int,
+            num_objects: int,
+            rate: float,
+            sent) -> Iterator[Dict]:
+    """
+    Yields the tracking info of num_objects objects walking in circles, rate
+    times a second.
+    """
+    rng = np.random.default_rng(index)
+    centers = rng.uniform(0, 50, (num_objects, 3)) + [index * endpoint_spacing, 0, 0]
+    centers[:, 1] = 0
+    phases = rng.uniform(0, 2 * math.pi, num_objects)
+    due = time.time()
+    while True:
+        due += 1 / rate
+        time.sleep(max(0, due - time.time()))
+        angles = phases + due * 1.4 / 5
+        positions = centers + np.stack((5 * np.cos(angles), np.zeros(num_objects), 5 * np.sin(angles)), axis=1)
+        with sent.get_lock():
+            sent.value += 1
+        yield {"objects": [{"x": pos[0], "y": pos[1], "z": pos[2]} for pos in positions.tolist()]}
+
+
+def _run_endpoints(connection,
+                   indexes: List[int],
+                   num_objects: int,
+                   rate: float,
+                   sent,
+                   policy: str):
+    ports = []
+    for index in indexes:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        ports.append(server.getsockname()[1])
+        threading.Thread(target=endpoint._run_server,
+                         args=([server], _sensor(index, num_objects, rate, sent), StaticPoseProvider(), {}, policy),
+                         daemon=True).start()
+    connection.send(ports)
+    # the endpoints run until the process is terminated
+    threading.Event().wait()
+
+
+def _run_service(connection,
+                 endpoints: Dict[str, tuple],
+                 engine: str,
+                 tick_hz: float,
+                 fmt: str,
+                 policy: str):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    connection.send(server.getsockname()[1])
+    service._serve([server], StaticListener(endpoints, fmt), engine, tick_hz=tick_hz, policy=policy)
+
+
+def _run_clients(connection,
+                 port: int,
+                 num_clients: int,
+                 fmt: str,
+                 start: float,
+                 end: float):
+    clients = []
+    for _ in range(num_clients):
+        client = socket.create_connection(("127.0.0.1", port))
+        client.sendall(frame(format_request(fmt)))
+        clients.append(client)
+    readers = {client: FrameReader(client) for client in clients}
+    latencies = []
+    objects = 0
+    received = {client: 0 for client in clients}
+    dropped = {client: 0 for client in clients}
+    last_seq = {}
+    seqs = []
+
+    while time.time() < end:
+        ready, _, _ = select.select(clients, [], [], max(0, end - time.time()))
+        for client in ready:
+            for payload in readers[client].read():
+                now = time.time()
+                update = decode(payload)
+                if update.timestamp < start:
+                    continue
+                latencies.append(now - update.timestamp)
+                objects += len(update.positions)
+                received[client] += 1
+                if fmt == PACKED:
+                    # only packed frames carry the sequence number of the update
+                    if client in last_seq:
+                        dropped[client] += max(0, update.seq - last_seq[client] - 1)
+                    last_seq[client] = update.seq
+                    seqs.append(update.seq)
+
+    for client in clients:
+        client.close()
+    connection.send({
+        "latencies": latencies,
+        "objects": objects,
+        "received": list(received.values()),
+        "dropped": list(dropped.values()) if fmt == PACKED else None,
+        "updates": max(seqs) - min(seqs) + 1 if len(seqs) > 0 else 0,
+    })
+
+
+def _start(target, *args) -> Tuple[multiprocessing.Process, Connection]:
+    connection, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=target, args=(child,) + args, daemon=True)
+    process.start()
+    return process, connection
+
+
+def run_load(num_endpoints: int = 4,
+             num_objects: int = 10,
+             rate: float = 30,
+             num_clients: int = 2,
+             duration: float = 10,
+             warmup: float = 1,
+             engine: str = "select",
+             tick_hz: float = 0,
+             fmt: str = PACKED,
+             policy: str = CONFLATE,
+             endpoint_processes: int = None) -> Dict:
+    """
+    Runs a load test and returns its report. Frames captured during the
+    first warmup seconds are not measured.
+    """
+    endpoint_processes = min(num_endpoints, endpoint_processes or multiprocessing.cpu_count())
+    sent = multiprocessing.Value("l", 0)
+    processes = []
+    try:
+        endpoints = {}
+        for worker in range(endpoint_processes):
+            indexes = list(range(worker, num_endpoints, endpoint_processes))
+            process, connection = _start(_run_endpoints, indexes, num_objects, rate, sent, policy)
+            processes.append(process)
+            for index, port in zip(indexes, connection.recv()):
+                endpoints["endpoint{}".format(index)] = ("127.0.0.1", port)
+
+        process, connection = _start(_run_service, endpoints, engine, tick_hz, fmt, policy)
+        processes.append(process)
+        port = connection.recv()
+
+        start = time.time() + warmup
+        end = start + duration
+        process, connection = _start(_run_clients, port, num_clients, fmt, start, end)
+        processes.append(process)
+        time.sleep(max(0, start - time.time()))
+        sent_start = sent.value
+        results = connection.recv()
+        sent_end = sent.value
+    finally:
+        for process in processes:
+            process.terminate()
+
+    latencies = np.array(results["latencies"]) * 1e3
+    received = sum(results["received"])
+    p50, p90, p99, worst = np.percentile(latencies, [50, 90, 99, 100]) if len(latencies) > 0 else [math.nan] * 4
+    return {
+        "environment": environment(),
+        "config": {
+            "endpoints": num_endpoints,
+            "objects": num_objects,
+            "rate": rate,
+            "clients": num_clients,
+            "duration": duration,
+            "engine": engine,
+            "tick_hz": tick_hz,
+            "format": fmt,
+            "policy": policy,
+        },
+        "endpoint_frames_per_sec": (sent_end - sent_start) / duration,
+        "updates_per_sec": results["updates"] / duration,
+        "client_frames_per_sec": received / num_clients / duration,
+        "client_objects_per_sec": results["objects"] / num_clients / duration,
+        "dropped": None if results["dropped"] is None else sum(results["dropped"]),
+        "latency_ms": {"p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(worst)},
+    }
+
+
+@click.command()
+@click.option('--endpoints',
+              '-n',
+              'num_endpoints',
+              default=4,
+              type=int,
+              help='The number of synthetic endpoints. Defaults to 4.')
+@click.option('--objects',
+              '-m',
+              'num_objects',
+              default=10,
+              type=int,
+              help='The number of objects each endpoint reports. Defaults to 10.')
+@click.option('--rate',
+              default=30,
+              type=float,
+              help='The frames per second each endpoint sends. Defaults to 30.')
+@click.option('--clients',
+              '-k',
+              'num_clients',
+              default=2,
+              type=int,
+              help='The number of measuring clients. Defaults to 2.')
+@click.option('--duration',
+              default=10,
+              type=float,
+              help='How long to measure for, in seconds. Defaults to 10.')
+@click.option('--warmup',
+              default=1,
+              type=float,
+              help='How long to run before measuring, in seconds. Defaults to 1.')
+@click.option('--engine',
+              default="select",
+              type=click.Choice(["select", "asyncio"]),
+              help='The networking engine to run the service on. Defaults to select.')
+@click.option('--tick-hz',
+              default=0,
+              type=float,
+              help='Run the service tracker at a fixed rate. Defaults to 0, which tracks every frame.')
+@click.option('--format',
+              'fmt',
+              default=PACKED,
+              type=click.Choice(formats),
+              help='The frame format used between the processes. Dropped updates can only be counted with packed ' +
+                   'frames. Defaults to packed.')
+@click.option('--slow-client-policy',
+              'policy',
+              default=CONFLATE,
+              type=click.Choice(policies),
+              help='The slow client policy of the service and the endpoints. Defaults to conflate.')
+@click.option('--endpoint-processes',
+              default=None,
+              type=int,
+              help='The number of processes the endpoints are spread over. Defaults to the number of CPUs.')
+@click.option('--output',
+              '-o',
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Write the report as JSON to this file.')
+def cli(output: str,
+        **kwargs):
+    logging.basicConfig(level="INFO", format="%(message)s")
+    report = run_load(**kwargs)
+    logger.info(json.dumps(report, indent=2))
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,45 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+def crowd(num_objects: int,
+          seed: int = 0,
+          density: float = 1) -> np.ndarray:
+    """
+    The positions of num_objects people standing on the ground plane, spread
+    over a square holding density people per square meter on average.
+    """
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(max(num_objects, 1) / density)
+    positions = np.zeros((num_objects, 3))
+    positions[:, [0, 2]] = rng.uniform(0, side, (num_objects, 2))
+    return positions
+
+
+def walking(num_objects: int,
+            steps: int,
+            interval: float = .1,
+            speed: float = 1.4,
+            noise: float = .02,
+            seed: int = 0,
+            density: float = 1) -> List[Tuple[float, np.ndarray]]:
+    """
+    The (timestamp, detections) of every step of a crowd walking in straight
+    lines at speed meters per second, detected every interval seconds with
+    gaussian noise. Detections are shuffled so their order says nothing about
+    their identity.
+    """
+    rng = np.random.default_rng(seed)
+    positions = crowd(num_objects, seed, density)
+    headings = rng.uniform(0, 2 * np.pi, num_objects)
+    velocities = np.zeros((num_objects, 3))
+    velocities[:, 0] = speed * np.cos(headings)
+    velocities[:, 2] = speed * np.sin(headings)
+
+    frames = []
+    for step in range(steps):
+        detections = positions + velocities * step * interval + rng.normal(0, noise, positions.shape)
+        detections[:, 1] = 0
+        frames.append((step * interval, detections[rng.permutation(num_objects)]))
+    return frames
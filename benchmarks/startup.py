@@ -0,0 +1,107 @@
+"""
+Measures how long the circum commands take to start, each in a fresh
+interpreter, which matters on small sensor nodes that restart often.
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --compare startup.json
+"""
+import json
+import logging
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.harness import compare, environment, summarize
+
+import click
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+commands = {
+    "import circum.endpoint": ["-c", "import circum.endpoint"],
+    "import circum.service": ["-c", "import circum.service"],
+    "circum-endpoint --help": ["-m", "circum.endpoint", "--help"],
+    "circum --help": ["-m", "circum.service", "--help"],
+}
+
+
+def measure_startup(args: List[str],
+                    repeat: int = 10) -> np.ndarray:
+    """
+    Runs python with args repeat times and returns the wall time of every
+    run in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)  # noqa: S603
+        samples.append(time.perf_counter() - start)
+    return np.array(samples)
+
+
+def run(names: List[str] = None,
+        repeat: int = 10) -> List[Dict]:
+    results = []
+    for name in commands if names is None else names:
+        result = dict(name=name, n=1, **summarize(measure_startup(commands[name], repeat)))
+        logger.info("{name:<24} p50 {p50_ms:>8.1f}ms  p90 {p90_ms:>8.1f}ms".format(
+            p50_ms=result["p50_us"] / 1e3, p90_ms=result["p90_us"] / 1e3, **result))
+        results.append(result)
+    return results
+
+
+@click.command()
+@click.option('--command',
+              '-c',
+              multiple=True,
+              type=click.Choice(list(commands)),
+              help='The commands to time. Can be specified multiple times. Defaults to all of them.')
+@click.option('--repeat',
+              required=False,
+              default=10,
+              type=int,
+              help='How many times to start each command. Defaults to 10.')
+@click.option('--output',
+              '-o',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Write the results as JSON to this file.')
+@click.option('--compare',
+              'baseline',
+              required=False,
+              default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help='Compare the results with an earlier JSON output and exit with an error when any command got ' +
+                   'slower than the tolerance.')
+@click.option('--tolerance',
+              required=False,
+              default=.25,
+              type=float,
+              help='How much slower, as a fraction of the baseline median, a command may get. Defaults to 0.25.')
+def cli(command: List[str],
+        repeat: int,
+        output: str,
+        baseline: str,
+        tolerance: float):
+    logging.basicConfig(level="INFO", format="%(message)s")
+    results = run(list(command) or None, repeat)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["results"], tolerance)
+        for regression in regressions:
+            logger.error("{name} is {ratio:.2f}x slower than the baseline".format(**regression))
+        if len(regressions) > 0:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
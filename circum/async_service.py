@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import socket
+import struct
+import time
+from typing import Callable, List, Set
+
+from circum.utils import metrics, profiling
+from circum.utils.capture import CaptureWriter
+from circum.utils.encoding import BSON, Frame, PACKED, decode, parse_format_request
+from circum.utils.network import ServiceListener, _set_keepalive, size_data_len, size_fmt
+from circum.utils.scheduling import UpdateScheduler
+from circum.utils.tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+discovery_interval = 1
+_decode_seconds = metrics.registry.histogram("circum_stage_seconds", stage="decode")
+_publish_seconds = metrics.registry.histogram("circum_stage_seconds", stage="publish")
+
+
+class _AsyncClient:
+    """
+    A connected client with a bounded queue of frames waiting to be written.
+    When the queue is full the oldest frame is dropped so that a slow client
+    never holds up ingestion or the other clients.
+    """
+
+    def __init__(self,
+                 writer: asyncio.StreamWriter,
+                 queue_size: int):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.format = BSON
+        self.task = None
+
+    def send(self, data: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            logger.debug("client queue full, dropped a frame ({} total)".format(self.dropped))
+        self.queue.put_nowait(data)
+
+    async def run(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            logger.debug("transmit failure", exc_info=True)
+        finally:
+            self.writer.close()
+
+    async def read_requests(self,
+                            reader: asyncio.StreamReader):
+        try:
+            while True:
+                payload = await _read_frame(reader)
+                fmt = parse_format_request(payload)
+                if fmt is not None:
+                    logger.debug("client requested {} frames".format(fmt))
+                    self.format = fmt
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            logger.debug("client disconnected", exc_info=True)
+        finally:
+            self.task.cancel()
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    size_data = await reader.readexactly(size_data_len)
+    size = struct.unpack(size_fmt, size_data)[0]
+    return await reader.readexactly(size)
+
+
+async def _read_endpoint(endpoint_socket: socket.socket,
+                         scheduler: UpdateScheduler,
+                         updated: asyncio.Event,
+                         source: str = None,
+                         recorder: CaptureWriter = None):
+    reader, writer = await asyncio.open_connection(sock=endpoint_socket)
+    received = metrics.registry.counter("circum_frames_received_total", "Frames received from each endpoint.",
+                                        source=source)
+    try:
+        while True:
+            data = await _read_frame(reader)
+            received.inc()
+            if recorder is not None:
+                recorder.inbound(source, data)
+            with _decode_seconds.time():
+                update = decode(data)
+            scheduler.on_frame(endpoint_socket, update._replace(source=source, received=time.time()))
+            updated.set()
+    finally:
+        writer.close()
+        scheduler.remove(endpoint_socket)
+
+
+async def _run_tracker(track: Callable[[List[Frame]], Callable[[str], bytes]],
+                       scheduler: UpdateScheduler,
+                       updated: asyncio.Event,
+                       clients: Set[_AsyncClient],
+                       recorder: CaptureWriter = None):
+    while True:
+        # frames that arrive while a step is running are coalesced into the next step
+        try:
+            await asyncio.wait_for(updated.wait(), scheduler.timeout())
+        except asyncio.TimeoutError:
+            pass
+        updated.clear()
+        if not scheduler.ready():
+            continue
+        with profiling.watchdog.iteration("update"):
+            encoder = None
+            tracked = []
+            for frames in scheduler.batches():
+                encoder = track(frames)
+                tracked.append((frames, time.time()))
+            if encoder is None:
+                continue
+            if recorder is not None:
+                recorder.outbound(memoryview(encoder(PACKED))[size_data_len:])
+            with _publish_seconds.time():
+                for client in clients:
+                    client.send(encoder(client.format))
+            tracer.record_updates(tracked, time.time())
+
+
+async def _run_service_async(server_sockets: List[socket.socket],
+                             listener: ServiceListener,
+                             scheduler: UpdateScheduler,
+                             track: Callable[[List[Frame]], Callable[[str], bytes]],
+                             queue_size: int = 4,
+                             recorder: CaptureWriter = None):
+    """
+    Runs the service until cancelled. track runs a tracker step on the latest
+    frames and returns a function that encodes the result in a given format.
+    Frames are recorded with recorder when one is given.
+    """
+    clients = set()
+    updated = asyncio.Event()
+    readers = {}
+    dropped = [0]
+    metrics.watch_scheduler(scheduler)
+    metrics.registry.gauge("circum_clients", "Connected clients.", clients.__len__)
+    metrics.registry.counter("circum_client_frames_dropped_total",
+                             "Frames that were not sent to a client that was behind.",
+                             lambda: dropped[0] + sum(client.dropped for client in clients))
+
+    async def _serve_client(reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+        _set_keepalive(writer.get_extra_info("socket"))
+        client = _AsyncClient(writer, queue_size)
+        clients.add(client)
+        client.task = asyncio.ensure_future(client.run())
+        requests = asyncio.ensure_future(client.read_requests(reader))
+        try:
+            await client.task
+        finally:
+            requests.cancel()
+            clients.discard(client)
+            dropped[0] += client.dropped
+
+    servers = [await asyncio.start_server(_serve_client, sock=server_socket) for server_socket in server_sockets]
+    tracker = asyncio.ensure_future(_run_tracker(track, scheduler, updated, clients, recorder))
+
+    try:
+        while True:
+            if tracker.done():
+                # surface any exception raised by the tracker step
+                tracker.result()
+
+            endpoint_sockets = listener.get_sockets()
+            for endpoint_socket in endpoint_sockets:
+                if endpoint_socket not in readers:
+                    readers[endpoint_socket] = asyncio.ensure_future(
+                        _read_endpoint(endpoint_socket, scheduler, updated, listener.name(endpoint_socket), recorder))
+
+            for endpoint_socket, task in list(readers.items()):
+                if task.done():
+                    readers.pop(endpoint_socket)
+                    if not task.cancelled() and task.exception() is not None:
+                        logger.debug("endpoint disconnected", exc_info=task.exception())
+                    listener.remove(endpoint_socket)
+                elif endpoint_socket not in endpoint_sockets:
+                    readers.pop(endpoint_socket)
+                    task.cancel()
+
+            await asyncio.sleep(discovery_interval)
+    finally:
+        tracker.cancel()
+        for task in readers.values():
+            task.cancel()
+        for client in clients:
+            client.task.cancel()
+        for server in servers:
+            server.close()
@@ -2,35 +2,50 @@
 
 import logging
 import socket
-import struct
+import time
 import uuid
 from select import select
-from threading import Semaphore, Thread
-from typing import Callable, Dict, List
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, List, Union
 
 import bson
 
 from circum.pose.provider import PoseProvider
-from circum.utils.math import transform_positions
-from circum.utils.network import _advertise_server, _get_interface_ip, _open_server, _set_keepalive
+from circum.sensors.feed import SensorFeed
+from circum.utils import metrics, profiling
+from circum.utils.broadcast import Broadcaster, CONFLATE, policies
+from circum.utils.encoding import Frame, PACKED, advertise_formats, encode_packed, parse_format_request
+from circum.utils.math import PoseTransform
+from circum.utils.network import FrameReader, _advertise_server, _get_interface_ip, _open_server, _set_keepalive, frame
 
 import click
 
 import numpy as np
 
-import pkg_resources
+try:
+    from importlib.metadata import EntryPoint, entry_points
+except ImportError:
+    # python < 3.8
+    from importlib_metadata import EntryPoint, entry_points
 
 
 logger = logging.getLogger(__name__)
-circum_sensors = []
-circum_pose_providers = []
+pose_provider_group = "circum.pose_providers"
+sensor_group = "circum.sensors"
+# how long to wait before polling a sensor function again after it had nothing new
+poll_interval = .01
 
+_transform_seconds = metrics.registry.histogram("circum_stage_seconds", "Time spent in each processing stage.",
+                                                stage="transform")
+_encode_seconds = metrics.registry.histogram("circum_stage_seconds", stage="encode")
+_publish_seconds = metrics.registry.histogram("circum_stage_seconds", stage="publish")
+_sent = metrics.registry.counter("circum_frames_sent_total", "Frames the sensor reported and the endpoint published.")
 
-def _transform_tracks(tracking_info: Dict[str, float], pose: List[float]):
+
+def _transform_tracks(tracking_info: Dict[str, float], transform: PoseTransform):
     if tracking_info and len(tracking_info["objects"]) > 0:
-        positions = np.array(
-            [[float(obj["x"]), float(obj["y"]), float(obj["z"]), 1] for obj in tracking_info["objects"]]).T
-        positions = transform_positions(positions, pose).T
+        positions = transform.apply(
+            [[float(obj["x"]), float(obj["y"]), float(obj["z"])] for obj in tracking_info["objects"]])
 
         for obj, pos in zip(tracking_info["objects"], positions):
             obj["x"] = pos[0]
@@ -40,59 +55,124 @@ def _transform_tracks(tracking_info: Dict[str, float], pose: List[float]):
     return tracking_info
 
 
-def _endpoint_thread(endpoint_func: Callable,
-                     clients: List[socket.socket],
-                     semaphore: Semaphore,
-                     pose: PoseProvider,
-                     tracker_args: Dict):
+def _encode_tracks(tracking_info: Dict,
+                   fmt: str,
+                   seq: int) -> bytes:
+    # frames are stamped with the time they were sent so that the service can tell how long they took to arrive
+    if fmt == PACKED:
+        positions = [[obj["x"], obj["y"], obj["z"]] for obj in tracking_info["objects"]]
+        return frame(encode_packed(Frame(np.array(positions, dtype=float).reshape(-1, 3), seq=seq,
+                                         timestamp=tracking_info["timestamp"], sent=time.time())))
+    # BSON frames carry everything the sensor reported
+    return frame(bson.dumps(dict(tracking_info, seq=seq, sent=time.time())))
+
+
+def _encoder(tracking_info: Dict,
+             seq: int) -> Callable[[str], bytes]:
+    def _encode(fmt: str) -> bytes:
+        with _encode_seconds.time():
+            return _encode_tracks(tracking_info, fmt, seq)
+
+    return _encode
+
+
+def _poll(endpoint_func: Callable[[Dict], Dict],
+          tracker_args: Dict) -> Iterator[Dict]:
+    """
+    Adapts a sensor function that is polled for new tracking info and returns
+    None when there is nothing new.
+    """
     while True:
-        # update tracking info
-        tracking_info = _transform_tracks(tracking_info=endpoint_func(tracker_args), pose=pose.get_pose())
-        if tracking_info is not None:
-            bson_data = bson.dumps(tracking_info)
-            size = len(bson_data)
-            size_data = struct.pack("!i", size)
-            data = size_data + bson_data
+        tracking_info = endpoint_func(tracker_args)
+        if tracking_info is None:
+            time.sleep(poll_interval)
+        else:
+            yield tracking_info
+
+
+def _sensor_updates(sensor: Union[Iterable[Dict], Callable[[Dict], Dict]],
+                    tracker_args: Dict) -> Iterable[Dict]:
+    if callable(sensor):
+        return _poll(sensor, tracker_args)
+    return sensor
 
-            # update clients
-            semaphore.acquire()
-            to_remove = []
-            for client in clients:
-                try:
-                    client.sendall(data)
-                except Exception:
-                    logger.debug("transmit failure", exc_info=True)
-                    to_remove.append(client)
 
-            for sock in to_remove:
-                clients.remove(sock)
-            semaphore.release()
+def _endpoint_thread(sensor: Union[Iterable[Dict], Callable[[Dict], Dict]],
+                     broadcaster: Broadcaster,
+                     pose: PoseProvider,
+                     tracker_args: Dict):
+    seq = 0
+    if isinstance(sensor, SensorFeed):
+        metrics.registry.counter("circum_sensor_updates_replaced_total",
+                                 "Sensor updates replaced by a newer one before the endpoint took them.",
+                                 lambda: sensor.replaced)
+    transform = PoseTransform(pose.get_pose())
+    revision = pose.revision
+    # blocks until the sensor has new tracking info
+    for tracking_info in _sensor_updates(sensor, tracker_args):
+        with profiling.watchdog.iteration("endpoint"):
+            if pose.revision != revision:
+                revision = pose.revision
+                transform.set_pose(pose.get_pose())
+            with _transform_seconds.time():
+                tracking_info = _transform_tracks(tracking_info=tracking_info, transform=transform)
+            # sensors that know when their data was captured can report it, otherwise it is the time it was received
+            tracking_info.setdefault("timestamp", time.time())
+            # update clients
+            with _publish_seconds.time():
+                broadcaster.publish(_encoder(tracking_info, seq))
+            _sent.inc()
+            seq += 1
 
 
 def _run_server(server_sockets: List[socket.socket],
                 reader,
                 pose: PoseProvider,
-                tracker_args: Dict):
-    semaphore = Semaphore()
-    clients = []
+                tracker_args: Dict,
+                policy: str = CONFLATE):
+    broadcaster = Broadcaster(policy)
+    readers = {}
+    metrics.watch_broadcaster(broadcaster)
 
     # TODO: connect to pose provider service
 
     # start sensor thread
-    tracker_thread = Thread(target=_endpoint_thread, args=(reader, clients, semaphore, pose, tracker_args))
+    tracker_thread = Thread(target=_endpoint_thread, args=(reader, broadcaster, pose, tracker_args))
     tracker_thread.daemon = True
     tracker_thread.start()
 
-    # listen for connections
+    # listen for connections and format requests, finish sending frames that did not fit in the socket buffers
     while True:
-        ready, _, _ = select(server_sockets, [], [], 1)
-        for server_socket in ready:
-            conn, addr = server_socket.accept()
-            logger.debug("client connected: {}".format(addr))
-            _set_keepalive(conn)
-            semaphore.acquire()
-            clients.append(conn)
-            semaphore.release()
+        client_sockets = broadcaster.sockets()
+        for removed_client in set(readers.keys()) - set(client_sockets):
+            readers.pop(removed_client)
+
+        ready, writable, _ = select(server_sockets + client_sockets + [broadcaster.waker],
+                                    broadcaster.pending_sockets(), [], 1)
+        for ready_socket in ready:
+            if ready_socket is broadcaster.waker:
+                broadcaster.clear_wakeup()
+            elif ready_socket in server_sockets:
+                conn, addr = ready_socket.accept()
+                logger.debug("client connected: {}".format(addr))
+                _set_keepalive(conn)
+                readers[conn] = FrameReader(conn)
+                broadcaster.add(conn)
+            elif ready_socket in readers:
+                try:
+                    for payload in readers[ready_socket].read():
+                        fmt = parse_format_request(payload)
+                        if fmt is not None:
+                            logger.debug("client requested {} frames".format(fmt))
+                            broadcaster.set_format(ready_socket, fmt)
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    logger.debug("client disconnected", exc_info=True)
+                    readers.pop(ready_socket)
+                    broadcaster.remove(ready_socket)
+        if len(writable) > 0:
+            broadcaster.flush()
 
 
 def _start_endpoint(name: str,
@@ -101,20 +181,22 @@ def _start_endpoint(name: str,
                     pose: PoseProvider,
                     tracker_type: str,
                     tracker,
-                    tracker_args):
+                    tracker_args,
+                    policy: str = CONFLATE):
 
     ips = _get_interface_ip(interface)
 
     logger.debug("opening server on ({},{})".format(ips, port))
     server_sockets, ips = _open_server(ips, port)
 
-    zeroconf, infos = _advertise_server(name, "endpoint", ips, port, {"type": tracker_type})
+    zeroconf, infos = _advertise_server(name, "endpoint", ips, port, dict(type=tracker_type, **advertise_formats()))
 
     try:
         _run_server(server_sockets=server_sockets,
                     reader=tracker,
                     pose=pose,
-                    tracker_args=tracker_args)
+                    tracker_args=tracker_args,
+                    policy=policy)
     except Exception:
         logging.error("Exception while running server", exc_info=True)
     finally:
@@ -127,6 +209,11 @@ def start_endpoint(ctx,
                    tracker_type: str,
                    tracker,
                    tracker_args=None):
+    """
+    Runs the endpoint for a sensor. tracker is either an iterable of tracking
+    info, such as a SensorFeed the sensor pushes to, or a function that is
+    polled with tracker_args and returns None when there is nothing new.
+    """
     if "pose_provider" not in ctx.obj:
         logger.error("No pose provider specified, please specify a pose provider before the sensor command.")
         exit(1)
@@ -136,13 +223,71 @@ def start_endpoint(ctx,
                     ctx.obj["pose_provider"],
                     tracker_type,
                     tracker,
-                    tracker_args)
+                    tracker_args,
+                    ctx.obj["slow_client_policy"])
+
+
+def _entry_points(group: str) -> Dict[str, EntryPoint]:
+    """
+    The entry points of group by the name of the command they provide, read
+    from the package metadata without importing them.
+    """
+    found = entry_points()
+    selected = found.select(group=group) if hasattr(found, "select") else found.get(group, [])
+    # click names commands after their function with underscores replaced by dashes
+    return {entry_point.name.replace("_", "-"): entry_point for entry_point in selected}
+
+
+class _PluginGroup(click.Group):
+    """
+    A group that also offers the pose providers and sensors installed as
+    plugins, but only imports the ones that are invoked, so that starting an
+    endpoint does not import every installed sensor SDK.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._plugins = None
+
+    def plugins(self, group: str = None) -> Dict[str, EntryPoint]:
+        if self._plugins is None:
+            self._plugins = {group: _entry_points(group) for group in (pose_provider_group, sensor_group)}
+        if group is not None:
+            return self._plugins[group]
+        return {name: entry_point for plugins in self._plugins.values() for name, entry_point in plugins.items()}
+
+    def list_commands(self, ctx) -> List[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.plugins()))
+
+    def get_command(self, ctx, name: str):
+        command = super().get_command(ctx, name)
+        entry_point = self.plugins().get(name)
+        if command is not None or entry_point is None:
+            return command
+        try:
+            command = entry_point.load()
+        except Exception as e:
+            logger.warning(f"Unable to load plugin {entry_point.name}", exc_info=e)
+            return None
+        self.add_command(command, name)
+        return command
+
+    def format_commands(self, ctx, formatter):
+        # plugins that have not been loaded are listed without their help rather than imported to get it
+        rows = []
+        for name in self.list_commands(ctx):
+            command = self.commands.get(name)
+            if command is None or not command.hidden:
+                rows.append((name, "" if command is None else command.get_short_help_str()))
+        if len(rows) > 0:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
 
 
 random_default_name = uuid.uuid1()
 
 
-@click.group(chain=True)
+@click.group(cls=_PluginGroup, chain=True)
 @click.option('--name',
               required=False,
               default=str(random_default_name),
@@ -156,6 +301,40 @@ random_default_name = uuid.uuid1()
               default=8301,
               type=int,
               help='The port to bind to. Defaults to 8301')
+@click.option('--slow-client-policy',
+              required=False,
+              default=CONFLATE,
+              type=click.Choice(policies),
+              help='What to do with new frames while a client is still receiving an earlier one. ' +
+                   'conflate only sends the newest, drop discards them. Defaults to conflate.')
+@click.option('--metrics-port',
+              required=False,
+              default=0,
+              type=int,
+              help='Serve metrics in the Prometheus text format on this local port. Defaults to 0, which disables it.')
+@click.option('--metrics-interval',
+              required=False,
+              default=0,
+              type=float,
+              help='Log a summary of the metrics every this many seconds. Defaults to 0, which disables it.')
+@click.option('--profile',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Sample the stacks of all threads and write them to this file in the collapsed stack format ' +
+                   'read by flame graph tools, at exit, on SIGUSR1 and every --profile-interval seconds.')
+@click.option('--profile-interval',
+              required=False,
+              default=0,
+              type=float,
+              help='Write the profile every this many seconds. Defaults to 0, which only writes it at exit and on ' +
+                   'SIGUSR1.')
+@click.option('--stall-deadline',
+              required=False,
+              default=0,
+              type=float,
+              help='Log the stacks of all threads when a single sensor update takes longer than this many seconds. ' +
+                   'Defaults to 0, which disables it.')
 @click.option('--debug',
               is_flag=True,
               required=False,
@@ -166,6 +345,12 @@ def cli(ctx,
         name: str,
         interface: str,
         port: int,
+        slow_client_policy: str,
+        metrics_port: int,
+        metrics_interval: float,
+        profile: str,
+        profile_interval: float,
+        stall_deadline: float,
         debug: bool):
     """
     Start a circum endpoint service. To use, specify a pose provider and
@@ -177,34 +362,19 @@ def cli(ctx,
     if debug:
         logger.setLevel("DEBUG")
 
-    logger.debug(f"Loaded Pose Provider Plugins: {circum_pose_providers}")
-    logger.debug(f"Loaded Sensor Plugins: {circum_sensors}")
+    logger.debug(f"Pose Provider Plugins: {list(ctx.command.plugins(pose_provider_group))}")
+    logger.debug(f"Sensor Plugins: {list(ctx.command.plugins(sensor_group))}")
+
+    metrics.start(metrics_port, metrics_interval, logger)
+    profiling.start(profile, profile_interval, stall_deadline, log=logger)
 
     ctx.ensure_object(dict)
     ctx.obj["name"] = name
     ctx.obj["interface"] = interface
     ctx.obj["port"] = port
+    ctx.obj["slow_client_policy"] = slow_client_policy
     ctx.obj["debug"] = debug
 
 
-# register pose_providers
-for entry_point in pkg_resources.iter_entry_points('circum.pose_providers'):
-    try:
-        circum_pose_providers.append(entry_point.name)
-        cli.add_command(entry_point.load())
-    except Exception as e:
-        logger.warning(f"Unable to load pose provider {entry_point.name}", exc_info=e)
-        continue
-
-# register sensors
-for entry_point in pkg_resources.iter_entry_points('circum.sensors'):
-    try:
-        circum_sensors.append(entry_point.name)
-        cli.add_command(entry_point.load())
-    except Exception as e:
-        logger.warning(f"Unable to load sensor {entry_point.name}", exc_info=e)
-        continue
-
-
 if __name__ == "__main__":
     cli(obj={})
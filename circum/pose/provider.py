@@ -2,8 +2,19 @@ from typing import List
 
 
 class PoseProvider:
-    def __init__():
+    """
+    Provides the pose of a sensor. Endpoints only read the pose again after
+    revision has changed, so providers whose pose can change must call
+    pose_changed whenever it does.
+    """
+
+    revision = 0
+
+    def __init__(self):
         pass
 
     def get_pose(self) -> List[float]:
         pass
+
+    def pose_changed(self):
+        self.revision += 1
@@ -0,0 +1,56 @@
+from threading import Condition
+from typing import Dict, Iterator, Optional
+
+
+class SensorFeed:
+    """
+    Lets a sensor push tracking info to the endpoint as soon as it is
+    available instead of being polled. Only the newest update is kept, an
+    update pushed before the endpoint has taken the previous one replaces it.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._latest = None
+        self._closed = False
+        self.replaced = 0
+
+    def push(self,
+             tracking_info: Dict):
+        with self._condition:
+            if self._latest is not None:
+                self.replaced += 1
+            self._latest = tracking_info
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Stops the feed, get returns None once the last pushed update has been
+        taken.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get(self,
+            timeout: float = None) -> Optional[Dict]:
+        """
+        Blocks until an update is available and returns it. Returns None if
+        the timeout expires or the feed is closed first.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._latest is not None or self._closed, timeout)
+            tracking_info = self._latest
+            self._latest = None
+            return tracking_info
+
+    def __iter__(self) -> Iterator[Dict]:
+        while True:
+            tracking_info = self.get()
+            if tracking_info is None:
+                return
+            yield tracking_info
@@ -1,11 +1,10 @@
-import copy
 import logging
 import random
 import time
-from threading import Semaphore, Thread
-from typing import Dict
+from threading import Thread
 
 import circum.endpoint
+from circum.sensors.feed import SensorFeed
 
 import click
 
@@ -13,20 +12,14 @@ import numpy as np
 
 
 logger = logging.getLogger(__name__)
-tracking_semaphore = None
-tracking_info = {"objects": []}
-vector_info = []
-updated = False
 
 
-def _update_thread(update_interval: float,
+def _update_thread(feed: SensorFeed,
+                   update_interval: float,
                    num_objects: int):
-    global tracking_info
-    global vector_info
-    global updated
+    vector_info = []
 
     while True:
-        tracking_semaphore.acquire()
         if len(vector_info) == 0:
             if num_objects == 0:
                 num_objects = 1 + int(random.random() * 4)  # noqa: S311
@@ -55,34 +48,20 @@ def _update_thread(update_interval: float,
                 obj["pos"] += obj["vel"]
 
         # track
-        tracking_info["objects"] = [{"x": obj["pos"][0], "y": obj["pos"][1], "z": obj["pos"][2]} for obj in vector_info]
-        updated = True
+        feed.push({"objects": [{"x": obj["pos"][0], "y": obj["pos"][1], "z": obj["pos"][2]} for obj in vector_info]})
 
-        tracking_semaphore.release()
         time.sleep(update_interval)
 
 
-def run_simulator(simulator_args: Dict) -> Dict:
-    global updated
-    ret = None
-    tracking_semaphore.acquire()
-    if updated:
-        ret = copy.deepcopy(tracking_info)
-        updated = False
-    tracking_semaphore.release()
-    return ret
-
-
 def _simulator(ctx,
                update_interval: float,
                num_objects: int):
-    global tracking_semaphore
-    tracking_semaphore = Semaphore()
+    feed = SensorFeed()
     logger.debug("simulating {} objects at {} Hz".format(num_objects, 1/update_interval))
-    tracker_thread = Thread(target=_update_thread, args=[update_interval, num_objects])
+    tracker_thread = Thread(target=_update_thread, args=[feed, update_interval, num_objects])
     tracker_thread.daemon = True
     tracker_thread.start()
-    circum.endpoint.start_endpoint(ctx, "simulator", run_simulator)
+    circum.endpoint.start_endpoint(ctx, "simulator", feed)
 
 
 @click.command()
@@ -1,16 +1,23 @@
 #!/bin/python3
+import itertools
 import logging
 import select
 import socket
-import struct
-from threading import Semaphore
-from typing import Dict, List
+import time
+from typing import Callable, List, Tuple
 
-import bson
-
-from circum.utils.network import ServiceListener, _advertise_server, _get_interface_ip, _open_server, _set_keepalive
+from circum.utils import metrics, profiling
+from circum.utils.broadcast import Broadcaster, CONFLATE, policies
+from circum.utils.capture import CaptureWriter
+from circum.utils.encoding import Frame, PACKED, advertise_formats, decode, encode, formats, parse_format_request
+from circum.utils.network import (FrameReader, ServiceListener, _advertise_server, _get_interface_ip, _open_server,
+                                  _set_keepalive, frame, size_data_len)
+from circum.utils.scheduling import UpdateScheduler, get_scheduler
+from circum.utils.state.fusion import fuse
 from circum.utils.state.kalman_tracker import KalmanTracker as Tracker
+from circum.utils.state.sharding import ShardedTracker
 from circum.utils.state.tracking import TrackedObject
+from circum.utils.tracing import tracer
 
 import click
 
@@ -20,88 +27,240 @@ from zeroconf import ServiceBrowser, Zeroconf
 
 
 logger = logging.getLogger(__name__)
-size_fmt = "!i"
-size_data_len = struct.calcsize(size_fmt)
-tracking_state = Tracker()
+# endpoints stamp frames with their wall clock capture time, so the tracker runs on the same clock
+tracking_state = Tracker(clock=time.time)
+# detections from different endpoints closer than this are considered the same object
+default_fusion_radius = .5
+# numbers the published updates so that clients can tell when they missed one, see _encoder
+_sequence = itertools.count()
+# the time of the last tracker update, the tracker never runs at an earlier time, see _track
+_applied = None
 
+_decode_seconds = metrics.registry.histogram("circum_stage_seconds", stage="decode")
+_fuse_seconds = metrics.registry.histogram("circum_stage_seconds", stage="fuse")
+_track_seconds = metrics.registry.histogram("circum_stage_seconds", stage="track")
+_encode_seconds = metrics.registry.histogram("circum_stage_seconds", stage="encode")
+_publish_seconds = metrics.registry.histogram("circum_stage_seconds", stage="publish")
+_published = metrics.registry.counter("circum_updates_published_total", "Tracking updates published to clients.")
+_tracks = metrics.registry.gauge("circum_tracks", "The number of tracks.")
 
-def _update(update: Dict,
-            clients: List[socket.socket]):
-    people = [TrackedObject(np.asarray([person["x"], person["y"], person["z"]])) for person in update]
-    tracking_state.update(people)
-    tracked = tracking_state.get_objects()
-    update_dict = {
-        "objects": [{"x": person.pos[0], "y": person.pos[1], "z": person.pos[2], "id": person.id} for person in tracked]
-    }
-    bson_data = bson.dumps(update_dict)
-    length = len(bson_data)
-    size_data = struct.pack(size_fmt, length)
-    data = size_data + bson_data
 
-    excepted = []
+def _sources(frames: List[Frame],
+             labels: np.ndarray,
+             count: int) -> List[List[Tuple[str, int]]]:
+    """
+    The (source, id) keys of the tracked detections that were fused into
+    each of the count detections, frames from endpoints carry no ids.
+    """
+    sources = [[] for _ in range(count)]
+    offset = 0
+    for received in frames:
+        if received.ids is not None:
+            for label, id_ in zip(labels[offset:offset + len(received.ids)], received.ids):
+                sources[label].append((received.source, int(id_)))
+        offset += len(received.positions)
+    return sources
 
-    for client in clients:
-        try:
-            client.sendall(data)
-        except Exception:
-            excepted.append(client)
 
-    for client in excepted:
-        clients.remove(client)
+def _track(frames: List[Frame],
+           fusion_radius: float = default_fusion_radius) -> Frame:
+    """
+    Runs one tracker update with the detections in frames, at the newest
+    capture time among them, or at the time of the previous update if that
+    is later, as when the frames only come from an endpoint that is late or
+    whose clock is behind. Tracks from upstream services are detections
+    like any other, except that they keep following the track their
+    upstream id was last associated with.
+    """
+    global _applied
+    timestamp = max((frame.timestamp for frame in frames), default=0)
+    if not timestamp:
+        timestamp = time.time()
+    if _applied is not None and timestamp < _applied:
+        timestamp = _applied
+    _applied = timestamp
+    with _fuse_seconds.time():
+        positions, labels = fuse(frames, fusion_radius, return_labels=True)
+    people = [TrackedObject(pos, timestamp) for pos in positions]
+    for person, sources in zip(people, _sources(frames, labels, len(people))):
+        person.sources = sources
+    with _track_seconds.time():
+        tracking_state.update(people, timestamp)
+    ids, positions = tracking_state.get_tracks()
+    _tracks.set(len(ids))
+    return Frame(positions, ids, timestamp=timestamp)
 
 
-def _run_service(server_sockets: List[socket.socket],
-                 listener: ServiceListener):
-    semaphore = Semaphore()
-    clients = []
+def _encoder(update: Frame) -> Callable[[str], bytes]:
+    """
+    Encodes update at most once per format. The update is numbered when it is
+    first encoded, so that only the updates that are published are numbered.
+    """
+    encoded = {}
+
+    def _encode(fmt: str) -> bytes:
+        nonlocal update
+        if len(encoded) == 0:
+            update = update._replace(seq=next(_sequence), sent=time.time())
+            _published.inc()
+        if fmt not in encoded:
+            with _encode_seconds.time():
+                encoded[fmt] = frame(encode(update, fmt))
+        return encoded[fmt]
+
+    return _encode
+
+
+def _update(batches: List[List[Frame]],
+            broadcaster: Broadcaster,
+            fusion_radius: float = default_fusion_radius,
+            recorder: CaptureWriter = None):
+    if len(batches) == 0:
+        return
+    with profiling.watchdog.iteration("update"):
+        tracked = []
+        for frames in batches:
+            update = _track(frames, fusion_radius)
+            tracked.append((frames, time.time()))
+        encoder = _encoder(update)
+        if recorder is not None:
+            # published frames are recorded packed, without their length prefix
+            recorder.outbound(memoryview(encoder(PACKED))[size_data_len:])
+        with _publish_seconds.time():
+            broadcaster.publish(encoder)
+        tracer.record_updates(tracked, time.time())
 
-    last_update = {}
+
+def _decode_received(data: memoryview,
+                     source: str) -> Frame:
+    """
+    Decodes a frame returned by a FrameReader. The frame is copied out of the
+    reader's buffer first, the scheduler may hold on to it after the reader
+    has reused the buffer for the next read.
+    """
+    with _decode_seconds.time():
+        update = decode(bytes(data))
+    return update._replace(source=source, received=time.time())
+
+
+def _run_service(server_sockets: List[socket.socket],
+                 listener: ServiceListener,
+                 scheduler: UpdateScheduler,
+                 policy: str = CONFLATE,
+                 fusion_radius: float = default_fusion_radius,
+                 recorder: CaptureWriter = None):
+    broadcaster = Broadcaster(policy)
+    readers = {}
+    # the frames received counter of each endpoint, looked up once when its reader is created
+    received = {}
+    metrics.watch_scheduler(scheduler)
+    metrics.watch_broadcaster(broadcaster)
 
     while True:
         endpoint_sockets = listener.get_sockets()
-
-        removed_endpoints = set(last_update.keys()) - set(endpoint_sockets)
-        for removed_endpoint in removed_endpoints:
-            last_update.pop(removed_endpoint)
+        client_sockets = broadcaster.sockets()
+        scheduler.retain(endpoint_sockets)
+        for removed_socket in set(readers.keys()) - set(endpoint_sockets) - set(client_sockets):
+            readers.pop(removed_socket)
+            received.pop(removed_socket, None)
 
         # service the sockets
-        ready, _, excepted = select.select(server_sockets + endpoint_sockets, [], [], 1)
+        timeout = scheduler.timeout()
+        ready, writable, excepted = select.select(server_sockets + endpoint_sockets + client_sockets,
+                                                  broadcaster.pending_sockets(), [],
+                                                  1 if timeout is None else min(timeout, 1))
         for ready_socket in ready:
             if ready_socket in server_sockets:
                 conn, _ = ready_socket.accept()
                 _set_keepalive(conn)
-                semaphore.acquire()
-                clients.append(conn)
-                semaphore.release()
+                readers[conn] = FrameReader(conn)
+                broadcaster.add(conn)
             elif ready_socket in endpoint_sockets:
                 try:
-                    size_data = ready_socket.recv(size_data_len)
-                    size = struct.unpack(size_fmt, size_data)[0]
-                    data = ready_socket.recv(size)
-                    update_data = bson.loads(data)
-                    last_update[ready_socket] = update_data["objects"]
-                    _update([person for update in last_update.values() for person in update], clients)
+                    source = listener.name(ready_socket)
+                    if ready_socket not in readers:
+                        readers[ready_socket] = FrameReader(ready_socket)
+                        received[ready_socket] = metrics.registry.counter(
+                            "circum_frames_received_total", "Frames received from each endpoint.", source=source)
+                    for data in readers[ready_socket].read():
+                        received[ready_socket].inc()
+                        if recorder is not None:
+                            recorder.inbound(source, data)
+                        scheduler.on_frame(ready_socket, _decode_received(data, source))
+                        if scheduler.ready():
+                            _update(scheduler.batches(), broadcaster, fusion_radius, recorder)
                 except OSError:
                     if ready_socket not in excepted:
                         excepted.append(ready_socket)
+            elif ready_socket in client_sockets:
+                try:
+                    for payload in readers[ready_socket].read():
+                        fmt = parse_format_request(payload)
+                        if fmt is not None:
+                            logger.debug("client requested {} frames".format(fmt))
+                            broadcaster.set_format(ready_socket, fmt)
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    readers.pop(ready_socket)
+                    broadcaster.remove(ready_socket)
         for excepted_socket in excepted:
             if excepted_socket not in server_sockets:
                 listener.remove(excepted_socket)
 
+        if len(writable) > 0:
+            broadcaster.flush()
+
+        if scheduler.ready():
+            _update(scheduler.batches(), broadcaster, fusion_radius, recorder)
+
+
+def _serve(server_sockets: List[socket.socket],
+           listener: ServiceListener,
+           engine: str = "select",
+           queue_size: int = 4,
+           tick_hz: float = 0,
+           policy: str = CONFLATE,
+           fusion_radius: float = default_fusion_radius,
+           reorder_delay: float = .05,
+           recorder: CaptureWriter = None):
+    """
+    Runs the service on already open server sockets with the endpoints and
+    upstream services listener connects to.
+    """
+    scheduler = get_scheduler(tick_hz, reorder_delay)
+    if engine == "asyncio":
+        # the asyncio engine is optional, asyncio is only imported when it is used
+        import asyncio
+        from circum.async_service import _run_service_async
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(_run_service_async(server_sockets, listener, scheduler,
+                                                   lambda frames: _encoder(_track(frames, fusion_radius)),
+                                                   queue_size, recorder))
+    else:
+        _run_service(server_sockets, listener, scheduler, policy, fusion_radius, recorder)
+
 
 def _start_service(name: str,
                    interface: str,
                    port: int,
-                   listener: ServiceListener):
+                   listener: ServiceListener,
+                   engine: str = "select",
+                   queue_size: int = 4,
+                   tick_hz: float = 0,
+                   policy: str = CONFLATE,
+                   fusion_radius: float = default_fusion_radius,
+                   reorder_delay: float = .05,
+                   recorder: CaptureWriter = None):
     ips = _get_interface_ip(interface)
 
     logger.debug("opening server on ({},{})".format(ips, port))
     server_sockets, ips = _open_server(ips, port)
 
-    zeroconf, infos = _advertise_server(name, "service", ips, port)
+    zeroconf, infos = _advertise_server(name, "service", ips, port, advertise_formats())
 
     try:
-        _run_service(server_sockets, listener)
+        _serve(server_sockets, listener, engine, queue_size, tick_hz, policy, fusion_radius, reorder_delay, recorder)
     except Exception:
         logging.error("Exception while running server", exc_info=True)
     finally:
@@ -132,6 +291,112 @@ def _start_service(name: str,
               type=str,
               help='Names of endpoints to connect to. Can be specified multiple times. ' +
                    'If no endpoints are specified, all discovered endpoints will be used.')
+@click.option('--upstream',
+              '-u',
+              multiple=True,
+              type=str,
+              help='Names of other services to connect to. Their tracks are tracked like detections from an ' +
+                   'endpoint, keeping the association of every upstream track. Can be specified multiple times.')
+@click.option('--engine',
+              required=False,
+              default="select",
+              type=click.Choice(["select", "asyncio"]),
+              help='The networking engine to run the service on. Defaults to select.')
+@click.option('--queue-size',
+              required=False,
+              default=4,
+              type=int,
+              help='The number of frames buffered per client before the oldest is dropped. ' +
+                   'Only used by the asyncio engine. Defaults to 4.')
+@click.option('--tick-hz',
+              required=False,
+              default=0,
+              type=float,
+              help='Run the tracker at a fixed rate, using the latest frame from each endpoint. ' +
+                   'Defaults to 0, which applies every frame as its own update in capture order.')
+@click.option('--reorder-delay',
+              required=False,
+              default=.05,
+              type=float,
+              help='How long, in seconds, frames are held so that frames from different endpoints are applied in ' +
+                   'the order they were captured. Not used with --tick-hz. Defaults to 0.05.')
+@click.option('--slow-client-policy',
+              required=False,
+              default=CONFLATE,
+              type=click.Choice(policies),
+              help='What to do with new frames while a client is still receiving an earlier one. ' +
+                   'conflate only sends the newest, drop discards them. Only used by the select engine. ' +
+                   'Defaults to conflate.')
+@click.option('--fusion-radius',
+              required=False,
+              default=default_fusion_radius,
+              type=float,
+              help='Detections from different endpoints closer than this, in meters, are merged into one before ' +
+                   'tracking. Only used with --tick-hz, otherwise every frame is tracked on its own. 0 disables ' +
+                   'merging. Defaults to {}.'.format(default_fusion_radius))
+@click.option('--shards',
+              required=False,
+              default=0,
+              type=int,
+              help='Split tracking over this many worker processes, each tracking the objects in its own cells ' +
+                   'of a grid on the ground plane. Defaults to 0, which tracks in the service process.')
+@click.option('--shard-size',
+              required=False,
+              default=10,
+              type=float,
+              help='The size, in meters, of the grid cells shared out between tracking workers. Defaults to 10.')
+@click.option('--shard-margin',
+              required=False,
+              default=1,
+              type=float,
+              help='Detections closer than this, in meters, to a cell border are also tracked by the workers of the ' +
+                   'neighbouring cells, so that objects can be handed over. Defaults to 1.')
+@click.option('--record',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Record every frame received from endpoints and every frame sent to clients to this capture ' +
+                   'file. An index is written next to it with the extension .idx.')
+@click.option('--trace',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Write the hops of the most recent frames, from sensor capture until queued for the clients, to ' +
+                   'this file as Chrome trace events on exit.')
+@click.option('--format',
+              'fmt',
+              required=False,
+              default=PACKED,
+              type=click.Choice(formats),
+              help='The frame format to request from endpoints that support it. Defaults to packed.')
+@click.option('--metrics-port',
+              required=False,
+              default=0,
+              type=int,
+              help='Serve metrics in the Prometheus text format on this local port. Defaults to 0, which disables it.')
+@click.option('--metrics-interval',
+              required=False,
+              default=0,
+              type=float,
+              help='Log a summary of the metrics every this many seconds. Defaults to 0, which disables it.')
+@click.option('--profile',
+              required=False,
+              default=None,
+              type=click.Path(dir_okay=False),
+              help='Sample the stacks of all threads and write them to this file in the collapsed stack format ' +
+                   'read by flame graph tools, at exit, on SIGUSR1 and every --profile-interval seconds.')
+@click.option('--profile-interval',
+              required=False,
+              default=0,
+              type=float,
+              help='Write the profile every this many seconds. Defaults to 0, which only writes it at exit and on ' +
+                   'SIGUSR1.')
+@click.option('--stall-deadline',
+              required=False,
+              default=0,
+              type=float,
+              help='Log the stacks of all threads when a single tracker update takes longer than this many seconds. ' +
+                   'Defaults to 0, which disables it.')
 @click.option('--debug',
               required=False,
               default=False,
@@ -140,18 +405,54 @@ def cli(name: str,
         interface: str,
         port: int,
         endpoint: List[str],
+        upstream: List[str],
+        engine: str,
+        queue_size: int,
+        tick_hz: float,
+        reorder_delay: float,
+        slow_client_policy: str,
+        fusion_radius: float,
+        shards: int,
+        shard_size: float,
+        shard_margin: float,
+        record: str,
+        trace: str,
+        fmt: str,
+        metrics_port: int,
+        metrics_interval: float,
+        profile: str,
+        profile_interval: float,
+        stall_deadline: float,
         debug: bool):
-    global logger
+    global logger, tracking_state
     logger = logging.getLogger("circum_service")
     if debug:
         logger.setLevel("DEBUG")
+    metrics.start(metrics_port, metrics_interval, logger)
+    profiling.start(profile, profile_interval, stall_deadline, log=logger)
     zeroconf = Zeroconf()
     endpoint_type = "_endpoint._sub._circum._tcp.local."
-    listener = ServiceListener([name + "." + endpoint_type for name in endpoint])
+    service_type = "_service._sub._circum._tcp.local."
+    listener = ServiceListener([name + "." + endpoint_type for name in endpoint] +
+                               [name + "." + service_type for name in upstream], fmt)
     browser = ServiceBrowser(zeroconf, endpoint_type, listener)  # noqa
+    if len(upstream) > 0:
+        upstream_browser = ServiceBrowser(zeroconf, service_type, listener)  # noqa
+    if shards > 0:
+        tracking_state = ShardedTracker(shards, cell_size=shard_size, margin=shard_margin)
+    recorder = None if record is None else CaptureWriter(record)
+    if trace is not None:
+        tracer.keep()
     try:
-        _start_service(name, interface, port, listener)
+        _start_service(name, interface, port, listener, engine, queue_size, tick_hz, slow_client_policy,
+                       fusion_radius, reorder_delay, recorder)
     finally:
+        if recorder is not None:
+            recorder.close()
+        if trace is not None:
+            tracer.export(trace)
+        if shards > 0:
+            tracking_state.close()
         zeroconf.close()
 
 
@@ -0,0 +1,195 @@
+import logging
+import socket
+from threading import RLock
+from typing import Callable, Dict, List, NamedTuple
+
+from circum.utils.encoding import BSON
+
+
+logger = logging.getLogger(__name__)
+
+# while a client still has a frame in flight, new frames are dropped
+DROP = "drop"
+# while a client still has a frame in flight, only the newest frame is kept to be sent next
+CONFLATE = "conflate"
+policies = (DROP, CONFLATE)
+
+
+class ClientLag(NamedTuple):
+    frames: int
+    pending_bytes: int
+    dropped: int
+
+
+class _Subscriber:
+    def __init__(self,
+                 sock: socket.socket,
+                 fmt: str):
+        self.sock = sock
+        self.format = fmt
+        self.pending = None
+        self.offset = 0
+        self.next = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = False
+
+    def queue(self,
+              data: bytes,
+              policy: str):
+        self.published += 1
+        if self.pending is None:
+            self.pending = memoryview(data)
+            self.offset = 0
+        elif policy == CONFLATE:
+            if self.next is not None:
+                self.dropped += 1
+                self.delivered += 1
+            self.next = data
+        else:
+            self.dropped += 1
+            self.delivered += 1
+
+    def pending_bytes(self) -> int:
+        if self.pending is None:
+            return 0
+        return len(self.pending) - self.offset + (0 if self.next is None else len(self.next))
+
+    def write(self):
+        """
+        Writes as much of the pending data as the socket accepts without blocking.
+        """
+        while self.pending is not None:
+            try:
+                self.offset += self.sock.send(self.pending[self.offset:])
+            except BlockingIOError:
+                return
+            if self.offset < len(self.pending):
+                return
+            self.delivered += 1
+            self.pending = None if self.next is None else memoryview(self.next)
+            self.next = None
+            self.offset = 0
+
+
+class Broadcaster:
+    """
+    Sends every published frame to a set of non-blocking client sockets. A
+    frame is encoded once per format in use and each client keeps its own
+    write offset, so a client that cannot keep up never blocks the others. What
+    happens to frames published while a client is still writing a previous one
+    is decided by the policy.
+    """
+
+    def __init__(self,
+                 policy: str = CONFLATE):
+        if policy not in policies:
+            raise ValueError("unknown policy {}, expected one of {}".format(policy, policies))
+        self.policy = policy
+        # frames dropped for all clients, including the ones that have gone
+        self.dropped = 0
+        self._clients = {}
+        self._lock = RLock()
+        # becomes readable when a publish leaves data that still has to be flushed
+        self.waker, self._wake = socket.socketpair()
+        self.waker.setblocking(False)
+        self._wake.setblocking(False)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def add(self,
+            sock: socket.socket,
+            fmt: str = BSON):
+        sock.setblocking(False)
+        with self._lock:
+            self._clients[sock] = _Subscriber(sock, fmt)
+
+    def set_format(self,
+                   sock: socket.socket,
+                   fmt: str):
+        with self._lock:
+            if sock in self._clients:
+                self._clients[sock].format = fmt
+
+    def remove(self,
+               sock: socket.socket):
+        with self._lock:
+            if self._clients.pop(sock, None) is not None:
+                sock.close()
+
+    def sockets(self) -> List[socket.socket]:
+        """
+        The client sockets. Clients that failed since the last call are removed
+        and closed here so that sockets are only closed by the thread that
+        selects on them.
+        """
+        with self._lock:
+            for client in [client for client in self._clients.values() if client.failed]:
+                self.remove(client.sock)
+            return list(self._clients.keys())
+
+    def pending_sockets(self) -> List[socket.socket]:
+        with self._lock:
+            return [client.sock for client in self._clients.values()
+                    if client.pending is not None and not client.failed]
+
+    def publish(self,
+                encode: Callable[[str], bytes]):
+        """
+        Queues a frame for every client. encode returns the frame in a given
+        format and is called once for every format in use.
+        """
+        encoded = {}
+        with self._lock:
+            for client in self._clients.values():
+                if client.failed:
+                    continue
+                if client.format not in encoded:
+                    encoded[client.format] = encode(client.format)
+                dropped = client.dropped
+                client.queue(encoded[client.format], self.policy)
+                if client.dropped != dropped:
+                    self.dropped += client.dropped - dropped
+                    logger.debug("client is behind, dropped a frame ({} total)".format(client.dropped))
+            self.flush()
+            if len(self.pending_sockets()) > 0:
+                try:
+                    self._wake.send(b"\0")
+                except BlockingIOError:
+                    pass
+
+    def flush(self):
+        with self._lock:
+            for client in self._clients.values():
+                if client.failed:
+                    continue
+                try:
+                    client.write()
+                except OSError:
+                    logger.debug("transmit failure", exc_info=True)
+                    client.failed = True
+
+    def clear_wakeup(self):
+        try:
+            while self.waker.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def lag(self) -> Dict[socket.socket, ClientLag]:
+        with self._lock:
+            return {
+                client.sock: ClientLag(client.published - client.delivered,
+                                       client.pending_bytes(),
+                                       client.dropped)
+                for client in self._clients.values()
+            }
+
+    def close(self):
+        with self._lock:
+            for sock in self.sockets():
+                self.remove(sock)
+        self.waker.close()
+        self._wake.close()
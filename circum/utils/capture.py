@@ -0,0 +1,207 @@
+import logging
+import mmap
+import os
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from circum.utils.encoding import Frame, decode
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# record kinds, a source record names the source id used by the inbound records that follow it
+INBOUND = 0
+OUTBOUND = 1
+SOURCE = 2
+
+index_suffix = ".idx"
+index_dtype = np.dtype([
+    ("timestamp", "<f8"),
+    ("kind", "u1"),
+    ("source", "<u2"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+])
+
+
+class CaptureWriter:
+    """
+    Appends frames to a capture. A capture is a data file holding the frame
+    payloads exactly as they were sent or received, back to back, and an
+    index file holding one fixed size index_dtype record per payload with the
+    time it was recorded, its kind, the id of the source it was received from
+    and where it is in the data file. Both files are only ever appended to, so
+    recording into an existing capture continues it, after cutting off any
+    record that was not completely written.
+    """
+
+    def __init__(self,
+                 path: str,
+                 clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._data = open(path, "ab")
+        self._index = open(path + index_suffix, "ab")
+        self._sources = {}
+        self._offset = 0
+        if self._data.tell() > 0 or self._index.tell() > 0:
+            self._truncate_incomplete()
+        self._next_source = len(self._sources)
+
+    def _truncate_incomplete(self):
+        # a torn index record would shift every record appended after it, and a
+        # payload without an index record would shift their offsets
+        self._index.truncate(self._index.tell() // index_dtype.itemsize * index_dtype.itemsize)
+        self._index.flush()
+        reader = CaptureReader(self.path)
+        if len(reader) > 0:
+            self._offset = int(reader.index["offset"][-1]) + int(reader.index["length"][-1])
+        records = len(reader)
+        # keep numbering the sources of the capture being continued
+        self._sources = {name: source for source, name in reader.sources.items()}
+        reader.close()
+        self._index.truncate(records * index_dtype.itemsize)
+        self._data.truncate(self._offset)
+
+    def _append(self,
+                kind: int,
+                source: int,
+                payload: bytes,
+                timestamp: float = None):
+        record = np.array([(self._clock() if timestamp is None else timestamp, kind, source,
+                            self._offset, len(payload))], dtype=index_dtype)
+        self._data.write(payload)
+        self._index.write(record.tobytes())
+        self._offset += len(payload)
+
+    def _source(self,
+                name: str,
+                timestamp: float) -> int:
+        if name not in self._sources:
+            source = self._next_source
+            self._next_source += 1
+            # stamped like the record it precedes to keep the index sorted
+            self._append(SOURCE, source, str(name).encode(), timestamp)
+            self._sources[name] = source
+        return self._sources[name]
+
+    def inbound(self,
+                source: str,
+                payload: bytes,
+                timestamp: float = None):
+        """
+        Records a frame received from source.
+        """
+        if timestamp is None:
+            timestamp = self._clock()
+        self._append(INBOUND, self._source(source, timestamp), payload, timestamp)
+
+    def outbound(self,
+                 payload: bytes,
+                 timestamp: float = None):
+        """
+        Records a frame sent to the clients.
+        """
+        self._append(OUTBOUND, 0, payload, timestamp)
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    if os.path.getsize(path) == 0:
+        # empty files can't be mapped
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CaptureReader:
+    """
+    Reads a capture written by CaptureWriter. The index and the data are
+    memory mapped, so a capture of any size can be opened, searched and
+    seeked without reading it. Payloads are returned as views into the
+    mapped data. Records that were not completely written, for example
+    because the recorder was killed, are ignored.
+    """
+
+    def __init__(self,
+                 path: str):
+        self.path = path
+        self._data = _map(path)
+        data_size = 0 if self._data is None else len(self._data)
+        index_size = os.path.getsize(path + index_suffix) // index_dtype.itemsize
+        if index_size == 0:
+            self.index = np.empty(0, dtype=index_dtype)
+        else:
+            self.index = np.memmap(path + index_suffix, dtype=index_dtype, mode="r", shape=(index_size,))
+        complete = self.index["offset"] + self.index["length"] <= data_size
+        if not complete.all():
+            self.index = self.index[:np.argmin(complete)]
+
+        self.sources = {}
+        for i in np.flatnonzero(self.index["kind"] == SOURCE):
+            self.sources[int(self.index["source"][i])] = bytes(self.payload(i)).decode()
+
+    def __len__(self):
+        return len(self.index)
+
+    def payload(self,
+                i: int) -> memoryview:
+        offset = int(self.index["offset"][i])
+        length = int(self.index["length"][i])
+        if length == 0:
+            return memoryview(b"")
+        return memoryview(self._data)[offset:offset + length]
+
+    def frame(self,
+              i: int) -> Frame:
+        """
+        Decodes the frame of record i, inbound frames have their source set.
+        """
+        decoded = decode(self.payload(i))
+        if self.index["kind"][i] == INBOUND:
+            return decoded._replace(source=self.sources.get(int(self.index["source"][i])))
+        return decoded
+
+    def seek(self,
+             timestamp: float) -> int:
+        """
+        The first record recorded at or after timestamp.
+        """
+        return int(np.searchsorted(self.index["timestamp"], timestamp, side="left"))
+
+    def records(self,
+                start: float = None,
+                end: float = None,
+                kind: int = None) -> Iterator[Tuple[float, int, Frame]]:
+        """
+        The (timestamp, kind, frame) of every frame recorded from start up to,
+        but not including, end, optionally only those of one kind.
+        """
+        first = 0 if start is None else self.seek(start)
+        last = len(self.index) if end is None else self.seek(end)
+        kinds = self.index["kind"][first:last]
+        selected = kinds != SOURCE if kind is None else kinds == kind
+        for i in first + np.flatnonzero(selected):
+            yield float(self.index["timestamp"][i]), int(self.index["kind"][i]), self.frame(i)
+
+    def source_counts(self) -> Dict[str, int]:
+        """
+        The number of inbound frames from each source.
+        """
+        inbound = self.index["source"][self.index["kind"] == INBOUND]
+        sources, counts = np.unique(inbound, return_counts=True)
+        return {self.sources.get(int(source)): int(count) for source, count in zip(sources, counts)}
+
+    def close(self):
+        # the mappings are released once no payload views into them are left
+        self.index = np.empty(0, dtype=index_dtype)
+        self._data = None
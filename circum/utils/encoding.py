@@ -0,0 +1,159 @@
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import bson
+
+import numpy as np
+
+
+BSON = "bson"
+PACKED = "packed"
+formats = (BSON, PACKED)
+
+# packed frames start with a fixed little endian header followed by a float32 (count, 3) array of positions, when
+# the ids flag is set an int32 (count,) array of ids and, when the sent flag is set, the float64 time it was sent
+packed_magic = b"CPK1"
+packed_header_fmt = "<4sBxxxIId"
+packed_header_len = struct.calcsize(packed_header_fmt)
+packed_flag_ids = 0x1
+packed_flag_sent = 0x2
+packed_sent_fmt = "<d"
+
+
+class Frame(NamedTuple):
+    """
+    The positions of the objects in a single update along with their ids when
+    they have been tracked. timestamp is the capture time in seconds since
+    the epoch, 0 when unknown, and sent the time the sender encoded it. source
+    names the connection the frame was received from and received the time it
+    arrived, they are set by the receiver and never encoded.
+    """
+    positions: np.ndarray
+    ids: Optional[np.ndarray] = None
+    seq: int = 0
+    timestamp: float = 0
+    source: Optional[str] = None
+    sent: float = 0
+    received: float = 0
+
+
+def _empty_positions() -> np.ndarray:
+    return np.empty((0, 3))
+
+
+def encode_bson(frame: Frame) -> bytes:
+    if frame.ids is None:
+        objects = [{"x": float(pos[0]), "y": float(pos[1]), "z": float(pos[2])} for pos in frame.positions]
+    else:
+        objects = [{"x": float(pos[0]), "y": float(pos[1]), "z": float(pos[2]), "id": int(id_)}
+                   for pos, id_ in zip(frame.positions, frame.ids)]
+    document = {"objects": objects}
+    if frame.seq:
+        document["seq"] = int(frame.seq)
+    if frame.timestamp:
+        document["timestamp"] = float(frame.timestamp)
+    if frame.sent:
+        document["sent"] = float(frame.sent)
+    return bson.dumps(document)
+
+
+def encode_packed(frame: Frame) -> bytes:
+    count = len(frame.positions)
+    flags = (0 if frame.ids is None else packed_flag_ids) | (packed_flag_sent if frame.sent else 0)
+    header = struct.pack(packed_header_fmt, packed_magic, flags, count, frame.seq, frame.timestamp)
+    parts = [header, np.ascontiguousarray(frame.positions, dtype="<f4").reshape(count, 3).tobytes()]
+    if frame.ids is not None:
+        parts.append(np.ascontiguousarray(frame.ids, dtype="<i4").tobytes())
+    if frame.sent:
+        parts.append(struct.pack(packed_sent_fmt, frame.sent))
+    return b"".join(parts)
+
+
+def encode(frame: Frame,
+           fmt: str) -> bytes:
+    if fmt == PACKED:
+        return encode_packed(frame)
+    return encode_bson(frame)
+
+
+def is_packed(payload: bytes) -> bool:
+    return bytes(payload[:len(packed_magic)]) == packed_magic
+
+
+def decode_packed(payload: bytes) -> Frame:
+    """
+    Decodes a packed frame. The arrays are read only views into payload.
+    """
+    _, flags, count, seq, timestamp = struct.unpack_from(packed_header_fmt, payload)
+    positions = np.frombuffer(payload, dtype="<f4", count=count * 3, offset=packed_header_len).reshape(count, 3)
+    offset = packed_header_len + positions.nbytes
+    ids = None
+    if flags & packed_flag_ids:
+        ids = np.frombuffer(payload, dtype="<i4", count=count, offset=offset)
+        offset += ids.nbytes
+    sent = 0
+    if flags & packed_flag_sent:
+        sent, = struct.unpack_from(packed_sent_fmt, payload, offset)
+    return Frame(positions, ids, seq, timestamp, sent=sent)
+
+
+def decode_objects(objects: List[Dict],
+                   timestamp: float = 0) -> Frame:
+    if len(objects) == 0:
+        # an empty ids array like a decoded packed frame, so that clients can read the ids of an empty scene
+        return Frame(_empty_positions(), np.empty(0, dtype=int), timestamp=timestamp)
+    positions = np.array([[obj["x"], obj["y"], obj["z"]] for obj in objects], dtype=float)
+    ids = None
+    if all("id" in obj for obj in objects):
+        ids = np.array([obj["id"] for obj in objects])
+    return Frame(positions, ids, timestamp=timestamp)
+
+
+def decode(payload: bytes) -> Frame:
+    """
+    Decodes a frame in either format.
+    """
+    if is_packed(payload):
+        return decode_packed(payload)
+    document = bson.loads(bytes(payload))
+    return decode_objects(document["objects"], document.get("timestamp", 0))._replace(seq=document.get("seq", 0),
+                                                                                      sent=document.get("sent", 0))
+
+
+def concatenate(frames: Iterable[Frame]) -> np.ndarray:
+    positions = [frame.positions for frame in frames]
+    if len(positions) == 0:
+        return _empty_positions()
+    return np.concatenate(positions)
+
+
+def format_request(fmt: str) -> bytes:
+    """
+    The message a subscriber sends after connecting to ask for a format.
+    """
+    return bson.dumps({"format": fmt})
+
+
+def parse_format_request(payload: bytes) -> Optional[str]:
+    try:
+        fmt = bson.loads(bytes(payload)).get("format")
+    except Exception:
+        return None
+    return fmt if fmt in formats else None
+
+
+def advertise_formats() -> Dict[str, str]:
+    return {"formats": ",".join(formats)}
+
+
+def advertised_formats(properties: Dict) -> List[str]:
+    """
+    The formats listed in a zeroconf service's properties. Services that do not
+    advertise any only support BSON.
+    """
+    value = properties.get(b"formats", properties.get("formats")) if properties else None
+    if value is None:
+        return [BSON]
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return value.split(",")
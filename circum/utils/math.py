@@ -6,31 +6,75 @@ from typing import List
 import numpy as np
 
 
-def transform_positions(positions: np.ndarray, sensor_pose: List[float]):
-    translation_matrix = np.identity(4)
-    translation_matrix[0][3] = sensor_pose[0]
-    translation_matrix[1][3] = sensor_pose[1]
-    translation_matrix[2][3] = sensor_pose[2]
+def _pose(sensor_pose: List[float]) -> List[float]:
+    return [float(value) for value in np.asarray(sensor_pose, dtype=float).reshape(-1)]
+
 
+def rotation_matrix(sensor_pose: List[float]) -> np.ndarray:
+    """
+    The 3x3 rotation of a pose. Points are rotated around x, then y, then z.
+    """
     theta_x = math.radians(sensor_pose[3])
     theta_y = math.radians(sensor_pose[4])
     theta_z = math.radians(sensor_pose[5])
 
-    rx = np.array([[1,     0,              0,       0],
-                   [0, cos(theta_x), -sin(theta_x), 0],
-                   [0, sin(theta_x),  cos(theta_x), 0],
-                   [0,     0,              0,       1]])
+    rx = np.array([[1,     0,              0],
+                   [0, cos(theta_x), -sin(theta_x)],
+                   [0, sin(theta_x),  cos(theta_x)]])
+
+    ry = np.array([[cos(theta_y),  0, sin(theta_y)],
+                   [0,             1,       0],
+                   [-sin(theta_y), 0, cos(theta_y)]])
+
+    rz = np.array([[cos(theta_z), -sin(theta_z), 0],
+                   [sin(theta_z),  cos(theta_z), 0],
+                   [0,                   0,      1]])
+
+    return rz @ ry @ rx
+
 
-    ry = np.array([[cos(theta_y),  0, sin(theta_y), 0],
-                   [0,             1,       0,      0],
-                   [-sin(theta_y), 0, cos(theta_y), 0],
-                   [0,             0,       0,      1]])
+def pose_matrix(sensor_pose: List[float]) -> np.ndarray:
+    """
+    The 4x4 homogeneous transform of a pose.
+    """
+    sensor_pose = _pose(sensor_pose)
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation_matrix(sensor_pose)
+    matrix[:3, 3] = sensor_pose[:3]
+    return matrix
 
-    rz = np.array([[cos(theta_z), -sin(theta_z), 0, 0],
-                   [sin(theta_z),  cos(theta_z), 0, 0],
-                   [0,                   0,      1, 0],
-                   [0,                   0,      0, 1]])
 
+def transform_positions(positions: np.ndarray, sensor_pose: List[float]):
     # first rotate around the sensor's angles, these use the sensor location as the origin
     # then, translate, setting the positions' origin to the system's origin
-    return translation_matrix @ (rz @ (ry @ (rx @ positions)))
+    return pose_matrix(sensor_pose) @ positions
+
+
+class PoseTransform:
+    """
+    The rotation and translation of a sensor pose. They are only recomputed
+    when a different pose is set, so applying an unchanged pose to every frame
+    costs a single matrix multiply.
+    """
+
+    def __init__(self,
+                 sensor_pose: List[float] = (0, 0, 0, 0, 0, 0)):
+        self.pose = None
+        self.set_pose(sensor_pose)
+
+    def set_pose(self,
+                 sensor_pose: List[float]):
+        sensor_pose = _pose(sensor_pose)
+        if sensor_pose == self.pose:
+            return
+        self.pose = sensor_pose
+        # apply multiplies row vectors, so keep the transposed rotation
+        self.rotation_t = rotation_matrix(sensor_pose).T
+        self.translation = np.array(sensor_pose[:3])
+
+    def apply(self,
+              positions: np.ndarray) -> np.ndarray:
+        """
+        Transforms an (N, 3) array of positions from sensor to system space.
+        """
+        return np.asarray(positions, dtype=float) @ self.rotation_t + self.translation
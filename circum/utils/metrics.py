@@ -0,0 +1,335 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# seconds, from 100us to 2.5s
+default_buckets = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """
+    A count that only goes up. When function is given, the count is read from
+    it instead, for counts that are already kept elsewhere.
+    """
+
+    kind = "counter"
+
+    def __init__(self,
+                 function: Callable[[], float] = None):
+        self.function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self,
+            amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value if self.function is None else self.function()
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self,
+            value: float):
+        self._value = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self,
+                 histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, the upper bounds of which are
+    given by buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self,
+                 buckets: Tuple[float, ...] = default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self,
+                value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        """
+        Observes the time, in seconds, spent in a with block.
+        """
+        return _Timer(self)
+
+    def quantile(self,
+                 q: float) -> float:
+        """
+        The upper bound of the bucket holding the q quantile, infinity if it is
+        above the largest bucket.
+        """
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...],
+            extra: Dict[str, str] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if len(pairs) == 0:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join('{}="{}"'.format(k, v) for k, v in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Holds every metric by name and labels. Asking for a metric that already
+    exists returns it, so metrics can be looked up wherever they are updated,
+    but hot paths should keep the metric rather than look it up every time.
+    """
+
+    def __init__(self):
+        # name -> (kind, help, {labels: metric})
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_summary = {}
+
+    def _get(self,
+             cls,
+             name: str,
+             help_text: str,
+             labels: Dict[str, str],
+             *args):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = (cls.kind, help_text, {})
+            kind, known_help, series = self._metrics[name]
+            if help_text and not known_help:
+                # the help of a metric can be given by any of its series
+                self._metrics[name] = (kind, help_text, series)
+            if kind != cls.kind:
+                raise ValueError("{} is a {}, not a {}".format(name, kind, cls.kind))
+            if key not in series:
+                series[key] = cls(*args)
+            return series[key]
+
+    def counter(self,
+                name: str,
+                help_text: str = "",
+                function: Callable[[], float] = None,
+                **labels) -> Counter:
+        counter = self._get(Counter, name, help_text, labels)
+        if function is not None:
+            counter.function = function
+        return counter
+
+    def gauge(self,
+              name: str,
+              help_text: str = "",
+              function: Callable[[], float] = None,
+              **labels) -> Gauge:
+        gauge = self._get(Gauge, name, help_text, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self,
+                  name: str,
+                  help_text: str = "",
+                  buckets: Tuple[float, ...] = default_buckets,
+                  **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets)
+
+    def _series(self) -> List[Tuple[str, str, str, List]]:
+        with self._lock:
+            return [(name, kind, help_text, list(series.items()))
+                    for name, (kind, help_text, series) in sorted(self._metrics.items())]
+
+    def render(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, kind, help_text, series in self._series():
+            if help_text:
+                lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, metric in series:
+                if kind != Histogram.kind:
+                    lines.append("{}{} {}".format(name, _labels(labels), _number(metric.get())))
+                    continue
+                with metric._lock:
+                    counts = list(metric.counts)
+                    total = metric.sum
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(name, _labels(labels, {"le": _number(bound)}), cumulative))
+                lines.append("{}_sum{} {}".format(name, _labels(labels), _number(total)))
+                lines.append("{}_count{} {}".format(name, _labels(labels), cumulative))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        A human readable line per metric. Counters and histograms include their
+        rate since the last summary.
+        """
+        now = time.monotonic()
+        lines = []
+        for name, kind, _, series in self._series():
+            for labels, metric in series:
+                key = (name, labels)
+                description = name + _labels(labels)
+                if kind == Gauge.kind:
+                    lines.append("{} {}".format(description, _number(metric.get())))
+                    continue
+                value = metric.get() if kind == Counter.kind else metric.count
+                last_time, last_value = self._last_summary.get(key, (None, 0))
+                self._last_summary[key] = (now, value)
+                rate = "" if last_time is None else " ({:.1f}/s)".format((value - last_value) / (now - last_time))
+                if kind == Counter.kind:
+                    lines.append("{} {}{}".format(description, _number(value), rate))
+                elif metric.count > 0:
+                    lines.append("{} count {}{} mean {:.3f}ms p50 <{}ms p99 <{}ms".format(
+                        description, metric.count, rate, 1e3 * metric.sum / metric.count,
+                        _number(1e3 * metric.quantile(.5)), _number(1e3 * metric.quantile(.99))))
+        return "\n".join(lines)
+
+
+# the registry every circum component records into
+registry = Registry()
+
+
+def serve(port: int,
+          address: str = "127.0.0.1",
+          metrics: Registry = registry):
+    """
+    Serves metrics in the Prometheus text format at /metrics from a
+    background thread and returns the HTTP server. Only listens on the local
+    host by default.
+    """
+    # imported here rather than slowing down the start of every process that records metrics
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class _Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = _Server((address, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("serving metrics on http://{}:{}/metrics".format(address, server.server_address[1]))
+    return server
+
+
+def log_summaries(interval: float,
+                  log: logging.Logger = logger,
+                  metrics: Registry = registry) -> threading.Thread:
+    """
+    Logs a summary of metrics every interval seconds from a background thread.
+    """
+    def _run():
+        while True:
+            time.sleep(interval)
+            log.info("metrics:\n" + metrics.summary())
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+def start(port: int = 0,
+          interval: float = 0,
+          log: logging.Logger = logger):
+    """
+    Starts serving metrics on port and logging summaries every interval
+    seconds, either is disabled when 0.
+    """
+    if port > 0:
+        serve(port)
+    if interval > 0:
+        log_summaries(interval, log)
+
+
+def watch_scheduler(scheduler,
+                    metrics: Registry = registry):
+    """
+    Exposes the queue depth and the frames dropped or delayed by an
+    UpdateScheduler.
+    """
+    metrics.gauge("circum_scheduler_pending", "Frames waiting for the tracker.", scheduler.pending)
+    metrics.counter("circum_frames_replaced_total",
+                    "Frames replaced by a newer frame from the same endpoint before the tracker ran.",
+                    lambda: scheduler.replaced)
+    metrics.counter("circum_frames_late_total",
+                    "Frames that arrived after a newer frame was already tracked.",
+                    lambda: getattr(scheduler, "late", 0))
+
+
+def watch_broadcaster(broadcaster,
+                      metrics: Registry = registry):
+    """
+    Exposes the clients of a Broadcaster and the frames they are behind by.
+    """
+    metrics.gauge("circum_clients", "Connected clients.", broadcaster.__len__)
+    metrics.counter("circum_client_frames_dropped_total", "Frames that were not sent to a client that was behind.",
+                    lambda: broadcaster.dropped)
+    metrics.gauge("circum_client_pending_bytes", "Bytes queued for clients that are behind.",
+                  lambda: sum(lag.pending_bytes for lag in broadcaster.lag().values()))
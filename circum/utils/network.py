@@ -1,14 +1,106 @@
 import logging
 import socket
+import struct
 import sys
+import time
 from ipaddress import AddressValueError, IPv4Address
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from circum.utils.encoding import advertised_formats, format_request
 
 import ifaddr
 
 from zeroconf import ServiceInfo, Zeroconf, get_all_addresses
 
 logger = logging.getLogger(__name__)
+size_fmt = "!i"
+size_data_len = struct.calcsize(size_fmt)
+
+
+def frame(payload: bytes) -> bytes:
+    return struct.pack(size_fmt, len(payload)) + payload
+
+
+class FrameReader:
+    """
+    Reassembles length prefixed frames from a stream socket. Data is received
+    straight into a reusable buffer with recv_into and complete frames are
+    returned as memoryviews into that buffer, so a frame is only valid until the
+    next call to read. Partial frames are kept and completed by later reads.
+    """
+
+    def __init__(self,
+                 sock: socket.socket,
+                 buffer_size: int = 65536):
+        self.sock = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def _make_room(self, needed: int):
+        pending = self._end - self._start
+        if needed > len(self._buffer):
+            # a frame larger than the buffer, grow it
+            buffer = bytearray(max(needed, 2 * len(self._buffer)))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(self._buffer)
+        elif pending > 0:
+            # move the partial frame to the front of the buffer
+            self._view[:pending] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def _needed(self) -> int:
+        if self._end - self._start < size_data_len:
+            return size_data_len
+        return size_data_len + struct.unpack_from(size_fmt, self._buffer, self._start)[0]
+
+    def _recv(self):
+        if self._start == self._end:
+            self._start = 0
+            self._end = 0
+        needed = self._needed()
+        if len(self._buffer) - self._start < needed:
+            self._make_room(needed)
+
+        received = self.sock.recv_into(self._view[self._end:])
+        if received == 0:
+            raise ConnectionError("connection closed")
+        self._end += received
+
+    def _next(self) -> Optional[memoryview]:
+        needed = self._needed()
+        if self._end - self._start < needed:
+            return None
+        payload = self._view[self._start + size_data_len:self._start + needed]
+        self._start += needed
+        return payload
+
+    def read(self) -> List[memoryview]:
+        """
+        Receives once from the socket and returns every frame that is now
+        complete. Raises ConnectionError when the connection has been closed.
+        """
+        self._recv()
+        frames = []
+        payload = self._next()
+        while payload is not None:
+            frames.append(payload)
+            payload = self._next()
+        return frames
+
+    def read_frame(self) -> memoryview:
+        """
+        Blocks until a complete frame has been received and returns it. Any
+        further frames received along the way are kept for the next call.
+        """
+        payload = self._next()
+        while payload is None:
+            self._recv()
+            payload = self._next()
+        return payload
 
 
 def _advertise_server(name: str,
@@ -109,11 +201,37 @@ def _set_keepalive(sock: socket.socket,
     # we'll leave the defaults on other os's
 
 
+def _connect(address: str,
+             port: int,
+             request_format: str = None) -> socket.socket:
+    logger.debug("attempting to connects to ({}, {})".format(address, port))
+    service_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        service_socket.connect((address, port))
+        _set_keepalive(service_socket)
+        if request_format is not None:
+            logger.debug("requesting {} frames".format(request_format))
+            service_socket.sendall(frame(format_request(request_format)))
+    except OSError:
+        service_socket.close()
+        raise
+    logger.debug("connected")
+    return service_socket
+
+
 class ServiceListener:
     def __init__(self,
-                 services: List[str]):
+                 services: List[str],
+                 request_format: str = None):
+        """
+        Connects to the discovered services. services holds the full names of
+        the services to connect to, all services of a type are connected to
+        unless services names some of that type. If request_format is given,
+        it is requested from every service that advertises support for it.
+        """
         self.sockets = {}
         self.services = services
+        self.request_format = request_format
 
     def remove_service(self, zeroconf, type_, name):
         logger.debug("Service {} removed".format(name))
@@ -121,21 +239,20 @@ class ServiceListener:
 
     def add_service(self, zeroconf, type_, name):
         info = zeroconf.get_service_info(type_, name)
-        if len(self.services) > 0:
-            if name not in self.services:
+        wanted = [service for service in self.services if service.endswith(type_)]
+        if len(wanted) > 0:
+            if name not in wanted:
                 logger.debug("Name doesn't match skipping {}, service info: {}".format(name, info))
                 return
         logger.debug("Service {} added, service info: {}".format(name, info))
         if name not in self.sockets.keys():
             addresses = [str(IPv4Address(address)) for address in info.addresses]
+            request_format = self.request_format
+            if request_format not in advertised_formats(info.properties):
+                request_format = None
             for address in addresses:
                 try:
-                    logger.debug("attempting to connects to ({}, {})".format(address, info.port))
-                    service_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    service_socket.connect((address, info.port))
-                    _set_keepalive(service_socket)
-                    self.sockets[name] = service_socket
-                    logger.debug("connected")
+                    self.sockets[name] = _connect(address, info.port, request_format)
                     break
                 except Exception:
                     logger.warn("unable to create socket", exc_info=True)
@@ -146,5 +263,44 @@ class ServiceListener:
                 self.sockets.pop(k).close()
                 return
 
+    def name(self, service_socket: socket.socket) -> Optional[str]:
+        for k, s in self.sockets.items():
+            if s == service_socket:
+                return k
+        return None
+
     def get_sockets(self):
         return list(self.sockets.values())
+
+
+class StaticListener(ServiceListener):
+    def __init__(self,
+                 servers: Dict[str, Tuple[str, int]],
+                 request_format: str = None,
+                 retry_interval: float = 1):
+        """
+        Connects to a fixed set of servers instead of discovering them, for
+        networks without multicast. servers maps a name to an (address, port).
+        Servers that could not be reached, or whose connection was removed,
+        are connected to again by get_sockets at most every retry_interval
+        seconds. request_format is requested from every server.
+        """
+        super().__init__(list(servers), request_format)
+        self.servers = dict(servers)
+        self.retry_interval = retry_interval
+        self._attempted = {}
+
+    def _connect_missing(self):
+        now = time.monotonic()
+        for name, (address, port) in self.servers.items():
+            if name in self.sockets or now - self._attempted.get(name, now - self.retry_interval) < self.retry_interval:
+                continue
+            self._attempted[name] = now
+            try:
+                self.sockets[name] = _connect(address, port, self.request_format)
+            except OSError:
+                logger.debug("unable to connect to {}".format(name), exc_info=True)
+
+    def get_sockets(self):
+        self._connect_missing()
+        return super().get_sockets()
@@ -0,0 +1,237 @@
+"""
+A sampling profiler and a stall watchdog that can be left running in
+production. The profiler periodically samples the stack of every thread and
+writes the counts in the collapsed stack format, one line per stack with its
+frames from the root to the leaf separated by semicolons followed by the
+number of samples, which flamegraph.pl, speedscope and similar tools read.
+"""
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from circum.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_stalls = metrics.registry.counter("circum_stalls_total", "Iterations that took longer than the stall deadline.")
+
+
+def _collapse(thread_name: str,
+              frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name).replace(" ", "_"))
+        frame = frame.f_back
+    stack.append(thread_name.replace(";", ":").replace(" ", "_"))
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every interval seconds from a
+    background thread. The counts are cumulative from when the profiler was
+    started.
+    """
+
+    def __init__(self,
+                 interval: float = .01):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._dump_requested = threading.Event()
+        self._dump_path = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="circum-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def sample(self):
+        """
+        Takes one sample of every thread except the profiler's own.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, frame in frames.items():
+                if ident != own:
+                    self.counts[_collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "".join("{} {}\n".format(stack, count) for stack, count in sorted(self.counts.items()))
+
+    def dump(self,
+             path: str):
+        """
+        Writes the collapsed stacks to path, replacing an earlier dump.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.collapsed())
+        os.replace(temp_path, path)
+        logger.info("wrote {} profile samples to {}".format(self.samples, path))
+
+    def request_dump(self,
+                     path: str):
+        """
+        Asks the profiler thread to dump to path, safe to call from a signal
+        handler.
+        """
+        self._dump_path = path
+        self._dump_requested.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if self._dump_requested.is_set():
+                self._dump_requested.clear()
+                self.dump(self._dump_path)
+
+
+def _thread_stacks() -> str:
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = []
+    for ident, frame in sys._current_frames().items():
+        stacks.append("thread {} ({}):\n{}".format(names.get(ident, "?"), ident,
+                                                   "".join(traceback.format_stack(frame))))
+    return "\n".join(stacks)
+
+
+class _Iteration:
+    __slots__ = ("watchdog", "name", "key")
+
+    def __init__(self,
+                 watchdog: "Watchdog",
+                 name: str):
+        self.watchdog = watchdog
+        self.name = name
+
+    def __enter__(self):
+        self.key = (threading.get_ident(), self.name)
+        self.watchdog._running[self.key] = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.watchdog._running.pop(self.key, None)
+        self.watchdog._reported.discard(self.key)
+
+
+class _NoIteration:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_no_iteration = _NoIteration()
+
+
+class Watchdog:
+    """
+    Logs the stacks of all threads whenever an iteration, a block wrapped in
+    iteration, runs for longer than deadline seconds. Each stalled iteration
+    is only reported once. Does nothing until started with a deadline.
+    """
+
+    def __init__(self,
+                 deadline: float = 0,
+                 log: logging.Logger = logger):
+        self.deadline = deadline
+        self.log = log
+        self.stalls = 0
+        # (thread, name) -> start time
+        self._running = {}
+        self._reported = set()
+        self._thread = None
+
+    def iteration(self,
+                  name: str):
+        if self.deadline <= 0:
+            return _no_iteration
+        return _Iteration(self, name)
+
+    def start(self,
+              deadline: float):
+        self.deadline = deadline
+        self._thread = threading.Thread(target=self._run, name="circum-watchdog", daemon=True)
+        self._thread.start()
+
+    def check(self) -> int:
+        """
+        Reports the iterations that are past their deadline and returns how
+        many there were.
+        """
+        now = time.monotonic()
+        stalled = [(key, start) for key, start in list(self._running.items())
+                   if now - start > self.deadline and key not in self._reported]
+        if len(stalled) == 0:
+            return 0
+        stacks = _thread_stacks()
+        for key, start in stalled:
+            self._reported.add(key)
+            self.stalls += 1
+            _stalls.inc()
+            self.log.warning("{} has been running for {:.3f}s, longer than the {}s deadline. Thread stacks:\n{}".format(
+                key[1], now - start, self.deadline, stacks))
+        return len(stalled)
+
+    def _run(self):
+        while True:
+            time.sleep(self.deadline / 4)
+            self.check()
+
+
+# the watchdog the service and endpoint iterations are wrapped in
+watchdog = Watchdog()
+
+
+def start(profile: str = None,
+          interval: float = 0,
+          deadline: float = 0,
+          sample_interval: float = .01,
+          log: logging.Logger = logger) -> SamplingProfiler:
+    """
+    Starts profiling into profile if given, dumping it every interval
+    seconds, on SIGUSR1 and at exit, and starts the watchdog if deadline is
+    more than 0. Returns the profiler, if any.
+    """
+    if deadline > 0:
+        watchdog.log = log
+        watchdog.start(deadline)
+    if profile is None:
+        return None
+
+    profiler = SamplingProfiler(sample_interval)
+    profiler.start()
+    atexit.register(profiler.dump, profile)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.request_dump(profile))
+    if interval > 0:
+        def _dump_periodically():
+            while True:
+                time.sleep(interval)
+                profiler.request_dump(profile)
+
+        threading.Thread(target=_dump_periodically, name="circum-profile-dump", daemon=True).start()
+    log.info("profiling every {}s into {}".format(sample_interval, profile))
+    return profiler
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Hashable, Iterable, List
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateScheduler:
+    """
+    Buffers the latest frame from each endpoint and decides when the tracker
+    runs. The base scheduler runs the tracker as soon as any new frame has been
+    received. Every frame is handed to the tracker at most once, an endpoint
+    that has not sent anything new since the last step is left out.
+    """
+
+    def __init__(self):
+        self.latest = {}
+        self.dirty = False
+        # frames that were replaced by a newer frame from the same endpoint before the tracker ran
+        self.replaced = 0
+
+    def on_frame(self,
+                 endpoint: Hashable,
+                 frame: Any):
+        if endpoint in self.latest:
+            self.replaced += 1
+        self.latest[endpoint] = frame
+        self.dirty = True
+
+    def retain(self,
+               endpoints: Iterable[Hashable]):
+        endpoints = set(endpoints)
+        for removed_endpoint in set(self.latest.keys()) - endpoints:
+            self.latest.pop(removed_endpoint)
+
+    def remove(self,
+               endpoint: Hashable):
+        self.latest.pop(endpoint, None)
+
+    def pending(self) -> int:
+        """
+        The number of frames waiting for the tracker.
+        """
+        return len(self.latest)
+
+    def timeout(self) -> float:
+        """
+        The number of seconds until the tracker may need to run again, or None
+        if it only needs to run when a new frame arrives.
+        """
+        return None
+
+    def ready(self) -> bool:
+        return self.dirty
+
+    def frames(self) -> List[Any]:
+        """
+        The latest frame from each endpoint that sent one since the last call.
+        """
+        self.dirty = False
+        frames = list(self.latest.values())
+        self.latest = {}
+        return frames
+
+    def batches(self) -> List[List[Any]]:
+        """
+        The frames to run the tracker on, one tracker update per batch.
+        """
+        return [self.frames()]
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+
+class TickScheduler(UpdateScheduler):
+    """
+    Runs the tracker at a fixed rate. Frames received between ticks only
+    replace the buffered frame of their endpoint, so the tracker cost does not
+    depend on the number of endpoints or their frame rates.
+    """
+
+    def __init__(self,
+                 tick_hz: float):
+        super().__init__()
+        self.interval = 1 / tick_hz
+        self.next_tick = self._now()
+
+    def timeout(self) -> float:
+        return max(0, self.next_tick - self._now())
+
+    def ready(self) -> bool:
+        now = self._now()
+        if now < self.next_tick:
+            return False
+        if not self.dirty:
+            # nothing new arrived, skip this tick
+            self.next_tick = self._next_tick(now)
+            return False
+        return True
+
+    def frames(self) -> List[Any]:
+        self.next_tick = self._next_tick(self._now())
+        return super().frames()
+
+    def _next_tick(self,
+                   now: float) -> float:
+        # stay on the tick grid, skipping any ticks that were missed
+        missed = int((now - self.next_tick) / self.interval)
+        return self.next_tick + (missed + 1) * self.interval
+
+
+class SequentialScheduler(UpdateScheduler):
+    """
+    Hands every frame to the tracker as its own update, in the order the
+    frames were captured. Frames are held for reorder_delay seconds after they
+    arrive so that a frame that was captured earlier but arrived later can
+    still go first. A frame that arrives after a newer one has already been
+    released is still released, with its own capture time, and counted as
+    late, the service never runs the tracker at an earlier time than before.
+    Frames without a capture timestamp are stamped with clock when they
+    arrive. As every frame
+    is its own update, detections from different endpoints are never fused.
+    """
+
+    def __init__(self,
+                 reorder_delay: float = .05,
+                 clock: Callable[[], float] = time.time):
+        super().__init__()
+        self.reorder_delay = reorder_delay
+        self.clock = clock
+        self.released = None
+        self.late = 0
+        self._pending = []
+        self._order = itertools.count()
+
+    def on_frame(self,
+                 endpoint: Hashable,
+                 frame: Any):
+        timestamp = frame.timestamp if frame.timestamp else self.clock()
+        heapq.heappush(self._pending, (timestamp, next(self._order), self._now() + self.reorder_delay, endpoint, frame))
+
+    def retain(self,
+               endpoints: Iterable[Hashable]):
+        endpoints = set(endpoints)
+        self._drop(lambda endpoint: endpoint not in endpoints)
+
+    def remove(self,
+               endpoint: Hashable):
+        self._drop(lambda pending_endpoint: pending_endpoint == endpoint)
+
+    def _drop(self,
+              removed: Callable[[Hashable], bool]):
+        pending = [entry for entry in self._pending if not removed(entry[3])]
+        if len(pending) < len(self._pending):
+            heapq.heapify(pending)
+            self._pending = pending
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def timeout(self) -> float:
+        if len(self._pending) == 0:
+            return None
+        return max(0, self._pending[0][2] - self._now())
+
+    def ready(self) -> bool:
+        return len(self._pending) > 0 and self._pending[0][2] <= self._now()
+
+    def frames(self) -> List[Any]:
+        """
+        The frames that are due, oldest first, late frames aside. Frames
+        without a capture timestamp are stamped with their arrival time.
+        """
+        now = self._now()
+        frames = []
+        while len(self._pending) > 0 and self._pending[0][2] <= now:
+            timestamp, _, _, _, frame = heapq.heappop(self._pending)
+            if self.released is not None and timestamp < self.released:
+                self.late += 1
+                logger.debug("frame arrived {} seconds late ({} total)".format(self.released - timestamp, self.late))
+            else:
+                self.released = timestamp
+            frames.append(frame if frame.timestamp else frame._replace(timestamp=timestamp))
+        return frames
+
+    def batches(self) -> List[List[Any]]:
+        return [[frame] for frame in self.frames()]
+
+
+def get_scheduler(tick_hz: float = 0,
+                  reorder_delay: float = .05) -> UpdateScheduler:
+    if tick_hz > 0:
+        return TickScheduler(tick_hz)
+    return SequentialScheduler(reorder_delay)
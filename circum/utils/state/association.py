@@ -0,0 +1,106 @@
+import logging
+from typing import Callable, List, NamedTuple, Tuple, Union
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+Solver = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+class CostGraph(NamedTuple):
+    """
+    A sparse cost structure. Each candidate pair is stored as (rows[i], cols[i])
+    with cost costs[i], pairs that are not present can never be associated.
+    """
+    rows: np.ndarray
+    cols: np.ndarray
+    costs: np.ndarray
+    shape: Tuple[int, int]
+
+
+def gate(distances: np.ndarray,
+         threshold: float) -> CostGraph:
+    rows, cols = np.nonzero(distances < threshold)
+    return CostGraph(rows, cols, distances[rows, cols], distances.shape)
+
+
+def munkres_solver(costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    from munkres import Munkres
+    indexes = Munkres().compute(costs.tolist())
+    if len(indexes) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    rows, cols = zip(*indexes)
+    return np.asarray(rows), np.asarray(cols)
+
+
+def scipy_solver(costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # scipy.optimize takes longer to import than the rest of circum, so it is only imported once it is used
+    from scipy.optimize import linear_sum_assignment
+    return linear_sum_assignment(costs)
+
+
+solvers = {
+    "munkres": munkres_solver,
+    "scipy": scipy_solver,
+}
+
+
+def get_solver(solver: Union[str, Solver]) -> Solver:
+    if callable(solver):
+        return solver
+    if solver not in solvers:
+        raise ValueError("unknown association solver {}, expected one of {}".format(solver, list(solvers)))
+    return solvers[solver]
+
+
+def associate(graph: CostGraph,
+              solver: Solver = scipy_solver) -> List[Tuple[int, int]]:
+    """
+    Solves the assignment problem described by graph. The problem is split into
+    the connected components of the candidate pairs and each component is solved
+    on its own, components made up of a single pair are assigned directly.
+    """
+    num_rows, num_cols = graph.shape
+    if len(graph.rows) == 0:
+        return []
+
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    # rows and columns are the nodes of a bipartite graph, columns are offset by the number of rows
+    adjacency = coo_matrix((np.ones(len(graph.rows)), (graph.rows, graph.cols + num_rows)),
+                           shape=(num_rows + num_cols, num_rows + num_cols))
+    _, labels = connected_components(adjacency, directed=False)
+
+    edge_labels = labels[graph.rows]
+    order = np.argsort(edge_labels, kind="stable")
+    boundaries = np.flatnonzero(np.diff(edge_labels[order])) + 1
+
+    pairs = []
+    for edges in np.split(order, boundaries):
+        rows = graph.rows[edges]
+        cols = graph.cols[edges]
+        costs = graph.costs[edges]
+
+        if len(edges) == 1:
+            pairs.append((int(rows[0]), int(cols[0])))
+            continue
+
+        component_rows, local_rows = np.unique(rows, return_inverse=True)
+        component_cols, local_cols = np.unique(cols, return_inverse=True)
+
+        # pairs that were gated out get a cost larger than any feasible assignment
+        infeasible = costs.sum() + 1
+        matrix = np.full((len(component_rows), len(component_cols)), infeasible)
+        matrix[local_rows, local_cols] = costs
+
+        feasible = np.zeros(matrix.shape, dtype=bool)
+        feasible[local_rows, local_cols] = True
+
+        for row, col in zip(*solver(matrix)):
+            if feasible[row, col]:
+                pairs.append((int(component_rows[row]), int(component_cols[col])))
+
+    return pairs
@@ -0,0 +1,69 @@
+import logging
+from typing import List, Tuple, Union
+
+from circum.utils.encoding import Frame, concatenate
+from circum.utils.state.spatial import KDTreeIndex, SpatialIndex, get_index
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def fuse(frames: List[Frame],
+         radius: float,
+         index: Union[str, SpatialIndex] = None,
+         return_labels: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Merges detections of the same object by different endpoints. Detections
+    from different frames that are closer than radius are clustered, closest
+    pairs first, and every cluster is replaced by its centroid. A cluster
+    never holds more than one detection from the same frame, so objects that
+    are close together but seen apart by one endpoint stay separate. With
+    return_labels, the index of the fused detection each detection of the
+    concatenated frames ended up in is returned as well.
+    """
+    positions = concatenate(frames)
+
+    def _unfused():
+        return (positions, np.arange(len(positions))) if return_labels else positions
+
+    if radius <= 0 or len(frames) < 2 or len(positions) < 2:
+        return _unfused()
+
+    sources = np.repeat(np.arange(len(frames)), [len(frame.positions) for frame in frames])
+    index = KDTreeIndex() if index is None else get_index(index)
+    graph = index.candidates(positions, positions, radius)
+
+    # every pair is reported twice, and pairs from the same endpoint are never merged
+    candidates = (graph.rows < graph.cols) & (sources[graph.rows] != sources[graph.cols])
+    if not candidates.any():
+        return _unfused()
+    rows = graph.rows[candidates]
+    cols = graph.cols[candidates]
+    order = np.argsort(graph.costs[candidates], kind="stable")
+
+    clusters = np.arange(len(positions))
+    members = {}
+    for row, col in zip(rows[order], cols[order]):
+        a = clusters[row]
+        b = clusters[col]
+        if a == b:
+            continue
+        a_members = members.get(a, [a])
+        b_members = members.get(b, [b])
+        if not set(sources[a_members]).isdisjoint(sources[b_members]):
+            continue
+        clusters[b_members] = a
+        members[a] = a_members + b_members
+        members.pop(b, None)
+
+    _, labels, counts = np.unique(clusters, return_inverse=True, return_counts=True)
+    fused = np.zeros((len(counts), positions.shape[1]))
+    np.add.at(fused, labels, positions)
+    fused /= counts[:, None]
+
+    logger.debug("fused {} detections into {}".format(len(positions), len(fused)))
+    if return_labels:
+        return fused, labels
+    return fused
@@ -0,0 +1,136 @@
+from typing import Dict, Sequence, Tuple
+
+from circum.utils.state.table import SlotTable
+
+import numpy as np
+
+
+class EKFBank:
+    """
+    A bank of extended Kalman filters that share the same model. The state and
+    covariance of every filter are stacked into (N, n, 1) and (N, n, n) arrays so
+    that predict and update run for any subset of the filters in a few array ops.
+    Filters are addressed by slot, slots are recycled once released.
+
+    The filters are stored as columns of table. When a table is shared with
+    other state, such as a TrackTable, filters can be started in slots the
+    table has already allocated.
+    """
+
+    def __init__(self,
+                 d: Dict,
+                 capacity: int = 16,
+                 table: SlotTable = None):
+        self.n = d['number_of_states']
+        self.half_n = int(self.n / 2)
+        self.P0 = np.asarray(d['initial_process_matrix'], dtype=float)
+        self.R = np.asarray(d['covariance_matrix'], dtype=float)
+        self.H = np.asarray(d['transition_matrix'], dtype=float)
+        self.a = np.asarray(d['acceleration_noise'], dtype=float)
+        self.I = np.eye(self.n)  # noqa: E741
+
+        self.table = SlotTable(capacity) if table is None else table
+        self.table.add_column("state", (self.n, 1))
+        self.table.add_column("covariance", (self.n, self.n))
+        self.table.add_column("filter_time")
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.table.state
+
+    @property
+    def P(self) -> np.ndarray:
+        return self.table.covariance
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.table.filter_time
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.table.active
+
+    def __len__(self):
+        return len(self.table)
+
+    def start(self,
+              data: np.ndarray,
+              timestamp: float,
+              slot: int = None) -> int:
+        if slot is None:
+            slot = self.table.allocate()
+        self.x[slot] = 0
+        self.x[slot, 0:self.half_n, 0] = data
+        self.P[slot] = self.P0
+        self.timestamps[slot] = timestamp
+        return slot
+
+    def release(self,
+                slot: int):
+        self.table.release(slot)
+
+    def slots(self) -> np.ndarray:
+        return self.table.slots()
+
+    def _transition(self,
+                    dt: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        k = len(dt)
+        h = self.half_n
+        diag = np.arange(h)
+
+        F = np.tile(self.I, (k, 1, 1))
+        F[:, diag, diag + h] = dt[:, None]
+
+        dt2 = dt * dt
+        dt3 = dt * dt2
+        dt4 = dt * dt3
+
+        Q = np.zeros((k, self.n, self.n))
+        Q[:, diag, diag] = dt4[:, None] * self.a / 4
+        Q[:, diag, diag + h] = dt3[:, None] * self.a / 2
+        Q[:, diag + h, diag] = dt3[:, None] * self.a / 2
+        Q[:, diag + h, diag + h] = dt2[:, None] * self.a
+
+        return F, Q
+
+    def predict(self,
+                timestamp: float,
+                slots: Sequence[int] = None):
+        slots = self.slots() if slots is None else np.asarray(slots, dtype=int)
+        if len(slots) == 0:
+            return
+
+        F, Q = self._transition(timestamp - self.timestamps[slots])
+        self.timestamps[slots] = timestamp
+
+        self.x[slots] = F @ self.x[slots]
+        self.P[slots] = F @ self.P[slots] @ F.transpose(0, 2, 1) + Q
+
+    def update(self,
+               slots: Sequence[int],
+               data: np.ndarray,
+               timestamp: float):
+        slots = np.asarray(slots, dtype=int)
+        if len(slots) == 0:
+            return
+
+        z = np.asarray(data, dtype=float).reshape(len(slots), -1, 1)
+        x = self.x[slots]
+        P = self.P[slots]
+
+        y = z - self.H @ x
+        PHt = P @ self.H.T
+        S = self.H @ PHt + self.R
+        K = PHt @ np.linalg.inv(S)
+
+        self.x[slots] = x + K @ y
+        self.P[slots] = (self.I - K @ self.H) @ P
+        self.timestamps[slots] = timestamp
+
+    def positions(self,
+                  slots: Sequence[int]) -> np.ndarray:
+        return self.x[np.asarray(slots, dtype=int), 0:self.half_n, 0]
+
+    def velocities(self,
+                   slots: Sequence[int]) -> np.ndarray:
+        return self.x[np.asarray(slots, dtype=int), self.half_n:, 0]
@@ -1,4 +1,3 @@
-import datetime
 from typing import Dict, Tuple
 
 from circum.utils.state.kalman.kalmanfilter import KalmanFilter
@@ -55,8 +54,8 @@ class EKF:
         self.kalmanFilter.set_Q(Q)
 
     def predict(self,
-                timestamp: datetime.datetime):
-        dt = (timestamp - self.timestamp) / datetime.timedelta(seconds=1)
+                timestamp: float):
+        dt = timestamp - self.timestamp
         self.timestamp = timestamp
 
         self.kalmanFilter.update_F(dt)
@@ -65,7 +64,7 @@ class EKF:
 
     def update(self,
                data: np.ndarray,
-               timestamp: datetime.datetime):
+               timestamp: float):
         z = data.reshape(data.shape[0], 1)
         x = self.kalmanFilter.get_x()
 
@@ -76,13 +75,13 @@ class EKF:
 
     def predict_update(self,
                        data: np.ndarray,
-                       timestamp: datetime.datetime):
+                       timestamp: float):
         self.predict(timestamp)
         self.update(data, timestamp)
 
     def start(self,
               data: np.ndarray,
-              timestamp: datetime.datetime):
+              timestamp: float):
         self.timestamp = timestamp
         x = np.concatenate((data, np.array([0, 0, 0])))
         x = x.reshape(x.shape[0], 1)
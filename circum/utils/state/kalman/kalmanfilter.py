@@ -1,7 +1,5 @@
 import numpy as np
 
-from scipy.linalg import inv
-
 
 class KalmanFilter:
     """
@@ -50,7 +48,7 @@ class KalmanFilter:
         y = z - Hx
         PHt = self.P @ H.T
         S = H @ PHt + R
-        K = PHt @ inv(S)
+        K = PHt @ np.linalg.inv(S)
 
         self.x = self.x + K @ y
         self.P = (self.I - K @ H) @ self.P
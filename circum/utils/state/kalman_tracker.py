@@ -1,52 +1,59 @@
 import logging
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Union
 
-from circum.utils.state.kalman.ekf import EKF
+from circum.utils.metrics import registry
+from circum.utils.state.association import Solver, associate, gate, get_solver
+from circum.utils.state.kalman.bank import EKFBank
+from circum.utils.state.spatial import SpatialIndex, get_index
 from circum.utils.state.tracking import ObjectTracker, TrackedObject
 
-from munkres import Munkres
-
 import numpy as np
 
-import scipy.spatial.distance as dist
-
 
 logger = logging.getLogger(__name__)
+_predict_seconds = registry.histogram("circum_stage_seconds", "Time spent in each processing stage.", stage="predict")
+_associate_seconds = registry.histogram("circum_stage_seconds", stage="associate")
+_correct_seconds = registry.histogram("circum_stage_seconds", stage="update")
 
 
-class KalmanContext:
-    def __init__(self):
-        num_states = 6
-        half_num_states = int(num_states/2)
-        R = np.zeros([half_num_states, half_num_states])
-        np.fill_diagonal(R, 0.01)
-
-        H = np.zeros((half_num_states, num_states))
-        np.fill_diagonal(H, 1)
+def _ekf_params() -> Dict:
+    num_states = 6
+    half_num_states = int(num_states/2)
+    R = np.zeros([half_num_states, half_num_states])
+    np.fill_diagonal(R, 0.01)
 
-        P_vals = [1 for i in range(half_num_states)] + [1000 for i in range(half_num_states)]
-        P = np.zeros([num_states, num_states])
-        np.fill_diagonal(P, P_vals)
+    H = np.zeros((half_num_states, num_states))
+    np.fill_diagonal(H, 1)
 
-        Q = np.zeros([num_states, num_states])
-        F = np.eye(num_states)
+    P_vals = [1 for i in range(half_num_states)] + [1000 for i in range(half_num_states)]
+    P = np.zeros([num_states, num_states])
+    np.fill_diagonal(P, P_vals)
 
-        d = {
-            'number_of_states': 6,
-            'initial_process_matrix': P,
-            'covariance_matrix': R,
-            'transition_matrix': H,
-            'inital_state_transition_matrix': F,
-            'initial_noise_matrix': Q,
-            'acceleration_noise': (5, 5, 5)
-        }
+    Q = np.zeros([num_states, num_states])
+    F = np.eye(num_states)
 
-        self.kf = EKF(d)
+    return {
+        'number_of_states': 6,
+        'initial_process_matrix': P,
+        'covariance_matrix': R,
+        'transition_matrix': H,
+        'inital_state_transition_matrix': F,
+        'initial_noise_matrix': Q,
+        'acceleration_noise': (5, 5, 5)
+    }
 
 
 class KalmanTracker(ObjectTracker):
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 solver: Union[str, Solver] = "scipy",
+                 index: Union[str, SpatialIndex] = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
+        self._solver = get_solver(solver)
+        self._index = get_index(index)
+        # the filters live in the track table, a track's filter uses the same slot as the track
+        self._bank = EKFBank(_ekf_params(), table=self._objects)
 
     def _associate(self,
                    detected: List[TrackedObject],
@@ -55,61 +62,81 @@ class KalmanTracker(ObjectTracker):
                        List[TrackedObject],
                        List[TrackedObject]
                     ]:
-        tracked_objects = self.get_objects()
-        object_positions = [obj.pos for obj in tracked_objects]
-        new_positions = [obj.pos for obj in detected]
-        if len(tracked_objects) == 0:
-            return [], detected, []
+        table = self._objects
+        # detections already identified by a source key follow their track without competing for it
+        bound, detected = self._bound(detected)
+        associations = [(table.view(slot), obj) for slot, obj in bound]
+        slots = table.ordered_slots()
+        if len(bound) > 0:
+            slots = slots[~np.isin(slots, [slot for slot, _ in bound])]
+        if len(slots) == 0:
+            return associations, detected, []
         if len(detected) == 0:
-            return [], [], tracked_objects
-        distances = dist.cdist(np.asarray(new_positions), np.asarray(object_positions)).tolist()
-
-        m = Munkres()
-        indexes = m.compute(distances)
-
-        associations = []
-        associated_detections = [detected[detected_index] for detected_index, _ in indexes]
-        associated_tracked = [tracked_objects[tracked_index] for _, tracked_index in indexes]
-        unassociated_detections = set(detected) - set(associated_detections)
-        unassociated_tracked = set(tracked_objects) - set(associated_tracked)
-
-        # unassociate anything that jumped too far
-        for row, column in indexes:
-            if distances[row][column] < threshold:
-                associations.append((tracked_objects[column], detected[row]))
-            else:
-                unassociated_detections.add(detected[row])
-                unassociated_tracked.add(tracked_objects[column])
+            return associations, [], [table.view(slot) for slot in slots]
+
+        object_positions = table.positions[slots]
+        new_positions = np.asarray([obj.pos for obj in detected])
+
+        # only pairs closer than the threshold are candidates, anything that jumped too far stays unassociated
+        if self._index is None:
+            import scipy.spatial.distance as dist
+            distances = dist.cdist(new_positions, object_positions)
+            graph = gate(distances, threshold)
+        else:
+            graph = self._index.candidates(object_positions, new_positions, threshold)
+        indexes = associate(graph, self._solver)
+
+        associations += [(table.view(slots[column]), detected[row]) for row, column in indexes]
+        associated_detections = {row for row, _ in indexes}
+        associated_tracked = {column for _, column in indexes}
+        unassociated_detections = [obj for i, obj in enumerate(detected) if i not in associated_detections]
+        unassociated_tracked = [table.view(slot) for i, slot in enumerate(slots) if i not in associated_tracked]
 
         return associations, unassociated_detections, unassociated_tracked
 
     def _predict(self):
         # update all of the currently tracked objects with their predictions
-        tracked_objects = self.get_objects()
+        slots = self._objects.slots()
         now = self._now()
-        for tracked_object in tracked_objects:
-            tracked_object.tracking_ctx.kf.predict(now)
-            tracked_object.pos =\
-                np.array(tracked_object.tracking_ctx.kf.get()[0, 0:int(tracked_object.tracking_ctx.kf.n / 2)])
+        if len(slots) == 0:
+            return
+        self._bank.predict(now, slots)
+        self._objects.positions[slots] = self._bank.positions(slots)
+        self._objects.velocities[slots] = self._bank.velocities(slots)
 
     def _track(self,
                objects: List[TrackedObject]) -> List[TrackedObject]:
         # predict
-        self._predict()
+        with _predict_seconds.time():
+            self._predict()
 
-        associations, unassociated_detections, unassociated_tracked = self._associate(objects)
+        with _associate_seconds.time():
+            associations, unassociated_detections, unassociated_tracked = self._associate(objects)
 
         now = self._now()
 
-        # add context to new objects
+        # update all of the associated objects at once
+        with _correct_seconds.time():
+            self._correct(associations, unassociated_detections, now)
+
+        return []
+
+    def _correct(self,
+                 associations: List[Tuple[TrackedObject, TrackedObject]],
+                 unassociated_detections: List[TrackedObject],
+                 now: float):
+        if len(associations) > 0:
+            slots = np.array([tracked.slot for tracked, _ in associations])
+            measured = np.asarray([detection.pos for _, detection in associations])
+            self._bank.update(slots, measured, now)
+            self._objects.positions[slots] = self._bank.positions(slots)
+            self._objects.velocities[slots] = self._bank.velocities(slots)
+            self._objects.last_seen[slots] = now
+            self._objects.hits[slots] += 1
+            self._objects.record(slots, measured, now)
+            for tracked, detection in associations:
+                self._bind(detection.sources, tracked.id)
+
+        # new objects are registered here so that their filters can be started in their slots
         for detection in unassociated_detections:
-            detection.tracking_ctx = KalmanContext()
-            detection.tracking_ctx.kf.start(detection.pos, now)
-
-        # predict/update
-        for tracked, detection in associations:
-            tracked.tracking_ctx.kf.update(detection.pos, now)
-            tracked.last_seen = now
-            tracked.pos = np.array(tracked.tracking_ctx.kf.get()[0, 0:int(tracked.tracking_ctx.kf.n / 2)])
-
-        return unassociated_detections
+            self._bank.start(detection.pos, now, self._register(detection))
@@ -0,0 +1,213 @@
+import logging
+import multiprocessing
+import time
+from typing import Dict, List, Tuple
+
+from circum.utils.state.association import associate, gate
+from circum.utils.state.kalman_tracker import KalmanTracker
+from circum.utils.state.spatial import _cell_primes
+from circum.utils.state.tracking import TrackedObject
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# shards partition the ground plane, y is the vertical axis
+_plane_axes = [0, 2]
+
+
+def _cells(positions: np.ndarray,
+           cell_size: float) -> np.ndarray:
+    return np.floor(positions[:, _plane_axes] / cell_size).astype(np.int64)
+
+
+def _owners(positions: np.ndarray,
+            cell_size: float,
+            num_workers: int) -> np.ndarray:
+    """
+    The worker that owns the cell each position is in.
+    """
+    return (_cells(positions, cell_size) @ _cell_primes[:2]) % num_workers
+
+
+def _route(positions: np.ndarray,
+           cell_size: float,
+           margin: float,
+           num_workers: int) -> np.ndarray:
+    """
+    A (len(positions), num_workers) mask of the workers each position is sent
+    to, the owner of its cell and the owners of any cell within margin.
+    """
+    routes = np.zeros((len(positions), num_workers), dtype=bool)
+    rows = np.arange(len(positions))
+    for dx in (-margin, 0, margin):
+        for dz in (-margin, 0, margin):
+            offset = np.zeros(positions.shape[1])
+            offset[_plane_axes] = dx, dz
+            routes[rows, _owners(positions + offset, cell_size, num_workers)] = True
+    return routes
+
+
+def _run_worker(connection,
+                index: int,
+                num_workers: int,
+                cell_size: float,
+                tracker_args: Dict):
+    tracker = KalmanTracker(clock=time.time, **tracker_args)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        positions, sources, timestamp = message
+        objects = [TrackedObject(pos, timestamp) for pos in positions]
+        for obj, obj_sources in zip(objects, sources):
+            obj.sources = obj_sources
+        tracker.update(objects, timestamp)
+        ids, positions = tracker.get_tracks()
+        # ownership follows the last detection of a track rather than its filtered position, every worker that
+        # saw a detection near a border sees the same one and so agrees on which of them owns the track
+        _, trails = tracker.get_trails(1)
+        seen = trails[:, -1] if len(ids) > 0 else positions
+        seen = np.where(np.isnan(seen), positions, seen)
+        owned = _owners(seen, cell_size, num_workers) == index
+        connection.send((ids, positions, owned))
+    connection.close()
+
+
+class _Merger:
+    """
+    Numbers the tracks reported by the workers globally. Each track is only
+    reported by the worker that owns the cell it was last seen in. When a track moves
+    into a cell owned by another worker, the track that worker reports for it
+    takes over the global id of the closest track within handoff_radius that
+    stopped being reported in the last handoff_timeout seconds.
+    """
+
+    def __init__(self,
+                 handoff_radius: float,
+                 handoff_timeout: float = 1):
+        self.handoff_radius = handoff_radius
+        self.handoff_timeout = handoff_timeout
+        self.ids = {}
+        # the last reported position and time of every global id that can still be handed off
+        self.last_reported = {}
+        self._next = 0
+
+    def merge(self,
+              reports: List[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+              now: float) -> Tuple[np.ndarray, np.ndarray]:
+        keys = []
+        positions = []
+        reported = set()
+        for worker, (ids, worker_positions, owned) in enumerate(reports):
+            reported.update((worker, int(id_)) for id_ in ids)
+            keys.extend((worker, int(id_)) for id_ in ids[owned])
+            positions.extend(worker_positions[owned])
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+
+        # forget the tracks that were pruned by their worker
+        for key in [key for key in self.ids if key not in reported]:
+            self.ids.pop(key)
+
+        current = {self.ids[key] for key in keys if key in self.ids}
+        released = [global_id for global_id in self.last_reported if global_id not in current]
+        new = [i for i, key in enumerate(keys) if key not in self.ids]
+
+        if len(new) > 0 and len(released) > 0:
+            import scipy.spatial.distance as dist
+            distances = dist.cdist(positions[new], np.asarray([self.last_reported[id_][0] for id_ in released]))
+            for row, col in associate(gate(distances, self.handoff_radius)):
+                global_id = released[col]
+                logger.debug("handing off track {}".format(global_id))
+                for key in [key for key, value in self.ids.items() if value == global_id]:
+                    self.ids.pop(key)
+                self.ids[keys[new[row]]] = global_id
+
+        for i in new:
+            if keys[i] not in self.ids:
+                self.ids[keys[i]] = self._next
+                self._next += 1
+
+        global_ids = np.array([self.ids[key] for key in keys], dtype=int)
+        for global_id, pos in zip(global_ids, positions):
+            self.last_reported[global_id] = (pos, now)
+        for global_id in [global_id for global_id, (_, reported_at) in self.last_reported.items()
+                          if now - reported_at > self.handoff_timeout]:
+            self.last_reported.pop(global_id)
+
+        order = np.argsort(global_ids, kind="stable")
+        return global_ids[order], positions[order]
+
+
+class ShardedTracker:
+    """
+    Tracks with a pool of worker processes, each running its own
+    KalmanTracker for the cells of a grid on the ground plane that it owns.
+    Detections within margin of a cell border are also sent to the owners of
+    the neighbouring cells so that tracks can be followed across the border,
+    and the tracks of all workers are merged into one globally numbered set.
+    The sources of the detections go with them, so that every worker keeps
+    following upstream tracks. tracker_args are passed on to every worker's
+    KalmanTracker.
+    """
+
+    def __init__(self,
+                 num_workers: int,
+                 cell_size: float = 10,
+                 margin: float = 1,
+                 handoff_radius: float = None,
+                 handoff_timeout: float = 1,
+                 **tracker_args):
+        self.num_workers = num_workers
+        self.cell_size = cell_size
+        self.margin = margin
+        self._merger = _Merger(2 * margin if handoff_radius is None else handoff_radius, handoff_timeout)
+        self._ids = np.empty(0, dtype=int)
+        self._positions = np.empty((0, 3))
+        self._connections = []
+        self._workers = []
+        for index in range(num_workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_run_worker,
+                                             args=(worker_connection, index, num_workers, cell_size, tracker_args),
+                                             daemon=True)
+            worker.start()
+            # only the worker holds its end, so that reading from a worker that died fails instead of blocking
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+    def update(self,
+               objects: List[TrackedObject],
+               now: float = None):
+        now = time.time() if now is None else now
+        positions = np.asarray([obj.pos for obj in objects], dtype=float).reshape(-1, 3)
+        sources = [obj.sources for obj in objects]
+        routes = _route(positions, self.cell_size, self.margin, self.num_workers)
+
+        try:
+            # every worker runs its update before any result is collected
+            for index, connection in enumerate(self._connections):
+                routed = np.flatnonzero(routes[:, index])
+                connection.send((positions[routed], [sources[i] for i in routed], now))
+            reports = [connection.recv() for connection in self._connections]
+        except (EOFError, OSError) as e:
+            raise RuntimeError("a tracking worker exited, worker exit codes {}".format(
+                [worker.exitcode for worker in self._workers])) from e
+
+        self._ids, self._positions = self._merger.merge(reports, now)
+
+    def get_tracks(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._ids, self._positions
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                # the worker already exited
+                pass
+            connection.close()
+        for worker in self._workers:
+            worker.join()
@@ -1,58 +1,94 @@
 import logging
-from typing import List
+from typing import List, Union
 
+from circum.utils.state.spatial import SpatialIndex, get_index
 from circum.utils.state.tracking import ObjectTracker, TrackedObject
 
 import numpy as np
 
-import scipy.spatial.distance as dist
-
 
 logger = logging.getLogger(__name__)
 
 
 class SimpleTracker(ObjectTracker):
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 index: Union[str, SpatialIndex] = None,
+                 threshold: float = 10,
+                 **kwargs):
+        """
+        When a spatial index is given, only detections closer than threshold to
+        a tracked object are considered for it. Without an index every pair is
+        scored and threshold is unused.
+        """
         super().__init__(*args, **kwargs)
+        self._index = get_index(index)
+        self._threshold = threshold
+
+    def _closest(self,
+                 object_positions: np.ndarray,
+                 new_positions: np.ndarray):
+        """
+        Returns the tracked rows ordered by the distance to their closest
+        detection and the matching detection columns.
+        """
+        if self._index is None:
+            import scipy.spatial.distance as dist
+            distances = dist.cdist(object_positions, new_positions)
+            rows = distances.min(axis=1).argsort()
+            cols = distances.argmin(axis=1)[rows]
+            return rows, cols
+
+        graph = self._index.candidates(object_positions, new_positions, self._threshold)
+
+        # the closest candidate for each tracked object
+        order = np.lexsort((graph.costs, graph.cols))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = graph.cols[order][1:] != graph.cols[order][:-1]
+        closest = order[first]
+
+        closest = closest[graph.costs[closest].argsort()]
+        return graph.cols[closest], graph.rows[closest]
 
     def _track(self,
                objects: List[TrackedObject]) -> List[TrackedObject]:
         now = self._now()
-        tracked_objects = self.get_objects()
+        table = self._objects
+        slots = table.ordered_slots()
 
-        if len(tracked_objects) == 0:
+        if len(slots) == 0:
             return objects
         elif len(objects) == 0:
             return []
         else:
-            object_ids = [obj.id for obj in tracked_objects]
-            object_positions = [obj.pos for obj in tracked_objects]
             new_positions = [obj.pos for obj in objects]
 
-            distances = dist.cdist(np.asarray(object_positions), np.asarray(new_positions))
-
-            rows = distances.min(axis=1).argsort()
-            cols = distances.argmin(axis=1)[rows]
+            rows, cols = self._closest(table.positions[slots], np.asarray(new_positions))
 
             used_rows = set()
             used_cols = set()
+            matched_rows = []
+            matched_cols = []
 
             for (row, col) in zip(rows, cols):
                 if row in used_rows or col in used_cols:
                     continue
 
-                id_ = object_ids[row]
-                self._objects[id_].pos = new_positions[col]
-                self._objects[id_].history.append(new_positions[col])
-                self._objects[id_].last_seen = now
+                matched_rows.append(row)
+                matched_cols.append(col)
 
                 # indicate that we have examined each of the row and
                 # column indexes, respectively
                 used_rows.add(row)
                 used_cols.add(col)
 
-            if distances.shape[0] < distances.shape[1]:
-                unused_cols = set(range(0, distances.shape[1])).difference(used_cols)
-                return [objects[col] for col in unused_cols]
+            matched = slots[matched_rows]
+            table.positions[matched] = np.asarray(new_positions)[matched_cols]
+            table.last_seen[matched] = now
+            table.hits[matched] += 1
+            table.record(matched, table.positions[matched], now)
+
+            if self._index is not None or len(slots) < len(objects):
+                return [obj for col, obj in enumerate(objects) if col not in used_cols]
             else:
                 return []
@@ -0,0 +1,118 @@
+import abc
+import itertools
+import math
+from typing import Union
+
+from circum.utils.state.association import CostGraph
+
+import numpy as np
+
+
+# large primes used to hash integer cell coordinates, collisions only add candidates that are filtered by distance
+_cell_primes = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+
+def _pairs(rows: np.ndarray,
+           cols: np.ndarray,
+           tracked: np.ndarray,
+           detected: np.ndarray,
+           radius: float) -> CostGraph:
+    costs = np.linalg.norm(detected[rows] - tracked[cols], axis=1)
+    within = costs < radius
+    return CostGraph(rows[within], cols[within], costs[within], (len(detected), len(tracked)))
+
+
+class SpatialIndex(abc.ABC):
+    """
+    Finds the (detection, track) pairs that are closer than a radius without
+    scoring every pair. The result is a sparse CostGraph whose rows are
+    detections and whose columns are tracks.
+    """
+
+    @abc.abstractmethod
+    def candidates(self,
+                   tracked: np.ndarray,
+                   detected: np.ndarray,
+                   radius: float) -> CostGraph:
+        pass
+
+
+class KDTreeIndex(SpatialIndex):
+    def candidates(self,
+                   tracked: np.ndarray,
+                   detected: np.ndarray,
+                   radius: float) -> CostGraph:
+        tracked = np.asarray(tracked, dtype=float)
+        detected = np.asarray(detected, dtype=float)
+
+        from scipy.spatial import cKDTree
+        neighbors = cKDTree(tracked).query_ball_point(detected, r=radius)
+        counts = np.fromiter((len(n) for n in neighbors), dtype=int, count=len(neighbors))
+        rows = np.repeat(np.arange(len(detected)), counts)
+        cols = np.fromiter(itertools.chain.from_iterable(neighbors), dtype=int, count=counts.sum())
+
+        return _pairs(rows, cols, tracked, detected, radius)
+
+
+class GridIndex(SpatialIndex):
+    def __init__(self,
+                 cell_size: float = None):
+        """
+        A uniform grid hash. cell_size defaults to the query radius.
+        """
+        self.cell_size = cell_size
+
+    def candidates(self,
+                   tracked: np.ndarray,
+                   detected: np.ndarray,
+                   radius: float) -> CostGraph:
+        tracked = np.asarray(tracked, dtype=float)
+        detected = np.asarray(detected, dtype=float)
+        cell_size = radius if self.cell_size is None else self.cell_size
+        dims = tracked.shape[1]
+        primes = _cell_primes[:dims]
+
+        track_cells = np.floor(tracked / cell_size).astype(np.int64)
+        detected_cells = np.floor(detected / cell_size).astype(np.int64)
+
+        track_keys = track_cells @ primes
+        order = np.argsort(track_keys, kind="stable")
+        sorted_keys = track_keys[order]
+
+        reach = int(math.ceil(radius / cell_size))
+        all_rows = []
+        all_cols = []
+        for offset in itertools.product(range(-reach, reach + 1), repeat=dims):
+            keys = (detected_cells + offset) @ primes
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            counts = np.searchsorted(sorted_keys, keys, side="right") - lo
+
+            total = counts.sum()
+            if total == 0:
+                continue
+            within_cell = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            all_rows.append(np.repeat(np.arange(len(detected)), counts))
+            all_cols.append(order[np.repeat(lo, counts) + within_cell])
+
+        if len(all_rows) == 0:
+            return _pairs(np.empty(0, dtype=int), np.empty(0, dtype=int), tracked, detected, radius)
+
+        # hash collisions can report the same pair for more than one cell
+        pair_keys = np.unique(np.concatenate(all_rows) * len(tracked) + np.concatenate(all_cols))
+        rows, cols = np.divmod(pair_keys, len(tracked))
+
+        return _pairs(rows, cols, tracked, detected, radius)
+
+
+indexes = {
+    "kdtree": KDTreeIndex,
+    "grid": GridIndex,
+}
+
+
+def get_index(index: Union[str, SpatialIndex, None]) -> Union[SpatialIndex, None]:
+    if index is None or isinstance(index, SpatialIndex):
+        return index
+    if index not in indexes:
+        raise ValueError("unknown spatial index {}, expected one of {}".format(index, list(indexes)))
+    return indexes[index]()
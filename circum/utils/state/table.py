@@ -0,0 +1,65 @@
+from typing import Tuple
+
+import numpy as np
+
+
+class SlotTable:
+    """
+    Preallocated, column oriented storage. Every column is an array whose
+    first axis is the slot, rows are addressed by slot and slots are recycled
+    through a free list once released. When the table is full every column
+    doubles in size.
+    """
+
+    def __init__(self,
+                 capacity: int = 16):
+        self.active = np.zeros(capacity, dtype=bool)
+        self._columns = {}
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    @property
+    def capacity(self) -> int:
+        return len(self.active)
+
+    def add_column(self,
+                   name: str,
+                   shape: Tuple[int, ...] = (),
+                   dtype=float,
+                   fill=0):
+        """
+        Adds a column that is available as an attribute of the table. Adding a
+        column that already exists keeps the existing one.
+        """
+        if name in self._columns:
+            return
+        self._columns[name] = (shape, dtype, fill)
+        setattr(self, name, np.full((self.capacity,) + tuple(shape), fill, dtype=dtype))
+
+    def _grow(self):
+        capacity = self.capacity
+        self.active = np.concatenate((self.active, np.zeros_like(self.active)))
+        for name, (shape, dtype, fill) in self._columns.items():
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate((column, np.full((capacity,) + tuple(shape), fill, dtype=dtype))))
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def allocate(self) -> int:
+        if len(self._free) == 0:
+            self._grow()
+        slot = self._free.pop()
+        for name, (_, _, fill) in self._columns.items():
+            getattr(self, name)[slot] = fill
+        self.active[slot] = True
+        return slot
+
+    def release(self,
+                slot: int):
+        if self.active[slot]:
+            self.active[slot] = False
+            self._free.append(slot)
+
+    def slots(self) -> np.ndarray:
+        return np.flatnonzero(self.active)
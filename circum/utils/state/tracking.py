@@ -1,6 +1,9 @@
+import heapq
 import logging
-from collections import OrderedDict
-from datetime import datetime, timedelta
+import time
+from typing import Callable, List, Tuple
+
+from circum.utils.state.table import SlotTable
 
 import numpy as np
 
@@ -9,13 +12,24 @@ logger = logging.getLogger(__name__)
 
 
 class TrackedObject:
-    def __init__(self, pos: np.ndarray):
+    def __init__(self,
+                 pos: np.ndarray,
+                 timestamp: float = None):
+        """
+        timestamp is when the object was detected in seconds on the tracker's
+        clock, when it is not given the tracker stamps the object with its
+        current time when registering it. sources holds keys
+        that identify the detection across updates, such as the track ids of
+        an upstream service, a tracker keeps following the track a key was
+        last associated with.
+        """
         self.pos = pos
-        self.last_seen = self._now()
+        self.last_seen = timestamp
         self.id = None
         self.tracking_ctx = None
-        self.created = self._now()
+        self.created = timestamp
         self.history = []
+        self.sources = []
 
     def __hash__(self):
         return int(id(self) / 16)
@@ -28,51 +42,358 @@ class TrackedObject:
     def __str__(self):
         return "Tracked Object {{id = {}, pos = {}, last_seen = {}}}".format(self.id, self.pos, self.last_seen)
 
-    def _now(self):
-        return datetime.now()
+
+class TrackView(TrackedObject):
+    """
+    A TrackedObject backed by a row of a TrackTable. Reads and writes go
+    straight to the table, so a view is only valid while its track exists.
+    Copying a view returns a plain TrackedObject holding a snapshot of the
+    track.
+    """
+
+    def __init__(self,
+                 table: "TrackTable",
+                 slot: int):
+        self._table = table
+        self.slot = slot
+        self.tracking_ctx = None
+
+    @property
+    def id(self) -> int:
+        return int(self._table.ids[self.slot])
+
+    @property
+    def pos(self) -> np.ndarray:
+        return self._table.positions[self.slot]
+
+    @pos.setter
+    def pos(self, pos: np.ndarray):
+        self._table.positions[self.slot] = pos
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self._table.velocities[self.slot]
+
+    @property
+    def last_seen(self) -> float:
+        return float(self._table.last_seen[self.slot])
+
+    @last_seen.setter
+    def last_seen(self, last_seen: float):
+        self._table.last_seen[self.slot] = last_seen
+        self._table.schedule(self.slot)
+
+    @property
+    def created(self) -> float:
+        return float(self._table.created[self.slot])
+
+    @created.setter
+    def created(self, created: float):
+        self._table.created[self.slot] = created
+        self._table.schedule(self.slot)
+
+    @property
+    def history(self) -> np.ndarray:
+        return self._table.trail(self.slot)
+
+    @property
+    def hits(self) -> int:
+        return int(self._table.hits[self.slot])
+
+    def snapshot(self) -> TrackedObject:
+        obj = TrackedObject.__new__(TrackedObject)
+        obj.pos = self.pos.copy()
+        obj.last_seen = self.last_seen
+        obj.id = self.id
+        obj.tracking_ctx = None
+        obj.created = self.created
+        obj.history = list(self.history)
+        return obj
+
+    def __copy__(self):
+        return self.snapshot()
+
+    def __deepcopy__(self, memo):
+        return self.snapshot()
+
+
+class TrackTable(SlotTable):
+    """
+    The tracks of an ObjectTracker stored column wise, one slot per track.
+    Trackers work on the columns directly; TrackViews are only created for
+    callers that ask for tracks as objects. Tracks are ordered by id, which is
+    the order they were registered in.
+
+    The positions a track was seen at are kept in a ring buffer of a fixed
+    length per track. history_window optionally limits trails to the
+    positions seen within that many seconds of the latest one.
+
+    The table also keeps a heap of when each track expires so that finding
+    the tracks to prune does not look at every track. A heap entry may be
+    earlier than the track's actual expiry, which only moves later as the
+    track is seen, stale entries are rescheduled when they are popped. Only
+    writes that can move an expiry earlier, such as through a TrackView,
+    need to schedule the track again.
+    """
+
+    def __init__(self,
+                 capacity: int = 16,
+                 deletion_threshold: float = 5,
+                 history_length: int = 32,
+                 history_window: float = None):
+        super().__init__(capacity)
+        self.deletion_threshold = deletion_threshold
+        self.history_length = history_length
+        self.history_window = history_window
+        self._expiry = []
+        self.add_column("ids", dtype=np.int64, fill=-1)
+        self.add_column("positions", (3,))
+        self.add_column("velocities", (3,))
+        self.add_column("created")
+        self.add_column("last_seen")
+        self.add_column("hits", dtype=np.int64)
+        self.add_column("history", (history_length, 3), fill=np.nan)
+        self.add_column("history_time", (history_length,), fill=np.nan)
+        self.add_column("history_count", dtype=np.int64)
+        self._slots = {}
+
+    def add(self,
+            obj: TrackedObject) -> int:
+        slot = self.allocate()
+        self.ids[slot] = obj.id
+        self.positions[slot] = obj.pos
+        self.created[slot] = obj.created
+        self.last_seen[slot] = obj.last_seen
+        self.hits[slot] = 1
+        for pos in obj.history:
+            self.record([slot], [pos], obj.created)
+        self.record([slot], [obj.pos], obj.last_seen)
+        self._slots[obj.id] = slot
+        self.schedule(slot)
+        return slot
+
+    def record(self,
+               slots: np.ndarray,
+               positions: np.ndarray,
+               timestamp: float):
+        """
+        Appends a position to the history of each track, overwriting the
+        oldest once the history is full.
+        """
+        slots = np.asarray(slots, dtype=int)
+        index = self.history_count[slots] % self.history_length
+        self.history[slots, index] = positions
+        self.history_time[slots, index] = timestamp
+        self.history_count[slots] += 1
+
+    def trails(self,
+               slots: np.ndarray,
+               n: int = None) -> np.ndarray:
+        """
+        The last n positions of each track as a (len(slots), n, 3) array,
+        oldest first. Tracks with a shorter history are padded at the start
+        with NaN.
+        """
+        slots = np.asarray(slots, dtype=int)
+        n = self.history_length if n is None else min(n, self.history_length)
+        offsets = self.history_count[slots, None] - n + np.arange(n)
+        index = offsets % self.history_length
+        valid = offsets >= 0
+        if self.history_window is not None:
+            times = self.history_time[slots[:, None], index]
+            latest = self.history_time[slots, (self.history_count[slots] - 1) % self.history_length]
+            valid &= times >= latest[:, None] - self.history_window
+
+        trails = self.history[slots[:, None], index]
+        trails[~valid] = np.nan
+        return trails
+
+    def trail(self,
+              slot: int,
+              n: int = None) -> np.ndarray:
+        trail = self.trails([slot], n)[0]
+        return trail[~np.isnan(trail[:, 0])]
+
+    def expiry(self,
+               slots: np.ndarray) -> np.ndarray:
+        """
+        When tracks expire if they are not seen again. A track expires once it
+        has not been seen for the deletion threshold or, when it is older than
+        the threshold, once it has not been seen for more than 60% of its life.
+        """
+        last_seen = self.last_seen[slots]
+        created = self.created[slots]
+        not_seen_for_most_of_life = np.maximum(created + self.deletion_threshold,
+                                               last_seen + 1.5 * (last_seen - created))
+        return np.minimum(last_seen + self.deletion_threshold, not_seen_for_most_of_life)
+
+    def schedule(self,
+                 slot: int):
+        heapq.heappush(self._expiry, (float(self.expiry(slot)), int(self.ids[slot]), int(slot)))
+
+    def expired(self,
+                now: float) -> List[int]:
+        """
+        The slots of the tracks that expired before now.
+        """
+        expired = []
+        while len(self._expiry) > 0 and self._expiry[0][0] < now:
+            _, id_, slot = heapq.heappop(self._expiry)
+            if self._slots.get(id_) != slot or slot in expired:
+                # the track was removed or is already expired
+                continue
+            expiry = float(self.expiry(slot))
+            if expiry < now:
+                expired.append(slot)
+            else:
+                heapq.heappush(self._expiry, (expiry, id_, slot))
+        return expired
+
+    def pop(self,
+            id_: int) -> TrackedObject:
+        obj = self[id_].snapshot()
+        self.release(self._slots.pop(id_))
+        return obj
+
+    def ordered_slots(self) -> np.ndarray:
+        slots = self.slots()
+        return slots[np.argsort(self.ids[slots], kind="stable")]
+
+    def view(self,
+             slot: int) -> TrackView:
+        return TrackView(self, slot)
+
+    def values(self) -> List[TrackView]:
+        return [TrackView(self, slot) for slot in self.ordered_slots()]
+
+    def __getitem__(self, id_: int) -> TrackView:
+        return TrackView(self, self._slots[id_])
+
+    def __contains__(self, id_: int) -> bool:
+        return id_ in self._slots
 
 
 class ObjectTracker:
-    def __init__(self, deletion_threshold: int = 5):
-        self._objects = OrderedDict()
+    def __init__(self,
+                 deletion_threshold: int = 5,
+                 clock: Callable[[], float] = time.monotonic,
+                 history_length: int = 32,
+                 history_window: float = None):
+        """
+        clock returns the current time in seconds, every timestamp the tracker
+        handles is on this clock. history_length and history_window bound the
+        history kept for each track, see TrackTable.
+        """
+        self._objects = TrackTable(deletion_threshold=deletion_threshold,
+                                   history_length=history_length,
+                                   history_window=history_window)
         self._next = 0
+        # source key -> id of the track it was last associated with, and the keys bound to each track
+        self._sources = {}
+        self._source_keys = {}
         self._deletion_threshold = deletion_threshold
+        self._clock = clock
+        self._update_time = None
 
-    def update(self, objects: [TrackedObject]):
-        new_objs = self._track(objects)
+    def update(self,
+               objects: [TrackedObject],
+               now: float = None):
+        """
+        Updates the tracks with the objects detected at now, which defaults to
+        the current time on the tracker's clock.
+        """
+        self._update_time = now
+        try:
+            new_objs = self._track(objects)
 
-        for obj in new_objs:
-            self._register(obj)
+            for obj in new_objs:
+                self._register(obj)
 
-        self._prune()
+            self._prune()
+        finally:
+            self._update_time = None
 
     def get_objects(self) -> [TrackedObject]:
-        return list(self._objects.values())
+        return self._objects.values()
+
+    def get_tracks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The ids and positions of every track, without creating any objects.
+        """
+        slots = self._objects.ordered_slots()
+        return self._objects.ids[slots], self._objects.positions[slots]
+
+    def get_trails(self,
+                   n: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The ids and the last n positions of every track, see TrackTable.trails.
+        """
+        slots = self._objects.ordered_slots()
+        return self._objects.ids[slots], self._objects.trails(slots, n)
 
     def _prune(self):
         now = self._now()
-        to_prune = []
-        for obj in self._objects.values():
-            time_since_last_seen = (now - obj.last_seen) / timedelta(seconds=1)
-            time_since_created = (now - obj.created) / timedelta(seconds=1)
+        for slot in self._objects.expired(now):
+            obj = self._objects.view(slot)
+            time_since_last_seen = now - obj.last_seen
             if time_since_last_seen > self._deletion_threshold:
                 # delete if it has been too long since we've seen the object
                 logger.debug("pruning {} because it hasn't been seen in {} seconds".format(obj.id,
                                                                                            time_since_last_seen))
-                to_prune.append(obj)
-            elif time_since_created > self._deletion_threshold and time_since_last_seen / time_since_created > .6:
+            else:
                 # delete if we haven't seen most its life
                 logger.debug("pruning {} because it hasn't been seen for the majority of its life".format(obj.id))
-                to_prune.append(obj)
+            self._remove(obj)
 
-        for obj in to_prune:
-            self._objects.pop(obj.id)
-            logger.debug("pruned: {}".format(obj))
+    def _remove(self, obj: TrackedObject):
+        for key in self._source_keys.pop(obj.id, ()):
+            self._sources.pop(key, None)
+        logger.debug("pruned: {}".format(self._objects.pop(obj.id)))
 
-    def _register(self, obj: TrackedObject):
+    def _register(self, obj: TrackedObject) -> int:
+        if obj.created is None:
+            obj.created = self._now()
+        if obj.last_seen is None:
+            obj.last_seen = obj.created
         obj.id = self._get_next_object_id()
-        self._objects[obj.id] = obj
+        slot = self._objects.add(obj)
+        self._bind(obj.sources, obj.id)
         logger.debug("registered new object: {}".format(obj))
+        return slot
+
+    def _bind(self,
+              keys: List,
+              id_: int):
+        for key in keys:
+            previous = self._sources.get(key)
+            if previous == id_:
+                continue
+            if previous is not None:
+                self._source_keys[previous].discard(key)
+            self._sources[key] = id_
+            self._source_keys.setdefault(id_, set()).add(key)
+
+    def _bound(self,
+               detected: List[TrackedObject]) -> Tuple[List[Tuple[int, TrackedObject]], List[TrackedObject]]:
+        """
+        Splits detected into the detections with a source key bound to a track,
+        paired with that track's slot, and the rest. Every track is paired with
+        at most one detection.
+        """
+        if len(self._sources) == 0:
+            return [], detected
+        bound = []
+        remaining = []
+        used = set()
+        for obj in detected:
+            ids = [self._sources[key] for key in obj.sources if key in self._sources]
+            id_ = next((id_ for id_ in ids if id_ not in used), None)
+            if id_ is None:
+                remaining.append(obj)
+            else:
+                used.add(id_)
+                bound.append((self._objects._slots[id_], obj))
+        return bound, remaining
 
     def _track(self, objects: [TrackedObject]) -> [TrackedObject]:
         return objects
@@ -82,5 +403,7 @@ class ObjectTracker:
         self._next += 1
         return _id
 
-    def _now(self) -> datetime:
-        return datetime.now()
+    def _now(self) -> float:
+        if self._update_time is not None:
+            return self._update_time
+        return self._clock()
@@ -0,0 +1,109 @@
+"""
+Follows frames from the sensor to the clients of the service. A frame is
+identified by the endpoint it came from and its sequence number, and is
+stamped when it is captured, sent by the endpoint, received by the service,
+tracked and queued for the clients. The time between consecutive stamps is
+a hop, each of which is aggregated into a histogram and can be exported as
+Chrome trace events, which chrome://tracing and Perfetto open.
+
+Stamps are wall clock times taken on different hosts, so hops between hosts
+are only as accurate as their clocks are synchronized. The last stamp is
+taken when the update is handed to the clients without waiting for it to be
+written, clients that are behind show in the broadcaster metrics instead.
+"""
+import json
+import threading
+from collections import deque
+from typing import Dict, List, Tuple
+
+from circum.utils import metrics
+from circum.utils.encoding import Frame
+
+# the stamps of a frame, in order, and the hops between them
+stamps = ("capture", "sent", "received", "tracked", "queued")
+hops = ("endpoint", "network", "tracker", "queued")
+
+
+class Tracer:
+    """
+    Aggregates the hops of every recorded frame into histograms and, once
+    keep has been called, holds the stamps of the most recent frames for
+    export.
+    """
+
+    def __init__(self,
+                 registry: metrics.Registry = metrics.registry):
+        help_text = "Time frames spend in each hop from sensor capture until queued for the clients."
+        self.histograms = {hop: registry.histogram("circum_hop_seconds", help_text, hop=hop)
+                           for hop in hops + ("total",)}
+        self.frames = None
+        self._lock = threading.Lock()
+
+    def keep(self,
+             capacity: int = 100000):
+        """
+        Holds the stamps of the last capacity frames.
+        """
+        self.frames = deque(maxlen=capacity)
+
+    def record(self,
+               frame: Frame,
+               tracked: float,
+               queued: float):
+        """
+        Records a received frame that was tracked and queued for the clients
+        at the given times. Hops with a missing stamp are skipped.
+        """
+        times = (frame.timestamp, frame.sent, frame.received, tracked, queued)
+        for hop, start, end in zip(hops, times, times[1:]):
+            if start and end:
+                self.histograms[hop].observe(end - start)
+        if frame.timestamp:
+            self.histograms["total"].observe(queued - frame.timestamp)
+        if self.frames is not None:
+            with self._lock:
+                self.frames.append((frame.source, frame.seq, times))
+
+    def record_updates(self,
+                       tracked: List[Tuple[List[Frame], float]],
+                       queued: float):
+        """
+        Records the frames of tracker updates, given with the time each update
+        finished, whose result was queued for the clients at queued.
+        """
+        for frames, tracked_time in tracked:
+            for received in frames:
+                self.record(received, tracked_time, queued)
+
+    def events(self) -> List[Dict]:
+        """
+        The kept frames as Chrome trace events, an async span per hop on a
+        row per endpoint.
+        """
+        with self._lock:
+            frames = list(self.frames or ())
+        rows = {}
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "circum"}}]
+        for source, seq, times in frames:
+            if source not in rows:
+                rows[source] = len(rows) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": rows[source],
+                               "args": {"name": str(source)}})
+            frame_id = "{}:{}".format(source, seq)
+            for hop, start, end in zip(hops, times, times[1:]):
+                if not start or not end or end < start:
+                    continue
+                event = {"name": hop, "cat": "frame", "id": frame_id, "pid": 1, "tid": rows[source],
+                         "args": {"frame": frame_id}}
+                events.append(dict(event, ph="b", ts=start * 1e6))
+                events.append(dict(event, ph="e", ts=end * 1e6))
+        return events
+
+    def export(self,
+               path: str):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+
+# the tracer the service records into
+tracer = Tracer()
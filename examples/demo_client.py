@@ -1,12 +1,11 @@
-import bson
 import click
 import logging
 import select
-import struct
 import time
 from threading import Semaphore, Thread
 
-from circum.utils.network import ServiceListener
+from circum.utils.encoding import Frame, PACKED, decode, formats
+from circum.utils.network import FrameReader, ServiceListener
 
 from matplotlib import pyplot as plt
 from matplotlib import animation
@@ -19,11 +18,9 @@ from zeroconf import Zeroconf, ServiceBrowser
 
 
 logger = logging.getLogger(__name__)
-size_fmt = "!i"
-size_data_len = struct.calcsize(size_fmt)
 
 semaphore = Semaphore()
-data = {"objects": []}
+data = Frame(np.empty((0, 3)), np.empty(0, dtype=int))
 
 class RenderAnimation(animation.TimedAnimation):
     def __init__(self):
@@ -89,10 +86,10 @@ class RenderAnimation(animation.TimedAnimation):
         global data
         semaphore.acquire()
 
-        x = [person["x"] for person in data["objects"]]
-        y = [person["y"] for person in data["objects"]]
-        z = [person["z"] for person in data["objects"]]
-        ids = [person["id"] for person in data["objects"]]
+        x = data.positions[:, 0].tolist()
+        y = data.positions[:, 1].tolist()
+        z = data.positions[:, 2].tolist()
+        ids = data.ids.tolist()
         semaphore.release()
 
         if len(x) > 0:
@@ -120,6 +117,7 @@ def _listen_thread(listener: ServiceListener):
     global data
 
     service_sockets = []
+    readers = {}
 
     while True:
         service_sockets = listener.get_sockets()
@@ -128,14 +126,22 @@ def _listen_thread(listener: ServiceListener):
         if len(service_sockets) > 0:
             ready, _, excepted = select.select(service_sockets, [], [])
             for ready_socket in ready:
-                size_data = ready_socket.recv(size_data_len)
-                size = struct.unpack(size_fmt, size_data)[0]
-                bson_data = ready_socket.recv(size)
-                update_data = bson.loads(bson_data)
-
-                semaphore.acquire()
-                data = update_data
-                semaphore.release()
+                if ready_socket not in readers:
+                    readers[ready_socket] = FrameReader(ready_socket)
+                try:
+                    frames = readers[ready_socket].read()
+                except OSError:
+                    readers.pop(ready_socket)
+                    listener.remove(ready_socket)
+                    continue
+
+                # only the newest frame is drawn
+                if len(frames) > 0:
+                    update_data = decode(bytes(frames[-1]))
+
+                    semaphore.acquire()
+                    data = update_data
+                    semaphore.release()
             for excepted_socket in excepted:
                 listener.remove(excepted_socket)
         else:
@@ -157,7 +163,12 @@ def _start_client(listener: ServiceListener):
               type=str,
               required=True,
               help='Names of the service to connect to.')
-def cli(service: str):
+@click.option('--format',
+              'fmt',
+              type=click.Choice(formats),
+              default=PACKED,
+              help='The frame format to request from the service.')
+def cli(service: str, fmt: str):
     global logger
     logging.basicConfig(level="INFO")
     logger = logging.getLogger("demo_client")
@@ -165,7 +176,7 @@ def cli(service: str):
 
     zeroconf = Zeroconf()
     endpoint_type = "_service._sub._circum._tcp.local."
-    listener = ServiceListener([service + "." + endpoint_type])
+    listener = ServiceListener([service + "." + endpoint_type], fmt)
     browser = ServiceBrowser(zeroconf, endpoint_type, listener)  # noqa
 
     try:
@@ -23,11 +23,11 @@ setup(
         'Programming Language :: Python',
         'Operating System :: OS Independent',
     ],
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     install_requires=[
         'bson',
         'click',
-        'matplotlib',
+        'importlib_metadata; python_version < "3.8"',
         'mock',
         'munkres',
         'numpy',
@@ -56,6 +56,9 @@ setup(
         ],
     },
     extras_require={
+        'demo': [
+            'matplotlib',
+        ],
         'lint': [
             'flake8',
             'flake8-import-order',
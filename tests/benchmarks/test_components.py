@@ -0,0 +1,40 @@
+import json
+
+from benchmarks.components import benchmarks, cli, run
+from benchmarks.harness import compare
+
+from click.testing import CliRunner
+
+import pytest
+
+
+@pytest.mark.parametrize("name", list(benchmarks))
+def test_benchmark_runs(name):
+    results = run([name], [3], min_time=0)
+
+    assert [result["n"] for result in results] == [3]
+    assert results[0]["iterations"] >= 5
+    assert results[0]["p50_us"] <= results[0]["p99_us"]
+
+
+def test_compare():
+    baseline = [{"name": "a", "n": 1, "p50_us": 10.}, {"name": "b", "n": 1, "p50_us": 10.}]
+    results = [{"name": "a", "n": 1, "p50_us": 11.}, {"name": "b", "n": 1, "p50_us": 20.},
+               {"name": "c", "n": 1, "p50_us": 20.}]
+
+    regressions = compare(results, baseline, .25)
+
+    assert [(regression["name"], regression["ratio"]) for regression in regressions] == [("b", 2)]
+
+
+def test_cli_output(tmp_path):
+    output = str(tmp_path / "results.json")
+
+    result = CliRunner().invoke(cli, ["-b", "encode_packed", "--sizes", "1,2", "--min-time", "0", "-o", output])
+
+    assert result.exit_code == 0
+    with open(output) as f:
+        report = json.load(f)
+    names = [(result["name"], result["n"]) for result in report["results"]]
+    assert names == [("encode_packed", 1), ("encode_packed", 2)]
+    assert "numpy" in report["environment"]
@@ -0,0 +1,12 @@
+from benchmarks.load import run_load
+
+
+def test_load_reports_deliveries():
+    report = run_load(num_endpoints=2, num_objects=3, rate=20, num_clients=2, duration=1, warmup=.5,
+                      endpoint_processes=1)
+
+    assert report["endpoint_frames_per_sec"] > 0
+    assert report["client_frames_per_sec"] > 0
+    assert report["client_objects_per_sec"] >= report["client_frames_per_sec"]
+    assert report["dropped"] is not None
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["max"]
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+from benchmarks.startup import commands, run
+
+
+def test_startup_runs():
+    results = run(["import circum.endpoint"], repeat=1)
+
+    assert [result["name"] for result in results] == ["import circum.endpoint"]
+    assert results[0]["iterations"] == 1
+    assert set(commands) >= {"circum-endpoint --help", "circum --help"}
+
+
+def test_endpoint_help_does_not_import_plugins():
+    script = ("import sys\n"
+              "from circum import endpoint\n"
+              "try:\n"
+              "    endpoint.cli(['--help'], obj={})\n"
+              "except SystemExit:\n"
+              "    pass\n"
+              "assert 'circum.sensors.simulator' not in sys.modules\n"
+              "assert 'circum.pose.static' not in sys.modules\n")
+
+    subprocess.run([sys.executable, "-c", script], check=True, stdout=subprocess.DEVNULL)  # noqa: S603
@@ -0,0 +1,36 @@
+import time
+from threading import Thread
+
+from circum.sensors.feed import SensorFeed
+
+
+def test_get_returns_latest():
+    feed = SensorFeed()
+    feed.push({"objects": [1]})
+    feed.push({"objects": [2]})
+
+    assert feed.get(0) == {"objects": [2]}
+    assert feed.replaced == 1
+    assert feed.get(0) is None
+
+
+def test_get_blocks_until_pushed():
+    feed = SensorFeed()
+
+    def _push():
+        time.sleep(.05)
+        feed.push({"objects": []})
+
+    thread = Thread(target=_push)
+    thread.start()
+    assert feed.get(5) == {"objects": []}
+    thread.join()
+
+
+def test_iterate_until_closed():
+    feed = SensorFeed()
+    feed.push({"objects": []})
+    feed.close()
+
+    assert list(feed) == [{"objects": []}]
+    assert feed.closed
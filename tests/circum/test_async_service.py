@@ -0,0 +1,117 @@
+import asyncio
+import socket
+import struct
+
+import bson
+
+from circum.async_service import _AsyncClient, _run_service_async, size_data_len, size_fmt
+from circum.utils.encoding import Frame, PACKED, decode, encode, format_request
+from circum.utils.network import frame
+from circum.utils.scheduling import UpdateScheduler
+
+import numpy as np
+
+
+class _StaticListener:
+    def __init__(self, sockets):
+        self.sockets = list(sockets)
+
+    def get_sockets(self):
+        return list(self.sockets)
+
+    def name(self, service_socket):
+        return None
+
+    def remove(self, service_socket):
+        if service_socket in self.sockets:
+            self.sockets.remove(service_socket)
+            service_socket.close()
+
+
+def _frame(objects):
+    data = bson.dumps({"objects": objects})
+    return struct.pack(size_fmt, len(data)) + data
+
+
+async def _read_frame(reader):
+    size = struct.unpack(size_fmt, await reader.readexactly(size_data_len))[0]
+    return bson.loads(await reader.readexactly(size))
+
+
+async def _read_packed_frame(reader):
+    size = struct.unpack(size_fmt, await reader.readexactly(size_data_len))[0]
+    return decode(await reader.readexactly(size))
+
+
+class _Writer:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_client_drops_oldest_frame():
+    async def _test():
+        client = _AsyncClient(_Writer(), 2)
+        for i in range(5):
+            client.send(i)
+        assert client.dropped == 3
+        assert [client.queue.get_nowait() for _ in range(2)] == [3, 4]
+
+    asyncio.new_event_loop().run_until_complete(_test())
+
+
+def test_service_round_trip():
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(("127.0.0.1", 0))
+    server_socket.listen()
+    port = server_socket.getsockname()[1]
+
+    endpoint_socket, service_socket = socket.socketpair()
+    listener = _StaticListener([service_socket])
+    tracked = []
+
+    def _track(frames):
+        tracked.append(frames)
+        positions = np.concatenate([f.positions for f in frames])
+        update = Frame(positions, np.arange(len(positions)))
+        return lambda fmt: frame(encode(update, fmt))
+
+    async def _test():
+        service = asyncio.ensure_future(_run_service_async([server_socket], listener, UpdateScheduler(), _track))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(.1)
+
+        endpoint_socket.sendall(_frame([{"x": 1., "y": 2., "z": 3.}]))
+        update = await asyncio.wait_for(_read_frame(reader), 5)
+
+        writer.write(frame(format_request(PACKED)))
+        await asyncio.sleep(.1)
+        endpoint_socket.sendall(_frame([{"x": 4., "y": 5., "z": 6.}]))
+        packed = await asyncio.wait_for(_read_packed_frame(reader), 5)
+
+        writer.close()
+        service.cancel()
+        try:
+            await service
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(.1)
+        return update, packed
+
+    update, packed = asyncio.new_event_loop().run_until_complete(_test())
+
+    assert update == {"objects": [{"x": 1., "y": 2., "z": 3., "id": 0}]}
+    assert np.array_equal(tracked[0][0].positions, [[1, 2, 3]])
+    assert np.array_equal(packed.positions, [[4, 5, 6]])
+    assert np.array_equal(packed.ids, [0])
+
+    endpoint_socket.close()
+    server_socket.close()
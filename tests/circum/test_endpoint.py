@@ -0,0 +1,153 @@
+import bson
+
+from circum import endpoint
+from circum.endpoint import EntryPoint
+from circum.pose.provider import PoseProvider
+from circum.sensors.feed import SensorFeed
+
+import click
+from click.testing import CliRunner
+
+import mock
+
+
+class _Broadcaster:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, encode):
+        self.published.append(encode("bson"))
+
+
+class _Pose(PoseProvider):
+    def __init__(self):
+        super().__init__()
+        self.pose = [0, 0, 0, 0, 0, 0]
+        self.reads = 0
+
+    def get_pose(self):
+        self.reads += 1
+        return self.pose
+
+
+def _payloads(broadcaster):
+    return [bson.loads(data[4:]) for data in broadcaster.published]
+
+
+def test_endpoint_thread_feed():
+    feed = SensorFeed()
+    feed.push({"objects": [{"x": 1., "y": 2., "z": 3.}], "timestamp": 12.5})
+    feed.close()
+    broadcaster = _Broadcaster()
+
+    endpoint._endpoint_thread(feed, broadcaster, _Pose(), None)
+
+    payloads = _payloads(broadcaster)
+    # frames are stamped with the time they were sent
+    assert payloads[0].pop("sent") >= 12.5
+    assert payloads == [{"objects": [{"x": 1., "y": 2., "z": 3.}], "timestamp": 12.5, "seq": 0}]
+
+
+def test_endpoint_thread_polled_sleeps_when_idle():
+    updates = iter([None, {"objects": []}, None])
+    broadcaster = _Broadcaster()
+
+    def _sensor(args):
+        try:
+            return next(updates)
+        except StopIteration:
+            raise KeyboardInterrupt()
+
+    with mock.patch("circum.endpoint.time.sleep") as sleep:
+        try:
+            endpoint._endpoint_thread(_sensor, broadcaster, _Pose(), None)
+        except KeyboardInterrupt:
+            pass
+
+    assert sleep.call_count == 2
+    assert [payload["objects"] for payload in _payloads(broadcaster)] == [[]]
+    assert _payloads(broadcaster)[0]["timestamp"] > 0
+
+
+def test_endpoint_thread_reads_pose_on_change():
+    updates = [{"objects": [{"x": 1., "y": 0., "z": 0.}]} for _ in range(3)]
+    pose = _Pose()
+    broadcaster = _Broadcaster()
+
+    def _sensor():
+        yield updates[0]
+        yield updates[1]
+        pose.pose = [1, 0, 0, 0, 0, 0]
+        pose.pose_changed()
+        yield updates[2]
+
+    endpoint._endpoint_thread(_sensor(), broadcaster, pose, None)
+
+    assert pose.reads == 2
+    assert [obj["objects"][0]["x"] for obj in _payloads(broadcaster)] == [1., 1., 2.]
+
+
+class _EntryPoint:
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        if self.command is None:
+            raise ImportError("missing sensor SDK")
+        return self.command
+
+
+def _plugin_group(entry_points):
+    @click.group(cls=endpoint._PluginGroup, chain=True)
+    def group():
+        pass
+
+    def _entry_points(group_name):
+        return {entry_point.name.replace("_", "-"): entry_point for entry_point in entry_points.get(group_name, [])}
+
+    return group, mock.patch("circum.endpoint._entry_points", _entry_points)
+
+
+def test_plugins_listed_without_loading():
+    invoked = []
+    sensor = _EntryPoint("fake_sensor", click.Command("fake-sensor", callback=lambda: invoked.append(True)))
+    pose = _EntryPoint("fake_pose", click.Command("fake-pose"))
+    group, patch = _plugin_group({endpoint.sensor_group: [sensor], endpoint.pose_provider_group: [pose]})
+
+    with patch:
+        result = CliRunner().invoke(group, ["--help"])
+        assert result.exit_code == 0
+        assert "fake-sensor" in result.output
+        assert "fake-pose" in result.output
+        assert sensor.loads == 0 and pose.loads == 0
+
+        result = CliRunner().invoke(group, ["fake-sensor"])
+
+    assert result.exit_code == 0
+    assert invoked == [True]
+    assert sensor.loads == 1
+    assert pose.loads == 0
+
+
+def test_plugin_that_fails_to_load():
+    group, patch = _plugin_group({endpoint.sensor_group: [_EntryPoint("broken", None)]})
+
+    with patch:
+        result = CliRunner().invoke(group, ["broken"])
+
+    assert result.exit_code != 0
+    assert "No such command" in result.output
+
+
+def test_entry_points_from_metadata():
+    static_pose = EntryPoint("static_pose", "circum.pose.static:static_pose", endpoint.pose_provider_group)
+
+    # python < 3.10 returns the entry points by group
+    with mock.patch("circum.endpoint.entry_points", return_value={endpoint.pose_provider_group: [static_pose]}):
+        plugins = endpoint._entry_points(endpoint.pose_provider_group)
+
+    assert list(plugins) == ["static-pose"]
+    assert plugins["static-pose"].load().name == "static-pose"
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import pytest
+
+# seconds, generous so that slow CI machines pass, but well below what importing scipy.optimize alone costs there
+import_budget = 1.5
+# modules that are only needed on some code paths and take long to import
+deferred = ("scipy", "munkres", "matplotlib", "asyncio", "http.server")
+
+
+def _import_times(module: str):
+    """
+    The cumulative import time in seconds of module, and the modules
+    imported with it, in a fresh interpreter.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],  # noqa: S603
+                            check=True, stderr=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize("module", ["circum.service", "circum.endpoint"])
+def test_import_time_budget(module):
+    # the fastest of a few runs, the first can be slowed down by a cold disk cache
+    runs = [_import_times(module) for _ in range(3)]
+
+    imported = set(runs[0])
+    assert [name for name in deferred if name in imported] == []
+    assert min(times[module] for times in runs) < import_budget
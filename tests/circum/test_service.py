@@ -0,0 +1,50 @@
+import socket
+from unittest import mock
+
+from circum import service
+from circum.utils.encoding import Frame, PACKED, encode
+from circum.utils.network import FrameReader, frame
+from circum.utils.scheduling import SequentialScheduler, TickScheduler
+from circum.utils.state.kalman_tracker import KalmanTracker
+
+import numpy as np
+
+
+def test_received_frames_outlive_the_read_buffer():
+    a, b = socket.socketpair()
+    try:
+        reader = FrameReader(b)
+        scheduler = SequentialScheduler(reorder_delay=0)
+        for timestamp, pos in ((1, [1., 2, 3]), (2, [9., 9, 9])):
+            a.sendall(frame(encode(Frame(np.array([pos]), timestamp=timestamp), PACKED)))
+            # each frame is returned by its own read, which reuses the buffer of the previous one
+            for data in reader.read():
+                scheduler.on_frame("a", service._decode_received(data, "a"))
+    finally:
+        a.close()
+        b.close()
+
+    batches = scheduler.batches()
+
+    assert [frames[0].positions.tolist() for frames in batches] == [[[1, 2, 3]], [[9, 9, 9]]]
+    assert all(frames[0].source == "a" and frames[0].received > 0 for frames in batches)
+
+
+@mock.patch("circum.service._applied", None)
+@mock.patch("circum.service.tracking_state", KalmanTracker())
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_tick_updates_never_go_back_in_time(now):
+    now.return_value = 100.
+    scheduler = TickScheduler(10)
+    timestamps = []
+
+    # the last frame comes from an endpoint whose clock is behind
+    for tick, timestamp in enumerate((10., 10.1, 10.03)):
+        now.return_value = 100. + tick * .1
+        scheduler.on_frame("a" if tick < 2 else "b", Frame(np.array([[1., 0, 1]]), timestamp=timestamp))
+        assert scheduler.ready()
+        for frames in scheduler.batches():
+            timestamps.append(service._track(frames).timestamp)
+
+    assert timestamps == [10., 10.1, 10.1]
+    assert [obj.last_seen for obj in service.tracking_state.get_objects()] == [10.1]
@@ -0,0 +1,50 @@
+import time
+
+from circum.utils.state.kalman.bank import EKFBank
+from circum.utils.state.kalman.ekf import EKF
+from circum.utils.state.kalman_tracker import _ekf_params
+
+import numpy as np
+
+
+def test_bank_matches_ekf():
+    now = time.monotonic()
+    starts = [np.array([0., 0, 0]), np.array([1., 2, 3]), np.array([-4., 0, 1])]
+
+    bank = EKFBank(_ekf_params(), capacity=2)
+    filters = [EKF(_ekf_params()) for _ in starts]
+    slots = []
+
+    for i, (kf, pos) in enumerate(zip(filters, starts)):
+        kf.start(pos, now + i)
+        slots.append(bank.start(pos, now + i))
+
+    for step in range(1, 5):
+        timestamp = now + 2 + step * .5
+        measurements = [pos + step * np.array([.1, 0, .2]) for pos in starts]
+
+        bank.predict(timestamp, slots)
+        bank.update(slots, np.asarray(measurements), timestamp)
+
+        for kf, measurement in zip(filters, measurements):
+            kf.predict_update(measurement, timestamp)
+
+        for kf, slot in zip(filters, slots):
+            assert np.allclose(kf.get(), bank.x[slot].T)
+            assert np.allclose(kf.kalmanFilter.P, bank.P[slot])
+
+
+def test_bank_release_reuses_slots():
+    now = time.monotonic()
+    bank = EKFBank(_ekf_params(), capacity=1)
+
+    first = bank.start(np.array([0., 0, 0]), now)
+    second = bank.start(np.array([1., 1, 1]), now)
+
+    assert len(bank) == 2
+
+    bank.release(first)
+
+    assert len(bank) == 1
+    assert bank.start(np.array([2., 2, 2]), now) == first
+    assert np.array_equal(bank.positions([first, second]), np.array([[2, 2, 2], [1, 1, 1]]))
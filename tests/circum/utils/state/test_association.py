@@ -0,0 +1,58 @@
+from circum.utils.state.association import associate, gate, get_solver, munkres_solver, scipy_solver
+
+import numpy as np
+
+import pytest
+
+
+def test_gate():
+    distances = np.array([[1, 20],
+                          [30, 2]])
+
+    graph = gate(distances, 10)
+
+    assert list(zip(graph.rows, graph.cols)) == [(0, 0), (1, 1)]
+    assert np.array_equal(graph.costs, [1, 2])
+    assert graph.shape == (2, 2)
+
+
+def test_associate_empty():
+    assert associate(gate(np.full((3, 2), 100.), 10)) == []
+
+
+def test_associate_gated_pair_does_not_block():
+    # without the gate the optimal assignment would pair row 1 with column 0
+    distances = np.array([[1, 11],
+                          [2, 50]])
+
+    assert associate(gate(distances, 10)) == [(0, 0)]
+
+
+@pytest.mark.parametrize("solver", [munkres_solver, scipy_solver])
+def test_associate_components(solver):
+    distances = np.array([[.1, 1, 50, 50],
+                          [.2, .1, 50, 50],
+                          [50, 50, 50, .5],
+                          [50, 50, 50, 50]])
+
+    pairs = associate(gate(distances, 10), solver)
+
+    assert sorted(pairs) == [(0, 0), (1, 1), (2, 3)]
+
+
+def test_solvers_agree():
+    rng = np.random.default_rng(0)
+    detections = rng.random((40, 3)) * 30
+    tracks = detections[rng.permutation(40)[:30]] + rng.normal(0, .2, (30, 3))
+    distances = np.linalg.norm(detections[:, None] - tracks[None], axis=2)
+
+    graph = gate(distances, 2)
+
+    assert sorted(associate(graph, munkres_solver)) == sorted(associate(graph, scipy_solver))
+
+
+def test_get_solver():
+    assert get_solver("munkres") is munkres_solver
+    assert get_solver(scipy_solver) is scipy_solver
+    with pytest.raises(ValueError):
+        get_solver("unknown")
@@ -0,0 +1,52 @@
+from circum.utils.encoding import Frame
+from circum.utils.state.fusion import fuse
+
+import numpy as np
+
+import pytest
+
+
+def _sorted(positions):
+    return positions[np.lexsort(positions.T[::-1])]
+
+
+@pytest.mark.parametrize("index", [None, "grid"])
+def test_fuse_overlapping_endpoints(index):
+    frames = [
+        Frame(np.array([[0., 0, 0], [5, 0, 0]])),
+        Frame(np.array([[.2, 0, 0]])),
+        Frame(np.array([[.1, 0, .3], [9, 0, 0]])),
+    ]
+
+    fused = fuse(frames, .5, index)
+
+    assert np.allclose(_sorted(fused), [[.1, 0, .1], [5, 0, 0], [9, 0, 0]])
+
+
+def test_fuse_keeps_same_endpoint_detections_apart():
+    frames = [
+        Frame(np.array([[0., 0, 0], [.3, 0, 0]])),
+        Frame(np.array([[.15, 0, 0], [.4, 0, 0]])),
+    ]
+
+    fused = fuse(frames, .5)
+
+    assert len(fused) == 2
+    assert np.allclose(_sorted(fused), [[.075, 0, 0], [.35, 0, 0]])
+
+
+def test_fuse_disabled():
+    frames = [Frame(np.array([[0., 0, 0]])), Frame(np.array([[.1, 0, 0]]))]
+
+    assert len(fuse(frames, 0)) == 2
+    assert len(fuse(frames[:1], .5)) == 1
+    assert len(fuse([], .5)) == 0
+
+
+def test_fuse_labels():
+    frames = [Frame(np.array([[0., 0, 0], [5, 0, 0]])), Frame(np.array([[.2, 0, 0]]))]
+
+    fused, labels = fuse(frames, .5, return_labels=True)
+
+    assert np.allclose(fused[labels], [[.1, 0, 0], [5, 0, 0], [.1, 0, 0]])
+    assert list(fuse(frames, 0, return_labels=True)[1]) == [0, 1, 2]
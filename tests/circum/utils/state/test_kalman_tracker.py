@@ -1,5 +1,5 @@
 import copy
-import datetime
+import time
 
 from circum.utils.state.kalman_tracker import KalmanTracker
 from circum.utils.state.tracking import TrackedObject
@@ -10,32 +10,20 @@ import numpy as np
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_kalman_update(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_kalman_update(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _predict
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
+        now + 1,  # _predict
+        now + 1,  # _track
+        now + 1,  # _prune
     ]
 
     objects = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     tracker = KalmanTracker(deletion_threshold=5)
@@ -51,35 +39,23 @@ def test_kalman_update(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_kalman_update_stable_association(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_kalman_update_stable_association(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _predict
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=2),  # _predict
-        now + datetime.timedelta(seconds=2),  # _track
-        now + datetime.timedelta(seconds=2),  # _prune
+        now + 1,  # _predict
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 2,  # _predict
+        now + 2,  # _track
+        now + 2,  # _prune
     ]
 
     objects = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     tracker = KalmanTracker(deletion_threshold=5)
@@ -101,53 +77,33 @@ def test_kalman_update_stable_association(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_kalman_update_10_pct_delta(object_now, tracker_now):
+def test_kalman_update_10_pct_delta(tracker_now):
     '''
     This tests the case where an update is closer to the a different object in the previous test_kalman_update
     '''
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _predict
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=2),  # _predict
-        now + datetime.timedelta(seconds=2),  # _track
-        now + datetime.timedelta(seconds=2),  # _prune
+        now + 1,  # _predict
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 2,  # _predict
+        now + 2,  # _track
+        now + 2,  # _prune
     ]
 
     objects1 = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     objects2 = [
-        TrackedObject(np.array([0.1, 0, 0])),
-        TrackedObject(np.array([0.9, 0, 0])),
-        TrackedObject(np.array([0.1, 1, 0])),
-        TrackedObject(np.array([0.9, 1, 0]))
+        TrackedObject(np.array([0.1, 0, 0]), now),
+        TrackedObject(np.array([0.9, 0, 0]), now),
+        TrackedObject(np.array([0.1, 1, 0]), now),
+        TrackedObject(np.array([0.9, 1, 0]), now)
     ]
 
     tracker = KalmanTracker(deletion_threshold=5)
@@ -169,68 +125,40 @@ def test_kalman_update_10_pct_delta(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_kalman_update_crossover_tricky(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-    ]
+def test_kalman_update_crossover_tricky(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _predict
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=2),  # _predict
-        now + datetime.timedelta(seconds=2),  # _track
-        now + datetime.timedelta(seconds=2),  # _prune
-        now + datetime.timedelta(seconds=3),  # _predict
-        now + datetime.timedelta(seconds=3),  # _track
-        now + datetime.timedelta(seconds=3),  # _prune
+        now + 1,  # _predict
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 2,  # _predict
+        now + 2,  # _track
+        now + 2,  # _prune
+        now + 3,  # _predict
+        now + 3,  # _track
+        now + 3,  # _prune
     ]
 
     objects1 = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     objects2 = [
-        TrackedObject(np.array([0, .3, 0])),
-        TrackedObject(np.array([1, .3, 0])),
-        TrackedObject(np.array([0, .7, 0])),
-        TrackedObject(np.array([1, .7, 0]))
+        TrackedObject(np.array([0, .3, 0]), now + 1),
+        TrackedObject(np.array([1, .3, 0]), now + 1),
+        TrackedObject(np.array([0, .7, 0]), now + 1),
+        TrackedObject(np.array([1, .7, 0]), now + 1)
     ]
 
     objects3 = [
-        TrackedObject(np.array([0, .6, 0])),
-        TrackedObject(np.array([1, .6, 0])),
-        TrackedObject(np.array([0, .4, 0])),
-        TrackedObject(np.array([1, .4, 0]))
+        TrackedObject(np.array([0, .6, 0]), now + 2),
+        TrackedObject(np.array([1, .6, 0]), now + 2),
+        TrackedObject(np.array([0, .4, 0]), now + 2),
+        TrackedObject(np.array([1, .4, 0]), now + 2)
     ]
 
     tracker = KalmanTracker(deletion_threshold=5)
@@ -259,68 +187,40 @@ def test_kalman_update_crossover_tricky(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_kalman_update_predictive_tracking(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now,  # create 1
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=1),  # create 2
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-        now + datetime.timedelta(seconds=2),  # create 3
-    ]
+def test_kalman_update_predictive_tracking(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _predict
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=2),  # _predict
-        now + datetime.timedelta(seconds=2),  # _track
-        now + datetime.timedelta(seconds=2),  # _prune
-        now + datetime.timedelta(seconds=3),  # _predict
-        now + datetime.timedelta(seconds=3),  # _track
-        now + datetime.timedelta(seconds=3),  # _prune
+        now + 1,  # _predict
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 2,  # _predict
+        now + 2,  # _track
+        now + 2,  # _prune
+        now + 3,  # _predict
+        now + 3,  # _track
+        now + 3,  # _prune
     ]
 
     objects1 = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     objects2 = [
-        TrackedObject(np.array([0, .3, 0])),
-        TrackedObject(np.array([1, .3, 0])),
-        TrackedObject(np.array([0, .7, 0])),
-        TrackedObject(np.array([1, .7, 0]))
+        TrackedObject(np.array([0, .3, 0]), now + 1),
+        TrackedObject(np.array([1, .3, 0]), now + 1),
+        TrackedObject(np.array([0, .7, 0]), now + 1),
+        TrackedObject(np.array([1, .7, 0]), now + 1)
     ]
 
     objects3 = [
-        TrackedObject(np.array([0, .6, 0])),
-        TrackedObject(np.array([1, .6, 0])),
-        TrackedObject(np.array([0, .4, 0])),
-        TrackedObject(np.array([1, .4, 0]))
+        TrackedObject(np.array([0, .6, 0]), now + 2),
+        TrackedObject(np.array([1, .6, 0]), now + 2),
+        TrackedObject(np.array([0, .4, 0]), now + 2),
+        TrackedObject(np.array([1, .4, 0]), now + 2)
     ]
 
     tracker = KalmanTracker(deletion_threshold=5)
@@ -346,3 +246,45 @@ def test_kalman_update_predictive_tracking(object_now, tracker_now):
     for obj in tracked_objects_final:
         index = index_map[obj.id]
         assert np.all(abs(objects3[index].pos - obj.pos) < .001)
+
+
+def test_kalman_associate_solvers_agree():
+    objects1 = [TrackedObject(np.array([x, 0, z])) for x in range(5) for z in range(5)]
+    objects2 = [TrackedObject(obj.pos + np.array([.2, 0, .1])) for obj in objects1]
+
+    associations = []
+    for solver in ("munkres", "scipy"):
+        tracker = KalmanTracker(deletion_threshold=5, solver=solver)
+        tracker.update(copy.deepcopy(objects1))
+        associated, unassociated_detections, unassociated_tracked = tracker._associate(copy.deepcopy(objects2), 1)
+
+        assert len(unassociated_detections) == 0
+        assert len(unassociated_tracked) == 0
+        associations.append(sorted((tracked.id, tuple(detection.pos)) for tracked, detection in associated))
+
+    assert associations[0] == associations[1]
+
+
+def test_kalman_follows_source_keys():
+    tracker = KalmanTracker(deletion_threshold=5, clock=lambda: 0)
+
+    def _update(positions, sources, now):
+        objects = [TrackedObject(np.array(pos, dtype=float), now) for pos in positions]
+        for obj, keys in zip(objects, sources):
+            obj.sources = keys
+        tracker.update(objects, now)
+        return dict(zip(*tracker.get_tracks()))
+
+    tracks = _update([[0, 0, 0], [1, 0, 0]], [[("a", 7)], [("a", 8)]], 0)
+    assert len(tracks) == 2
+
+    # the upstream tracks swapped places, their ids still decide the association
+    _update([[1, 0, 0], [0, 0, 0]], [[("a", 7)], [("a", 8)]], .1)
+    ids, positions = tracker.get_tracks()
+    assert np.allclose(positions[0], [1, 0, 0], atol=.1)
+    assert np.allclose(positions[1], [0, 0, 0], atol=.1)
+
+    # a second upstream takes over the first track, then the first upstream drops it
+    _update([[1, 0, 0]], [[("a", 7), ("b", 1)]], .2)
+    _update([[1, 0, 0]], [[("b", 1)]], .3)
+    assert tracker._sources[("b", 1)] == ids[0]
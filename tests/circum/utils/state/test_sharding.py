@@ -0,0 +1,86 @@
+from circum.utils.state.sharding import ShardedTracker, _Merger, _owners, _route
+from circum.utils.state.tracking import TrackedObject
+
+import numpy as np
+
+import pytest
+
+
+def test_route_overlap():
+    positions = np.array([[5., 0, 5], [9.5, 0, 5]])
+    owners = _owners(positions + [[0, 0, 0], [1, 0, 0]], 10, 4)
+
+    routes = _route(positions, 10, 1, 4)
+
+    assert routes[0].sum() == 1
+    assert routes[1, owners[1]]
+    assert routes[1].sum() == len(set(owners))
+
+
+def test_merger_handoff():
+    merger = _Merger(handoff_radius=2)
+
+    ids, _ = merger.merge([(np.array([0]), np.array([[9.5, 0, 0]]), np.array([True])),
+                           (np.array([], dtype=int), np.empty((0, 3)), np.array([], dtype=bool))], 0)
+    assert list(ids) == [0]
+
+    # the track crossed into the second worker's cell
+    ids, positions = merger.merge([(np.array([0]), np.array([[10.1, 0, 0]]), np.array([False])),
+                                   (np.array([3]), np.array([[10.2, 0, 0]]), np.array([True]))], .1)
+    assert list(ids) == [0]
+    assert np.allclose(positions, [[10.2, 0, 0]])
+
+    # an unrelated track gets a new id
+    ids, _ = merger.merge([(np.array([1]), np.array([[0., 0, 0]]), np.array([True])),
+                           (np.array([3]), np.array([[10.4, 0, 0]]), np.array([True]))], .2)
+    assert list(ids) == [0, 1]
+
+
+def test_sharded_tracker():
+    tracker = ShardedTracker(2, cell_size=10, margin=1)
+    try:
+        for step in range(25):
+            x = 5 + step * .5
+            tracker.update([TrackedObject(np.array([x, 0, 5.]), step * .1),
+                            TrackedObject(np.array([x, 0, 55.]), step * .1)], step * .1)
+            ids, positions = tracker.get_tracks()
+
+            assert list(ids) == [0, 1]
+            assert np.allclose(positions[:, 0], x, atol=.5)
+    finally:
+        tracker.close()
+
+
+def test_sharded_tracker_worker_exit():
+    tracker = ShardedTracker(2)
+    try:
+        tracker._workers[1].terminate()
+        tracker._workers[1].join()
+
+        with pytest.raises(RuntimeError, match="tracking worker exited"):
+            tracker.update([TrackedObject(np.array([0., 0, 0]), 0)], 0)
+    finally:
+        tracker.close()
+
+
+def test_sharded_tracker_follows_source_keys():
+    tracker = ShardedTracker(2, cell_size=10, margin=1)
+
+    def _update(positions, sources, now):
+        objects = [TrackedObject(np.array(pos, dtype=float), now) for pos in positions]
+        for obj, keys in zip(objects, sources):
+            obj.sources = keys
+        tracker.update(objects, now)
+        return tracker.get_tracks()
+
+    try:
+        ids, _ = _update([[5, 0, 5], [6, 0, 5]], [[("a", 7)], [("a", 8)]], 0)
+        assert len(ids) == 2
+
+        # the upstream tracks swapped places, their ids still decide the association
+        swapped_ids, positions = _update([[6, 0, 5], [5, 0, 5]], [[("a", 7)], [("a", 8)]], .1)
+        assert list(swapped_ids) == list(ids)
+        assert np.allclose(positions[0], [6, 0, 5], atol=.1)
+        assert np.allclose(positions[1], [5, 0, 5], atol=.1)
+    finally:
+        tracker.close()
@@ -1,5 +1,5 @@
 import copy
-import datetime
+import time
 
 from circum.utils.state.simple_tracker import SimpleTracker
 from circum.utils.state.tracking import TrackedObject
@@ -10,31 +10,19 @@ import numpy as np
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_simple_update(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_simple_update(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
     ]
 
     objects = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     tracker = SimpleTracker(deletion_threshold=5)
@@ -50,33 +38,21 @@ def test_simple_update(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_simple_update_stable_association(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_simple_update_stable_association(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
     ]
 
     objects = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     tracker = SimpleTracker(deletion_threshold=5)
@@ -98,48 +74,28 @@ def test_simple_update_stable_association(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_simple_update_10_pct_delta(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_simple_update_10_pct_delta(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
     ]
 
     objects1 = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     objects2 = [
-        TrackedObject(np.array([0.1, 0, 0])),
-        TrackedObject(np.array([0.9, 0, 0])),
-        TrackedObject(np.array([0.1, 1, 0])),
-        TrackedObject(np.array([0.9, 1, 0]))
+        TrackedObject(np.array([0.1, 0, 0]), now),
+        TrackedObject(np.array([0.9, 0, 0]), now),
+        TrackedObject(np.array([0.1, 1, 0]), now),
+        TrackedObject(np.array([0.9, 1, 0]), now)
     ]
 
     tracker = SimpleTracker(deletion_threshold=5)
@@ -161,33 +117,21 @@ def test_simple_update_10_pct_delta(object_now, tracker_now):
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_simple_update_permanence(object_now, tracker_now):
-    now = datetime.datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_simple_update_permanence(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
-        now + datetime.timedelta(seconds=1),  # _track
-        now + datetime.timedelta(seconds=1),  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
+        now + 1,  # _track
+        now + 1,  # _prune
     ]
 
     objects = [
-        TrackedObject(np.array([0, 0, 0])),
-        TrackedObject(np.array([1, 0, 0])),
-        TrackedObject(np.array([0, 1, 0])),
-        TrackedObject(np.array([1, 1, 0]))
+        TrackedObject(np.array([0, 0, 0]), now),
+        TrackedObject(np.array([1, 0, 0]), now),
+        TrackedObject(np.array([0, 1, 0]), now),
+        TrackedObject(np.array([1, 1, 0]), now)
     ]
 
     tracker = SimpleTracker(deletion_threshold=5)
@@ -206,3 +150,15 @@ def test_simple_update_permanence(object_now, tracker_now):
 
     for i in range(len(objects)):
         assert np.array_equal(tracked_objects2[i].pos, obj_map[tracked_objects2[i].id].pos)
+
+
+def test_simple_history_bounded():
+    tracker = SimpleTracker(deletion_threshold=5, history_length=4)
+
+    for i in range(10):
+        tracker.update([TrackedObject(np.array([i * .1, 0, 0]))])
+
+    ids, trails = tracker.get_trails()
+
+    assert list(ids) == [0]
+    assert np.allclose(trails[0, :, 0], [.6, .7, .8, .9])
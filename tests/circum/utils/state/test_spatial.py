@@ -0,0 +1,73 @@
+from circum.utils.state.association import gate
+from circum.utils.state.kalman_tracker import KalmanTracker
+from circum.utils.state.simple_tracker import SimpleTracker
+from circum.utils.state.spatial import GridIndex, KDTreeIndex, SpatialIndex, get_index
+from circum.utils.state.tracking import TrackedObject
+
+import numpy as np
+
+import pytest
+
+import scipy.spatial.distance as dist
+
+
+def _sorted_pairs(graph):
+    order = np.lexsort((graph.cols, graph.rows))
+    return graph.rows[order], graph.cols[order], graph.costs[order]
+
+
+@pytest.mark.parametrize("index", [KDTreeIndex(), GridIndex(), GridIndex(cell_size=.7)])
+def test_candidates_match_dense_gate(index):
+    rng = np.random.default_rng(1)
+    tracked = rng.random((200, 3)) * [100, 3, 100] - 20
+    detected = rng.random((150, 3)) * [100, 3, 100] - 20
+
+    expected = gate(dist.cdist(detected, tracked), 4)
+    graph = index.candidates(tracked, detected, 4)
+
+    assert graph.shape == expected.shape
+    for actual_values, expected_values in zip(_sorted_pairs(graph), _sorted_pairs(expected)):
+        assert np.allclose(actual_values, expected_values)
+
+
+@pytest.mark.parametrize("index", [KDTreeIndex(), GridIndex()])
+def test_candidates_keeps_coincident_points(index):
+    points = np.array([[0., 0, 0], [1, 1, 1]])
+
+    graph = index.candidates(points, points, 10)
+
+    assert len(graph.rows) == 4
+    assert np.count_nonzero(graph.costs == 0) == 2
+
+
+def test_get_index():
+    assert get_index(None) is None
+    assert isinstance(get_index("kdtree"), KDTreeIndex)
+    grid = GridIndex()
+    assert get_index(grid) is grid
+    with pytest.raises(ValueError):
+        get_index("unknown")
+    with pytest.raises(TypeError):
+        SpatialIndex()
+
+
+@pytest.mark.parametrize("tracker_type", [KalmanTracker, SimpleTracker])
+@pytest.mark.parametrize("index", ["kdtree", "grid"])
+def test_tracker_with_index(tracker_type, index):
+    objects = [TrackedObject(np.array([x * 20., 0, 0])) for x in range(5)]
+    moved = [TrackedObject(obj.pos + [.5, 0, 0]) for obj in objects]
+    far = TrackedObject(np.array([500., 0, 0]))
+
+    tracker = tracker_type(deletion_threshold=5, index=index)
+    tracker.update(objects)
+    ids = {obj.id: obj.pos[0] for obj in tracker.get_objects()}
+
+    tracker.update(moved + [far])
+    tracked = tracker.get_objects()
+
+    assert len(tracked) == len(objects) + 1
+    for obj in tracked:
+        if obj.id in ids:
+            assert abs(obj.pos[0] - ids[obj.id]) < 1
+        else:
+            assert obj.pos[0] == 500
@@ -0,0 +1,32 @@
+from circum.utils.state.table import SlotTable
+
+import numpy as np
+
+
+def test_allocate_grows_columns():
+    table = SlotTable(capacity=2)
+    table.add_column("values", (3,), fill=1)
+
+    slots = [table.allocate() for _ in range(3)]
+
+    assert slots == [0, 1, 2]
+    assert table.capacity == 4
+    assert table.values.shape == (4, 3)
+    assert np.all(table.values == 1)
+    assert len(table) == 3
+
+
+def test_release_reuses_slot_and_resets_row():
+    table = SlotTable(capacity=2)
+    table.add_column("values")
+    first = table.allocate()
+    table.allocate()
+    table.values[first] = 5
+
+    table.release(first)
+    table.release(first)
+
+    assert len(table) == 1
+    assert list(table.slots()) == [1]
+    assert table.allocate() == first
+    assert table.values[first] == 0
@@ -1,25 +1,31 @@
 import copy
-from collections import OrderedDict
-from datetime import datetime, timedelta
+import time
 
-from circum.utils.state.tracking import ObjectTracker, TrackedObject
+from circum.utils.state.kalman_tracker import KalmanTracker
+from circum.utils.state.simple_tracker import SimpleTracker
+from circum.utils.state.tracking import ObjectTracker, TrackTable, TrackedObject
 
 import mock
 
 import numpy as np
 
+import pytest
+
 
 def test_TrackedObject_creation():
-    time_thresh = timedelta(milliseconds=100)
     to = TrackedObject(np.array([0, 1, 2]))
-    dt = datetime.now()
     assert np.array_equal(to.pos, np.array([0, 1, 2]))
-    assert dt - to.last_seen < time_thresh
+    # undated objects are stamped by the tracker that registers them
+    assert to.last_seen is None
     assert to.id is None
     assert to.tracking_ctx is None
-    assert dt - to.created < time_thresh
+    assert to.created is None
     assert to.history == []
 
+    to = TrackedObject(np.array([0, 1, 2]), 12.5)
+    assert to.last_seen == 12.5
+    assert to.created == 12.5
+
 
 def test_TrackedObject_equal():
     to1 = TrackedObject(np.array([0, 1, 2]))
@@ -50,7 +56,7 @@ def test_TrackedObject_notequal_different_types():
 
 def test_ObjectTracker_creation():
     ot = ObjectTracker(5)
-    assert isinstance(ot._objects, OrderedDict)
+    assert isinstance(ot._objects, TrackTable)
     assert len(ot._objects) == 0
     assert ot._next == 0
     assert ot._deletion_threshold == 5
@@ -74,15 +80,15 @@ def test_ObjectTracker_update_multiple():
 
 
 def test_ObjectTracker_prune_too_old():
-    dt = datetime.now()
+    dt = time.monotonic()
     ot = ObjectTracker(5)
     tos = [TrackedObject(np.array([0, 1, 2])), TrackedObject(np.array([0, 1, 2]))]
     ot.update(tos)
 
     assert len(ot._objects) == 2
 
-    ot._objects[1].created = dt - timedelta(seconds=100)
-    ot._objects[1].last_seen = dt - timedelta(seconds=6)
+    ot._objects[1].created = dt - 100
+    ot._objects[1].last_seen = dt - 6
 
     ot.update([])
 
@@ -90,32 +96,137 @@ def test_ObjectTracker_prune_too_old():
 
 
 @mock.patch("circum.utils.state.tracking.ObjectTracker._now")
-@mock.patch("circum.utils.state.tracking.TrackedObject._now")
-def test_ObjectTracker_prune_too_invisible(object_now, tracker_now):
-    now = datetime.now()
-
-    object_now.side_effect = [
-        now,  # create
-        now,  # create
-        now,  # create
-        now,  # create
-    ]
+def test_ObjectTracker_prune_too_invisible(tracker_now):
+    now = time.monotonic()
 
     tracker_now.side_effect = [
         # update 1
         now,  # _prune
         # update 2
-        now + timedelta(seconds=10),  # _prune
+        now + 10,  # _prune
     ]
 
     ot = ObjectTracker(5)
-    tos = [TrackedObject(np.array([0, 1, 2])), TrackedObject(np.array([0, 1, 2]))]
+    tos = [TrackedObject(np.array([0, 1, 2]), now), TrackedObject(np.array([0, 1, 2]), now)]
 
     ot.update(copy.deepcopy(tos))
     assert len(ot._objects) == 2
 
-    ot._objects[0].last_seen = now + timedelta(seconds=9)
-    ot._objects[1].last_seen = now + timedelta(seconds=3.9)
+    ot._objects[0].last_seen = now + 9
+    ot._objects[1].last_seen = now + 3.9
+
+    ot.update([])
+    assert len(ot._objects) == 1
+
+
+def test_ObjectTracker_views():
+    ot = ObjectTracker(5)
+    ot.update([TrackedObject(np.array([0, 1, 2])), TrackedObject(np.array([3, 4, 5]))])
+
+    view = ot.get_objects()[1]
+    snapshot = copy.deepcopy(view)
+    view.pos = np.array([6, 7, 8])
+
+    assert isinstance(snapshot, TrackedObject)
+    assert np.array_equal(snapshot.pos, [3, 4, 5])
+    assert np.array_equal(ot._objects[1].pos, [6, 7, 8])
+
+    ids, positions = ot.get_tracks()
+    assert list(ids) == [0, 1]
+    assert np.array_equal(positions, [[0, 1, 2], [6, 7, 8]])
+
+
+def test_ObjectTracker_clock():
+    now = [100.]
+    ot = ObjectTracker(5, clock=lambda: now[0])
+    ot.update([TrackedObject(np.array([0, 1, 2]), timestamp=100.), TrackedObject(np.array([0, 1, 2]), timestamp=103.)])
 
+    now[0] = 105.5
     ot.update([])
+    assert [obj.id for obj in ot.get_objects()] == [1]
+
+    now[0] = 108.5
+    ot.update([])
+    assert len(ot._objects) == 0
+
+
+def test_TrackTable_expired():
+    table = TrackTable(deletion_threshold=5)
+    objects = [TrackedObject(np.array([0, 0, 0]), timestamp=0) for _ in range(3)]
+    for id_, obj in enumerate(objects):
+        obj.id = id_
+        table.add(obj)
+
+    table.last_seen[0] = 20
+    table.last_seen[1] = 9
+    table.last_seen[2] = 8
+
+    # entries earlier than the actual expiry are rescheduled
+    assert table.expired(10) == []
+    assert sorted(expiry for expiry, _, _ in table._expiry) == [13., 14., 25.]
+
+    # moving an expiry earlier through a view schedules the track again
+    table[1].created = -10
+    table[1].last_seen = 2
+    assert table.expired(10) == [table._slots[1]]
+    assert table.expired(14) == [table._slots[2]]
+
+
+def test_TrackTable_history_ring():
+    table = TrackTable(history_length=3)
+    obj = TrackedObject(np.array([0, 0, 0]), timestamp=0)
+    obj.id = 0
+    slot = table.add(obj)
+
+    for i in range(1, 5):
+        table.record([slot], [[i, 0, 0]], i)
+
+    assert np.array_equal(table.trail(slot)[:, 0], [2, 3, 4])
+    assert np.array_equal(table.trail(slot, 2)[:, 0], [3, 4])
+    assert np.array_equal(table[0].history[:, 0], [2, 3, 4])
+
+
+def test_TrackTable_trails_padding_and_window():
+    table = TrackTable(history_length=4, history_window=1.5)
+    for id_, timestamp in enumerate((0, 10)):
+        obj = TrackedObject(np.array([id_, 0, 0]), timestamp=timestamp)
+        obj.id = id_
+        table.add(obj)
+    table.record([0, 1], [[0, 1, 0], [1, 1, 0]], 11)
+
+    trails = table.trails(table.ordered_slots())
+
+    assert trails.shape == (2, 4, 3)
+    assert np.all(np.isnan(trails[0, :3]))
+    assert np.array_equal(trails[0, 3], [0, 1, 0])
+    assert np.all(np.isnan(trails[1, :2]))
+    assert np.array_equal(trails[1, 2:], [[1, 0, 0], [1, 1, 0]])
+
+
+def test_ObjectTracker_update_at_timestamp():
+    ot = ObjectTracker(5, clock=lambda: 1000.)
+    ot.update([TrackedObject(np.array([0, 1, 2]), timestamp=10.)], now=10.)
+    assert ot._objects[0].last_seen == 10.
+
+    ot.update([], now=14.)
     assert len(ot._objects) == 1
+
+    ot.update([], now=15.5)
+    assert len(ot._objects) == 0
+
+
+# the base tracker does no association, every detection is a new track
+@pytest.mark.parametrize("tracker_type,tracks", [(ObjectTracker, 2), (SimpleTracker, 1), (KalmanTracker, 1)])
+def test_undated_objects_use_tracker_clock(tracker_type, tracks):
+    # a wall clock, far from the monotonic clock
+    now = [1e9]
+    tracker = tracker_type(deletion_threshold=5, clock=lambda: now[0])
+
+    tracker.update([TrackedObject(np.array([0., 0, 0]))])
+    now[0] = 1e9 + .1
+    tracker.update([TrackedObject(np.array([0., 0, 0]))])
+
+    tracked = tracker.get_objects()
+    assert len(tracked) == tracks
+    assert tracked[0].created == 1e9
+    assert tracked[-1].last_seen == 1e9 + .1
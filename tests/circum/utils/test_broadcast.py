@@ -0,0 +1,109 @@
+import socket
+
+from circum.utils.broadcast import Broadcaster, CONFLATE, DROP
+from circum.utils.encoding import BSON, PACKED
+from circum.utils.network import FrameReader, frame
+
+import pytest
+
+
+def _client(broadcaster, fmt=BSON):
+    a, b = socket.socketpair()
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    broadcaster.add(a, fmt)
+    return a, b
+
+
+class _Reader:
+    def __init__(self, sock):
+        sock.setblocking(False)
+        self.reader = FrameReader(sock)
+
+    def drain(self):
+        frames = []
+        try:
+            while True:
+                frames.extend(bytes(f) for f in self.reader.read())
+        except BlockingIOError:
+            pass
+        return frames
+
+
+def _drain(sock):
+    return _Reader(sock).drain()
+
+
+def test_publish_encodes_once_per_format():
+    broadcaster = Broadcaster()
+    clients = [_client(broadcaster, fmt) for fmt in (BSON, BSON, PACKED)]
+    calls = []
+
+    def _encode(fmt):
+        calls.append(fmt)
+        return frame(fmt.encode())
+
+    broadcaster.publish(_encode)
+
+    assert sorted(calls) == [BSON, PACKED]
+    assert [_drain(b) for _, b in clients] == [[b"bson"], [b"bson"], [b"packed"]]
+    broadcaster.close()
+
+
+def _serve(broadcaster, client, reader):
+    frames = []
+    while client in broadcaster.pending_sockets():
+        broadcaster.flush()
+        frames.extend(reader.drain())
+    frames.extend(reader.drain())
+    return frames
+
+
+@pytest.mark.parametrize("policy", [CONFLATE, DROP])
+def test_slow_client_does_not_block(policy):
+    broadcaster = Broadcaster(policy)
+    slow_client, slow = _client(broadcaster)
+    fast_client, fast = _client(broadcaster)
+    slow_reader = _Reader(slow)
+    fast_reader = _Reader(fast)
+    big = b"x" * 1000000
+
+    # the fast client keeps reading while the slow one does not
+    broadcaster.publish(lambda fmt: frame(big))
+    fast_frames = _serve(broadcaster, fast_client, fast_reader)
+    for i in range(3):
+        broadcaster.publish(lambda fmt: frame(str(i).encode()))
+        fast_frames.extend(_serve(broadcaster, fast_client, fast_reader))
+
+    assert fast_frames == [big, b"0", b"1", b"2"]
+    assert broadcaster.pending_sockets() == [slow_client]
+    lag = broadcaster.lag()
+    assert lag[fast_client].dropped == 0
+    assert lag[slow_client].pending_bytes > 0
+
+    received = _serve(broadcaster, slow_client, slow_reader)
+
+    if policy == CONFLATE:
+        assert received == [big, b"2"]
+        assert lag[slow_client].dropped == 2
+    else:
+        assert received == [big]
+        assert lag[slow_client].dropped == 3
+    broadcaster.close()
+
+
+def test_failed_client_removed():
+    broadcaster = Broadcaster()
+    a, b = _client(broadcaster)
+    b.close()
+
+    broadcaster.publish(lambda fmt: frame(b"data"))
+    broadcaster.publish(lambda fmt: frame(b"data"))
+
+    assert broadcaster.sockets() == []
+    assert a.fileno() == -1
+    broadcaster.close()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Broadcaster("unknown")
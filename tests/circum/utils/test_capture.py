@@ -0,0 +1,113 @@
+from circum.utils.capture import CaptureReader, CaptureWriter, INBOUND, OUTBOUND, index_suffix
+from circum.utils.encoding import BSON, Frame, PACKED, encode
+
+import numpy as np
+
+
+def _frame(x, ids=None):
+    return Frame(np.array([[x, 0., 0]]), ids)
+
+
+def _write(path):
+    writer = CaptureWriter(str(path))
+    writer.inbound("a", encode(_frame(1), BSON), 1)
+    writer.inbound("b", encode(_frame(2), PACKED), 2)
+    writer.outbound(encode(_frame(1.5, np.array([0])), PACKED), 3)
+    writer.inbound("a", encode(_frame(3), BSON), 4)
+    writer.close()
+
+
+def test_capture_round_trip(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+
+    reader = CaptureReader(str(path))
+    records = list(reader.records())
+
+    assert [(timestamp, kind) for timestamp, kind, _ in records] == [(1, INBOUND), (2, INBOUND), (3, OUTBOUND),
+                                                                     (4, INBOUND)]
+    assert [frame.source for _, _, frame in records] == ["a", "b", None, "a"]
+    assert [float(frame.positions[0, 0]) for _, _, frame in records] == [1, 2, 1.5, 3]
+    assert list(records[2][2].ids) == [0]
+    assert reader.source_counts() == {"a": 2, "b": 1}
+    reader.close()
+
+
+def test_capture_seek(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+
+    reader = CaptureReader(str(path))
+
+    assert [timestamp for timestamp, _, _ in reader.records(2, 4)] == [2, 3]
+    assert [timestamp for timestamp, _, _ in reader.records(kind=OUTBOUND)] == [3]
+    assert [timestamp for timestamp, _, _ in reader.records(start=3.5)] == [4]
+
+
+def test_capture_append_keeps_sources(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+
+    writer = CaptureWriter(str(path))
+    writer.inbound("b", encode(_frame(5), BSON), 5)
+    writer.inbound("c", encode(_frame(6), BSON), 6)
+    writer.close()
+
+    reader = CaptureReader(str(path))
+    assert reader.source_counts() == {"a": 2, "b": 2, "c": 1}
+    assert [frame.source for _, _, frame in reader.records(5)] == ["b", "c"]
+
+
+def test_capture_ignores_incomplete_records(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+    # the recorder died after writing an index record but before its payload reached the disk
+    with open(str(path), "r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)
+    with open(str(path) + index_suffix, "ab") as f:
+        f.write(b"\0" * 5)
+
+    reader = CaptureReader(str(path))
+
+    assert [timestamp for timestamp, _, _ in reader.records()] == [1, 2, 3]
+
+
+def test_capture_append_after_incomplete_records(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+    # the recorder died after writing a payload but before its index record was complete
+    with open(str(path), "ab") as f:
+        f.write(b"torn payload")
+    with open(str(path) + index_suffix, "ab") as f:
+        f.write(b"\0" * 5)
+
+    writer = CaptureWriter(str(path))
+    writer.inbound("c", encode(_frame(5), BSON), 5)
+    writer.close()
+
+    reader = CaptureReader(str(path))
+    records = list(reader.records())
+    assert [timestamp for timestamp, _, _ in records] == [1, 2, 3, 4, 5]
+    assert records[-1][2].source == "c"
+    assert float(records[-1][2].positions[0, 0]) == 5
+
+
+def test_capture_index_is_sorted(tmp_path):
+    path = tmp_path / "capture"
+    _write(path)
+
+    reader = CaptureReader(str(path))
+
+    # the records naming a source are stamped like the frame they precede
+    assert list(reader.index["timestamp"]) == [1, 1, 2, 2, 3, 4]
+    assert reader.seek(2) == 2
+
+
+def test_capture_empty(tmp_path):
+    path = tmp_path / "capture"
+    CaptureWriter(str(path)).close()
+
+    reader = CaptureReader(str(path))
+
+    assert len(reader) == 0
+    assert list(reader.records()) == []
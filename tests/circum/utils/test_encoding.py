@@ -0,0 +1,92 @@
+import bson
+
+from circum.utils.encoding import (BSON, Frame, PACKED, advertise_formats, advertised_formats, concatenate, decode,
+                                   encode, format_request, is_packed, parse_format_request)
+
+import numpy as np
+
+import pytest
+
+
+@pytest.mark.parametrize("fmt", [BSON, PACKED])
+def test_round_trip(fmt):
+    update = Frame(np.array([[1., 2, 3], [4, 5, 6]]), np.array([7, 8]))
+
+    decoded = decode(encode(update, fmt))
+
+    assert np.allclose(decoded.positions, update.positions)
+    assert np.array_equal(decoded.ids, update.ids)
+
+
+@pytest.mark.parametrize("fmt", [BSON, PACKED])
+def test_round_trip_without_ids(fmt):
+    update = Frame(np.array([[1., 2, 3]]))
+
+    decoded = decode(encode(update, fmt))
+
+    assert np.allclose(decoded.positions, update.positions)
+    assert decoded.ids is None
+
+
+@pytest.mark.parametrize("fmt", [BSON, PACKED])
+def test_round_trip_empty(fmt):
+    decoded = decode(encode(Frame(np.empty((0, 3)), np.empty(0, dtype=int)), fmt))
+
+    assert decoded.positions.shape == (0, 3)
+    assert decoded.ids.tolist() == []
+
+
+def test_bson_round_trip_empty_without_ids():
+    decoded = decode(encode(Frame(np.empty((0, 3))), BSON))
+
+    assert decoded.positions.shape == (0, 3)
+    assert decoded.ids.dtype.kind == "i"
+    assert decoded.ids.tolist() == []
+
+
+def test_bson_matches_legacy_frames():
+    update = Frame(np.array([[1., 2, 3]]), np.array([4]))
+
+    assert bson.loads(encode(update, BSON)) == {"objects": [{"x": 1., "y": 2., "z": 3., "id": 4}]}
+
+
+def test_packed_header():
+    payload = encode(Frame(np.array([[1., 2, 3]]), seq=5, timestamp=12.5), PACKED)
+
+    assert is_packed(payload)
+    assert not is_packed(encode(Frame(np.array([[1., 2, 3]])), BSON))
+
+    decoded = decode(memoryview(payload))
+    assert decoded.seq == 5
+    assert decoded.timestamp == 12.5
+
+
+def test_concatenate():
+    frames = [Frame(np.array([[1., 2, 3]])), Frame(np.array([[4., 5, 6], [7, 8, 9]]))]
+
+    assert concatenate(frames).shape == (3, 3)
+    assert concatenate([]).shape == (0, 3)
+
+
+def test_format_negotiation():
+    assert parse_format_request(format_request(PACKED)) == PACKED
+    assert parse_format_request(bson.dumps({"format": "unknown"})) is None
+    assert parse_format_request(b"garbage") is None
+
+    assert advertised_formats({}) == [BSON]
+    assert advertised_formats({b"type": b"simulator"}) == [BSON]
+    properties = {key.encode(): value.encode() for key, value in advertise_formats().items()}
+    assert PACKED in advertised_formats(properties)
+
+
+@pytest.mark.parametrize("fmt", [BSON, PACKED])
+def test_round_trip_sent(fmt):
+    update = Frame(np.array([[1., 2, 3]]), np.array([4]), seq=3, timestamp=12.5, sent=13.25)
+
+    decoded = decode(encode(update, fmt))
+
+    assert decoded.seq == 3
+    assert decoded.timestamp == 12.5
+    assert decoded.sent == 13.25
+    assert np.array_equal(decoded.ids, [4])
+    assert decode(encode(update._replace(sent=0), fmt)).sent == 0
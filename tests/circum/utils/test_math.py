@@ -93,3 +93,27 @@ def test_rotate_translate():
     transformed = circum.utils.math.transform_positions(positions, sensor_pose)
 
     assert np.allclose(expected, transformed)
+
+
+def test_pose_transform_matches_transform_positions():
+    positions = np.array([[1, 0, 0],
+                          [0, 1, 0],
+                          [0, 0, 1],
+                          [1, 2, 3]])
+    sensor_pose = [10, 20, 30, 45, 90, 135]
+
+    expected = circum.utils.math.transform_positions(np.vstack((positions.T, np.ones(4))), sensor_pose)[:3].T
+
+    assert np.allclose(expected, circum.utils.math.PoseTransform(sensor_pose).apply(positions))
+
+
+def test_pose_transform_recomputed_on_change():
+    transform = circum.utils.math.PoseTransform([0, 0, 0, 0, 0, 0])
+    rotation = transform.rotation_t
+
+    transform.set_pose([0, 0, 0, 0, 0, 0])
+    assert transform.rotation_t is rotation
+
+    transform.set_pose([1, 2, 3, 0, 0, 90])
+    assert transform.rotation_t is not rotation
+    assert np.allclose([[1, 3, 3]], transform.apply([[1, 0, 0]]))
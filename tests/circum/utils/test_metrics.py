@@ -0,0 +1,104 @@
+import math
+import time
+import urllib.request
+
+from circum.utils.metrics import Histogram, Registry, serve
+
+import pytest
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram((1, 2, 5))
+    for value in (.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(16)
+    assert histogram.quantile(.4) == 1
+    assert histogram.quantile(.6) == 2
+    assert histogram.quantile(.99) == math.inf
+    assert math.isnan(Histogram().quantile(.5))
+
+
+def test_histogram_times_block():
+    histogram = Histogram()
+    with histogram.time():
+        time.sleep(.01)
+
+    assert histogram.count == 1
+    assert histogram.sum >= .01
+
+
+def test_registry_returns_existing_metric():
+    registry = Registry()
+    counter = registry.counter("frames_total", "Frames.", source="a")
+
+    assert registry.counter("frames_total", source="a") is counter
+    assert registry.counter("frames_total", source="b") is not counter
+    with pytest.raises(ValueError):
+        registry.gauge("frames_total")
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    registry.counter("frames_total", "Frames received.", source='a"b').inc(3)
+    registry.gauge("clients", "Connected clients.", lambda: 2)
+    histogram = registry.histogram("stage_seconds", buckets=(.1, 1), stage="fuse")
+    histogram.observe(.05)
+    histogram.observe(.5)
+    # the help can be given by a later series
+    registry.histogram("stage_seconds", "Time per stage.", (.1, 1), stage="track")
+
+    assert registry.render().splitlines() == [
+        "# HELP clients Connected clients.",
+        "# TYPE clients gauge",
+        "clients 2",
+        "# HELP frames_total Frames received.",
+        "# TYPE frames_total counter",
+        'frames_total{source="a\\"b"} 3',
+        "# HELP stage_seconds Time per stage.",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="fuse",le="0.1"} 1',
+        'stage_seconds_bucket{stage="fuse",le="1"} 2',
+        'stage_seconds_bucket{stage="fuse",le="+Inf"} 2',
+        'stage_seconds_sum{stage="fuse"} 0.55',
+        'stage_seconds_count{stage="fuse"} 2',
+        'stage_seconds_bucket{stage="track",le="0.1"} 0',
+        'stage_seconds_bucket{stage="track",le="1"} 0',
+        'stage_seconds_bucket{stage="track",le="+Inf"} 0',
+        'stage_seconds_sum{stage="track"} 0',
+        'stage_seconds_count{stage="track"} 0',
+    ]
+
+
+def test_summary_reports_rates():
+    registry = Registry()
+    counter = registry.counter("frames_total")
+    histogram = registry.histogram("stage_seconds", buckets=(.001, .01))
+    counter.inc(10)
+    histogram.observe(.005)
+
+    first = registry.summary().splitlines()
+    assert first == ["frames_total 10", "stage_seconds count 1 mean 5.000ms p50 <10.0ms p99 <10.0ms"]
+
+    counter.inc(10)
+    second = registry.summary().splitlines()
+    assert second[0].startswith("frames_total 20 (")
+    assert second[0].endswith("/s)")
+
+
+def test_serve_metrics():
+    registry = Registry()
+    registry.counter("frames_total").inc()
+    server = serve(0, metrics=registry)
+    try:
+        url = "http://127.0.0.1:{}".format(server.server_address[1])
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "frames_total 1" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,82 @@
+import socket
+
+from circum.utils.encoding import PACKED, parse_format_request
+from circum.utils.network import FrameReader, StaticListener, frame
+
+import pytest
+
+
+@pytest.fixture
+def sockets():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_frame_reader_multiple_frames(sockets):
+    a, b = sockets
+    a.sendall(frame(b"one") + frame(b"two") + frame(b""))
+
+    frames = FrameReader(b).read()
+
+    assert [bytes(f) for f in frames] == [b"one", b"two", b""]
+
+
+def test_frame_reader_fragmented(sockets):
+    a, b = sockets
+    reader = FrameReader(b)
+    data = frame(b"hello world") + frame(b"again")
+
+    received = []
+    for i in range(len(data)):
+        a.sendall(data[i:i + 1])
+        received.extend(bytes(f) for f in reader.read())
+
+    assert received == [b"hello world", b"again"]
+
+
+def test_frame_reader_small_buffer(sockets):
+    a, b = sockets
+    reader = FrameReader(b, buffer_size=8)
+    payloads = [bytes([i]) * (i * 7) for i in range(1, 10)]
+
+    for payload in payloads:
+        a.sendall(frame(payload))
+
+    assert [bytes(reader.read_frame()) for _ in payloads] == payloads
+
+
+def test_frame_reader_closed(sockets):
+    a, b = sockets
+    reader = FrameReader(b)
+    a.sendall(frame(b"partial")[:5])
+    a.close()
+
+    assert reader.read() == []
+    with pytest.raises(ConnectionError):
+        reader.read()
+
+
+def test_static_listener_connects_and_retries():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    listener = StaticListener({"endpoint": ("127.0.0.1", port)}, PACKED, retry_interval=0)
+
+    # nothing is listening yet
+    assert listener.get_sockets() == []
+
+    server.listen()
+    sockets = listener.get_sockets()
+    conn, _ = server.accept()
+
+    assert len(sockets) == 1
+    assert listener.name(sockets[0]) == "endpoint"
+    assert parse_format_request(FrameReader(conn).read_frame()) == PACKED
+
+    # a removed connection is made again
+    listener.remove(sockets[0])
+    assert len(listener.get_sockets()) == 1
+    for sock in listener.get_sockets() + [conn, server]:
+        sock.close()
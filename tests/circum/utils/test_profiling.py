@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+from circum.utils.profiling import SamplingProfiler, Watchdog
+
+
+def _spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_profiler_writes_collapsed_stacks(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    worker.start()
+    profiler = SamplingProfiler(.001)
+    try:
+        for _ in range(20):
+            profiler.sample()
+    finally:
+        stop.set()
+        worker.join()
+
+    path = str(tmp_path / "profile.folded")
+    profiler.dump(path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    spinner = [line for line in lines if line.startswith("spinner;")]
+    assert len(spinner) > 0
+    stack, count = spinner[0].rsplit(" ", 1)
+    assert "test_profiling.py:_spin" in stack.split(";")
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in spinner) == 20
+    assert profiler.samples == 20
+
+
+def test_profiler_dumps_on_request(tmp_path):
+    path = tmp_path / "profile.folded"
+    profiler = SamplingProfiler(.001)
+    profiler.start()
+    try:
+        profiler.request_dump(str(path))
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(.01)
+    finally:
+        profiler.stop()
+
+    assert path.exists()
+
+
+def test_watchdog_reports_stalled_iterations_once(caplog):
+    watchdog = Watchdog(.01, logging.getLogger("test_watchdog"))
+
+    with caplog.at_level(logging.WARNING, "test_watchdog"):
+        with watchdog.iteration("update"):
+            time.sleep(.02)
+            assert watchdog.check() == 1
+            assert watchdog.check() == 0
+        with watchdog.iteration("update"):
+            assert watchdog.check() == 0
+
+    assert watchdog.stalls == 1
+    assert "update has been running for" in caplog.text
+    assert "test_watchdog_reports_stalled_iterations_once" in caplog.text
+
+
+def test_watchdog_disabled_without_deadline():
+    watchdog = Watchdog()
+
+    with watchdog.iteration("update"):
+        time.sleep(.01)
+
+    assert watchdog.check() == 0
+    assert len(watchdog._running) == 0
@@ -0,0 +1,131 @@
+from circum.utils.encoding import Frame
+from circum.utils.scheduling import SequentialScheduler, TickScheduler, UpdateScheduler, get_scheduler
+
+import mock
+
+import numpy as np
+
+
+def test_update_scheduler_runs_on_every_frame():
+    scheduler = UpdateScheduler()
+
+    assert not scheduler.ready()
+    assert scheduler.timeout() is None
+
+    scheduler.on_frame("a", [{"x": 0}])
+    assert scheduler.ready()
+    assert scheduler.frames() == [[{"x": 0}]]
+    assert not scheduler.ready()
+
+    # frames are only handed out once
+    scheduler.on_frame("b", [{"x": 1}])
+    assert scheduler.frames() == [[{"x": 1}]]
+
+
+def test_update_scheduler_retain():
+    scheduler = UpdateScheduler()
+    scheduler.on_frame("a", [{"x": 0}])
+    scheduler.on_frame("b", [{"x": 1}])
+
+    scheduler.retain(["b"])
+
+    assert scheduler.frames() == [[{"x": 1}]]
+
+
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_tick_scheduler_coalesces_frames(now):
+    now.return_value = 100.
+    scheduler = TickScheduler(10)
+
+    for i in range(5):
+        scheduler.on_frame("a", [{"x": i}])
+        scheduler.on_frame("b", [{"x": -i}])
+
+    assert scheduler.ready()
+    assert scheduler.frames() == [[{"x": 4}], [{"x": -4}]]
+
+    now.return_value = 100.05
+    scheduler.on_frame("a", [{"x": 5}])
+    assert not scheduler.ready()
+    assert abs(scheduler.timeout() - .05) < 1e-9
+
+    now.return_value = 100.1
+    assert scheduler.ready()
+    assert scheduler.frames() == [[{"x": 5}]]
+
+
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_tick_scheduler_skips_idle_ticks(now):
+    now.return_value = 100.
+    scheduler = TickScheduler(10)
+
+    now.return_value = 100.35
+    assert not scheduler.ready()
+    assert abs(scheduler.next_tick - 100.4) < 1e-9
+
+    scheduler.on_frame("a", [{"x": 0}])
+    assert not scheduler.ready()
+
+    now.return_value = 100.4
+    assert scheduler.ready()
+
+
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_sequential_scheduler_reorders(now):
+    now.return_value = 100.
+    scheduler = SequentialScheduler(reorder_delay=.1, clock=lambda: 7.)
+
+    scheduler.on_frame("a", Frame(np.empty((0, 3)), timestamp=5.))
+    now.return_value = 100.05
+    scheduler.on_frame("b", Frame(np.empty((0, 3)), timestamp=4.))
+    scheduler.on_frame("c", Frame(np.empty((0, 3))))
+
+    assert not scheduler.ready()
+    assert abs(scheduler.timeout() - .1) < 1e-9
+
+    now.return_value = 100.15
+    assert scheduler.ready()
+    assert [batch[0].timestamp for batch in scheduler.batches()] == [4., 5., 7.]
+
+    # a frame older than one that was already released keeps its capture time
+    scheduler.on_frame("b", Frame(np.empty((0, 3)), timestamp=6.))
+    now.return_value = 100.3
+    assert [frame.timestamp for frame in scheduler.frames()] == [6.]
+    assert scheduler.late == 1
+    assert scheduler.released == 7.
+    assert scheduler.timeout() is None
+
+
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_sequential_scheduler_drops_removed_endpoints(now):
+    now.return_value = 100.
+    scheduler = SequentialScheduler(reorder_delay=0)
+
+    for endpoint, timestamp in [("a", 1.), ("b", 2.), ("c", 3.), ("a", 4.)]:
+        scheduler.on_frame(endpoint, Frame(np.empty((0, 3)), timestamp=timestamp))
+    scheduler.remove("a")
+    assert scheduler.pending() == 2
+    scheduler.retain(["c"])
+
+    assert [frame.timestamp for frame in scheduler.frames()] == [3.]
+
+
+def test_get_scheduler():
+    assert isinstance(get_scheduler(), SequentialScheduler)
+    assert isinstance(get_scheduler(30), TickScheduler)
+
+
+@mock.patch("circum.utils.scheduling.UpdateScheduler._now")
+def test_tick_scheduler_counts_replaced_frames(now):
+    now.return_value = 100.
+    scheduler = TickScheduler(10)
+    scheduler.frames()
+
+    for i in range(3):
+        scheduler.on_frame("a", [{"x": i}])
+    scheduler.on_frame("b", [{"x": 0}])
+
+    assert scheduler.pending() == 2
+    assert scheduler.replaced == 2
+    scheduler.frames()
+    assert scheduler.pending() == 0
@@ -0,0 +1,51 @@
+import json
+
+from circum.utils.encoding import Frame
+from circum.utils.metrics import Registry
+from circum.utils.tracing import Tracer
+
+import numpy as np
+
+import pytest
+
+
+def _frame(source, seq, timestamp, sent, received):
+    return Frame(np.empty((0, 3)), seq=seq, timestamp=timestamp, source=source, sent=sent, received=received)
+
+
+def test_tracer_aggregates_hops():
+    registry = Registry()
+    tracer = Tracer(registry)
+
+    tracer.record_updates([([_frame("a", 1, 10, 10.01, 10.03), _frame("b", 5, 10.02, 0, 10.04)], 10.05)], 10.06)
+
+    histograms = tracer.histograms
+    assert histograms["endpoint"].count == 1
+    assert histograms["network"].sum == pytest.approx(.02)
+    # the hops on either side of a missing stamp are skipped
+    assert histograms["tracker"].count == 2
+    assert histograms["queued"].count == 2
+    assert histograms["total"].sum == pytest.approx(.06 + .04)
+    assert 'circum_hop_seconds_count{hop="network"} 1' in registry.render()
+
+
+def test_tracer_exports_chrome_trace(tmp_path):
+    tracer = Tracer(Registry())
+    tracer.record(_frame("a", 1, 10, 10.01, 10.03), 10.05, 10.06)
+    tracer.keep(2)
+    for seq in range(3):
+        tracer.record(_frame("b", seq, 20, 20.01, 20.03), 20.05, 20.06)
+
+    path = tmp_path / "trace.json"
+    tracer.export(str(path))
+    with open(str(path)) as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = [event for event in events if event["ph"] in "be"]
+    # only the frames recorded after keep, up to its capacity, are exported
+    assert {event["id"] for event in spans} == {"b:1", "b:2"}
+    assert [event["name"] for event in spans if event["ph"] == "b"] == ["endpoint", "network", "tracker", "queued"] * 2
+    begin = next(event for event in spans if event["name"] == "network" and event["ph"] == "b")
+    end = next(event for event in spans if event["name"] == "network" and event["ph"] == "e")
+    assert end["ts"] - begin["ts"] == pytest.approx(.02e6)
+    assert {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "b"}} in events